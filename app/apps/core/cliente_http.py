@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Cliente HTTP compartilhado para as APIs externas (Gemini)
+
+Uma instância por processo (cliente_http) mantém as conexões abertas
+(keep-alive) em um pool por host, com até conexoes_por_host conexões guardadas
+para cada um: as chamadas seguintes reaproveitam a conexão TCP/TLS em vez de
+fazer um novo handshake. Com o pool todo em uso (streams SSE seguram a conexão
+até o fim da resposta), a chamada abre uma conexão avulsa em vez de esperar,
+fechada ao final; conexoes_por_host deve acompanhar as threads do processo.
+
+Respostas 429/5xx e falhas de conexão são repetidas com backoff exponencial e
+jitter (espera aleatória entre 0 e backoff * 2^tentativa, ou o Retry-After da
+resposta). Timeouts de leitura não são repetidos: a chamada já esperou o tempo
+máximo. Os timeouts de conexão e de leitura são separados.
+"""
+
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+# Respostas que indicam sobrecarga ou falha temporária do servidor
+STATUS_REPETIVEIS = {429, 500, 502, 503, 504}
+
+
+class ClienteHTTP:
+    """
+    Sessões HTTP com pool de conexões, repetição com backoff e contadores
+    """
+
+    def __init__(self, conexoes_por_host: int = 10, tentativas: int = 3, backoff: float = 0.5,
+                 backoff_maximo: float = 8.0, timeout_conexao: float = 5.0, timeout_leitura: float = 60.0):
+        self.tentativas = max(1, tentativas)
+        self.backoff = backoff
+        self.backoff_maximo = backoff_maximo
+        self.timeout_conexao = timeout_conexao
+        self.timeout_leitura = timeout_leitura
+        # Um adaptador para todas as threads: o pool é do processo. Sem pool_block, uma
+        # chamada com o pool esgotado não fica esperando (sem limite) uma conexão voltar
+        self._adaptador = HTTPAdapter(pool_maxsize=conexoes_por_host, pool_block=False, max_retries=0)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._requisicoes = 0
+        self._tentativas_feitas = 0
+        self._repeticoes = 0
+        self._falhas = 0
+        self._por_status: Dict[int, int] = {}
+        self._tempo_total = 0.0
+
+    def _sessao(self) -> requests.Session:
+        """Sessão da thread atual; todas usam o mesmo pool de conexões"""
+        sessao = getattr(self._local, 'sessao', None)
+        if sessao is None:
+            sessao = requests.Session()
+            sessao.mount('https://', self._adaptador)
+            sessao.mount('http://', self._adaptador)
+            self._local.sessao = sessao
+        return sessao
+
+    def _espera(self, tentativa: int, response: Optional[requests.Response] = None) -> float:
+        """Segundos até a próxima tentativa: Retry-After, se houver, ou backoff exponencial com jitter"""
+        retry_after = response.headers.get('Retry-After', '') if response is not None else ''
+        if retry_after.isdigit():
+            return min(float(retry_after), self.backoff_maximo)
+        return random.uniform(0, min(self.backoff_maximo, self.backoff * 2 ** tentativa))
+
+    def requisicao(self, metodo: str, url: str, timeout_leitura: Optional[float] = None, **kwargs) -> requests.Response:
+        """
+        Faz a requisição, repetindo em 429/5xx e falhas de conexão. Retorna a
+        última resposta (mesmo com erro) ou levanta a exceção do requests
+        """
+        timeout = (self.timeout_conexao, timeout_leitura or self.timeout_leitura)
+        inicio = time.monotonic()
+        with self._lock:
+            self._requisicoes += 1
+        try:
+            for tentativa in range(self.tentativas):
+                ultima = tentativa == self.tentativas - 1
+                with self._lock:
+                    self._tentativas_feitas += 1
+                try:
+                    response = self._sessao().request(metodo, url, timeout=timeout, **kwargs)
+                except requests.ConnectionError as e:
+                    if ultima:
+                        with self._lock:
+                            self._falhas += 1
+                        raise
+                    print(f"Erro de conexão com {url.split('?')[0]}, nova tentativa: {str(e)}")
+                    espera = self._espera(tentativa)
+                else:
+                    with self._lock:
+                        self._por_status[response.status_code] = self._por_status.get(response.status_code, 0) + 1
+                    if response.status_code not in STATUS_REPETIVEIS or ultima:
+                        return response
+                    espera = self._espera(tentativa, response)
+                    response.close()
+
+                with self._lock:
+                    self._repeticoes += 1
+                time.sleep(espera)
+        finally:
+            with self._lock:
+                self._tempo_total += time.monotonic() - inicio
+
+    def post(self, url: str, timeout_leitura: Optional[float] = None, **kwargs) -> requests.Response:
+        return self.requisicao('POST', url, timeout_leitura=timeout_leitura, **kwargs)
+
+    def get(self, url: str, timeout_leitura: Optional[float] = None, **kwargs) -> requests.Response:
+        return self.requisicao('GET', url, timeout_leitura=timeout_leitura, **kwargs)
+
+    def conexoes_criadas(self) -> int:
+        """Conexões TCP abertas desde o início do processo (as demais requisições reaproveitaram uma)"""
+        pools = self._adaptador.poolmanager.pools
+        return sum(pool.num_connections for pool in map(pools.get, pools.keys()) if pool is not None)
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'requisicoes': self._requisicoes,
+                'tentativas': self._tentativas_feitas,
+                'repeticoes': self._repeticoes,
+                'falhas_conexao': self._falhas,
+                'por_status': {str(status): total for status, total in sorted(self._por_status.items())},
+                'conexoes_criadas': self.conexoes_criadas(),
+                'tempo_medio': self._tempo_total / self._requisicoes if self._requisicoes else 0.0,
+            }
+
+
+cliente_http = ClienteHTTP(
+    conexoes_por_host=getattr(settings, 'HTTP_CONEXOES_POR_HOST', 10),
+    tentativas=getattr(settings, 'HTTP_TENTATIVAS', 3),
+    backoff=getattr(settings, 'HTTP_BACKOFF', 0.5),
+    backoff_maximo=getattr(settings, 'HTTP_BACKOFF_MAXIMO', 8.0),
+    timeout_conexao=getattr(settings, 'HTTP_TIMEOUT_CONEXAO', 5.0),
+    timeout_leitura=getattr(settings, 'HTTP_TIMEOUT_LEITURA', 60.0),
+)
@@ -9,6 +9,8 @@ import requests
 from pypdf import PdfReader
 from typing import Dict, Any, Optional
 
+from apps.core.cliente_http import cliente_http
+
 
 class GeminiAIService:
     """
@@ -202,7 +204,7 @@ class GeminiAIService:
             print(f"Fazendo requisição para: {url}")
             print(f"Dados: {data}")
             
-            response = requests.post(url, json=data, headers=headers, timeout=30)
+            response = cliente_http.post(url, json=data, headers=headers, timeout_leitura=30)
             
             print(f"Status da resposta: {response.status_code}")
             print(f"Resposta: {response.text}")
@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+Respostas diretas para perguntas de agregação, sem chamar o LLM
+
+Perguntas como "qual o total a pagar em março" ou "quantas parcelas vencidas
+temos" são interpretadas por uma gramática pequena:
+
+    métrica (quantos / total / média) + entidade (contas a pagar, contas a
+    receber, parcelas, clientes...) + status (pendente, paga, vencida,
+    cancelada) + período (mês, ano, este mês, mês passado, hoje)
+
+e respondidas com um único aggregate no banco: número exato, em milissegundos.
+Contas a pagar e a receber sem status na pergunta contam só as em aberto
+(pendentes ou vencidas), e a resposta diz isso.
+Cada palavra da pergunta precisa ser reconhecida pela gramática ou ser uma
+palavra de ligação; qualquer outra ("...do fornecedor Agro") faz a pergunta
+seguir o fluxo normal do RAG, para nunca responder ignorando um filtro.
+"""
+
+import calendar
+import re
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Avg, Count, Sum
+from django.utils import timezone
+
+from apps.clientes.models import Cliente
+from apps.fornecedores.models import Fornecedor
+from apps.contas_pagar.models import ContaPagar
+from apps.contas_receber.models import ContaReceber
+from apps.parcelas.models import Parcela
+from apps.tipos_despesa.models import TipoDespesa
+from apps.tipos_receita.models import TipoReceita
+from apps.faturados.models import Faturado
+
+from .palavras_chave import dobrar
+
+
+METRICA_CONTAGEM = 'contagem'
+METRICA_SOMA = 'soma'
+METRICA_MEDIA = 'media'
+
+MESES = ['janeiro', 'fevereiro', 'marco', 'abril', 'maio', 'junho', 'julho',
+         'agosto', 'setembro', 'outubro', 'novembro', 'dezembro']
+NOMES_MESES = ['janeiro', 'fevereiro', 'março', 'abril', 'maio', 'junho', 'julho',
+               'agosto', 'setembro', 'outubro', 'novembro', 'dezembro']
+
+STATUS_ROTULOS = {'PENDENTE': 'pendente', 'PAGA': 'paga', 'VENCIDA': 'vencida', 'CANCELADA': 'cancelada'}
+
+# Palavras que indicam a data usada pelo período ("parcelas que vencem em março")
+PALAVRAS_EMISSAO = {'emitida', 'emitidas', 'emissao', 'emitidos', 'lancada', 'lancadas'}
+PALAVRAS_VENCIMENTO = {'vence', 'vencem', 'vencendo', 'vencimento', 'vencimentos'}
+
+# Status considerados quando a pergunta não cita nenhum: "total a pagar" é o que ainda falta pagar
+STATUS_EM_ABERTO = ['PENDENTE', 'VENCIDA']
+
+# Entidades: (singular, plural), modelo, campo de valor e campo de data (None = só contagem)
+ENTIDADES = {
+    'contas_pagar': {
+        'nomes': ('conta a pagar', 'contas a pagar'), 'model': ContaPagar,
+        'valor': 'valor_total', 'data': 'data_emissao', 'rotulo_data': 'emissão', 'palavras_data': PALAVRAS_EMISSAO,
+        'status_padrao': STATUS_EM_ABERTO,
+    },
+    'contas_receber': {
+        'nomes': ('conta a receber', 'contas a receber'), 'model': ContaReceber,
+        'valor': 'valor_total', 'data': 'data_emissao', 'rotulo_data': 'emissão', 'palavras_data': PALAVRAS_EMISSAO,
+        'status_padrao': STATUS_EM_ABERTO,
+    },
+    'parcelas': {
+        'nomes': ('parcela', 'parcelas'), 'model': Parcela,
+        'valor': 'valor', 'data': 'data_vencimento', 'rotulo_data': 'vencimento', 'palavras_data': PALAVRAS_VENCIMENTO,
+    },
+    'clientes': {'nomes': ('cliente', 'clientes'), 'model': Cliente, 'valor': None, 'data': None},
+    'fornecedores': {'nomes': ('fornecedor', 'fornecedores'), 'model': Fornecedor, 'valor': None, 'data': None},
+    'faturados': {'nomes': ('faturado', 'faturados'), 'model': Faturado, 'valor': None, 'data': None},
+    'tipos_despesa': {'nomes': ('tipo de despesa', 'tipos de despesa'), 'model': TipoDespesa, 'valor': None, 'data': None},
+    'tipos_receita': {'nomes': ('tipo de receita', 'tipos de receita'), 'model': TipoReceita, 'valor': None, 'data': None},
+}
+
+# (padrão, entidade, lado das parcelas) - testados em ordem, cada trecho reconhecido é consumido
+PADROES_ENTIDADE = [
+    (r'\bparcelas?\s+(?:das\s+|de\s+)?(?:contas?\s+)?(?:a|para)\s+pagar\b', 'parcelas', 'pagar'),
+    (r'\bparcelas?\s+(?:das\s+|de\s+)?(?:contas?\s+)?(?:a|para)\s+receber\b', 'parcelas', 'receber'),
+    (r'\bparcelas?\b', 'parcelas', None),
+    (r'\b(?:contas?\s+|notas?\s+fiscais\s+|notas?\s+fiscal\s+)?(?:a|para)\s+pagar\b', 'contas_pagar', None),
+    (r'\bnotas?\s+fisca(?:l|is)\b', 'contas_pagar', None),
+    (r'\b(?:contas?\s+)?(?:a|para)\s+receber\b', 'contas_receber', None),
+    (r'\bclientes?\b', 'clientes', None),
+    (r'\bfornecedor(?:es)?\b', 'fornecedores', None),
+    (r'\bfaturados?\b', 'faturados', None),
+    (r'\btipos?\s+de\s+despesas?\b', 'tipos_despesa', None),
+    (r'\btipos?\s+de\s+receitas?\b', 'tipos_receita', None),
+]
+
+PADROES_STATUS = [
+    (r'\bpendentes?\b|\bem\s+aberto\b|\babertas?\b|\ba\s+vencer\b', 'PENDENTE'),
+    (r'\bpagas?\b|\bquitadas?\b|\brecebidas?\b|\bliquidadas?\b', 'PAGA'),
+    (r'\bvencidas?\b|\batrasadas?\b|\bem\s+atraso\b', 'VENCIDA'),
+    (r'\bcanceladas?\b', 'CANCELADA'),
+]
+
+PADROES_METRICA = [
+    (r'\bmedi[ao]s?\b', METRICA_MEDIA),
+    (r'\bquant[oa]s\b|\bquantidade\b|\bqtd\b|\bnumero\b', METRICA_CONTAGEM),
+    (r'\btotal\b|\bsoma\b|\bsomatorio\b|\bmontante\b|\bquanto\b|\bvalor(?:es)?\b', METRICA_SOMA),
+]
+
+# Palavras que podem sobrar na pergunta sem mudar o que ela pede
+PALAVRAS_LIGACAO = {
+    'qual', 'quais', 'o', 'a', 'os', 'as', 'um', 'uma', 'de', 'do', 'da', 'dos', 'das', 'em', 'no', 'na',
+    'nos', 'nas', 'ao', 'aos', 'para', 'por', 'pelo', 'pela', 'com', 'e', 'que', 'me', 'eu',
+    'temos', 'tem', 'tenho', 'ha', 'existe', 'existem', 'esta', 'estao', 'sao', 'foi', 'foram', 'ficou',
+    'meu', 'meus', 'minha', 'minhas', 'nosso', 'nossos', 'nossa', 'nossas', 'geral',
+    'status', 'situacao', 'sistema', 'cadastrado', 'cadastrados', 'cadastrada', 'cadastradas',
+    'registrado', 'registrados', 'registrada', 'registradas', 'ativo', 'ativos', 'ativa', 'ativas',
+    'ainda', 'todos', 'todas', 'atualmente', 'agora', 'diga', 'informe', 'mostre', 'quero', 'saber',
+    'favor', 'reais', 'r', 'contas', 'conta',
+}
+
+
+def formatar_reais(valor) -> str:
+    """R$ 1.234,56"""
+    texto = f"{Decimal(valor or 0):,.2f}"
+    return "R$ " + texto.replace(',', '_').replace('.', ',').replace('_', '.')
+
+
+class ConsultaAgregada:
+    """
+    Pergunta interpretada: métrica, entidade, status e período.
+    status_padrao: o status não veio da pergunta (ver STATUS_EM_ABERTO)
+    """
+
+    def __init__(self, metrica: str, entidade: str, lado: Optional[str] = None,
+                 status: Optional[List[str]] = None, periodo: Optional[Tuple[date, date, str]] = None,
+                 status_padrao: bool = False):
+        self.metrica = metrica
+        self.entidade = entidade
+        self.lado = lado
+        self.status = status or []
+        self.periodo = periodo
+        self.status_padrao = status_padrao
+
+    def __repr__(self) -> str:
+        return (f"ConsultaAgregada(metrica={self.metrica!r}, entidade={self.entidade!r}, lado={self.lado!r}, "
+                f"status={self.status}, periodo={self.periodo}, status_padrao={self.status_padrao})")
+
+
+class MotorAgregados:
+    """
+    Interpreta perguntas de agregação e as responde com um aggregate no banco
+    """
+
+    def __init__(self, ativo: bool = True):
+        self.ativo = ativo
+        self.respondidas = 0
+        self.nao_reconhecidas = 0
+
+    def _periodo(self, texto: str, hoje: date) -> Tuple[Optional[Tuple[date, date, str]], str, bool]:
+        """
+        (início, fim, descrição) do período citado, o texto sem o trecho e se a
+        pergunta é válida (dois períodos diferentes não são suportados)
+        """
+        def mes(ano: int, numero: int) -> Tuple[date, date, str]:
+            ultimo = calendar.monthrange(ano, numero)[1]
+            return date(ano, numero, 1), date(ano, numero, ultimo), f"{NOMES_MESES[numero - 1]}/{ano}"
+
+        def ano_inteiro(ano: int) -> Tuple[date, date, str]:
+            return date(ano, 1, 1), date(ano, 12, 31), str(ano)
+
+        primeiro_do_mes = hoje.replace(day=1)
+        fim_mes_passado = primeiro_do_mes - timedelta(days=1)
+        padroes = [
+            (r'\b(?:no\s+|do\s+)?mes\s+(?:passado|anterior)\b|\bultimo\s+mes\b',
+             lambda m: mes(fim_mes_passado.year, fim_mes_passado.month)),
+            (r'\b(?:neste|nesse|este|esse|deste|desse|no|do)\s+mes(?:\s+atual)?\b(?!\s+de\b)|\bmes\s+atual\b',
+             lambda m: mes(hoje.year, hoje.month)),
+            (r'\b(?:no\s+|do\s+)?ano\s+(?:passado|anterior)\b',
+             lambda m: ano_inteiro(hoje.year - 1)),
+            (r'\b(?:neste|nesse|este|esse|deste|desse|no|do)\s+ano(?:\s+atual)?\b|\bano\s+atual\b',
+             lambda m: ano_inteiro(hoje.year)),
+            (r'\bhoje\b',
+             lambda m: (hoje, hoje, f"{hoje:%d/%m/%Y}")),
+            (r'\b(?:(?:no|do)\s+mes\s+de\s+)?(' + '|'.join(MESES) + r')(?:\s+(?:de\s+)?(\d{4}))?\b',
+             lambda m: mes(int(m.group(2)) if m.group(2) else hoje.year, MESES.index(m.group(1)) + 1)),
+            (r'\b(0?[1-9]|1[0-2])/(\d{4})\b',
+             lambda m: mes(int(m.group(2)), int(m.group(1)))),
+            (r'\b(?:no\s+ano\s+de\s+|ano\s+)?(\d{4})\b',
+             lambda m: ano_inteiro(int(m.group(1)))),
+        ]
+        periodo = None
+        for padrao, calcular in padroes:
+            for m in list(re.finditer(padrao, texto)):
+                encontrado = calcular(m)
+                if periodo is not None and encontrado != periodo:
+                    return None, texto, False
+                periodo = encontrado
+            texto = re.sub(padrao, ' ', texto)
+        return periodo, texto, True
+
+    def interpretar(self, pergunta: str, hoje: Optional[date] = None) -> Optional[ConsultaAgregada]:
+        """Consulta agregada da pergunta, ou None se ela não for (só) uma agregação suportada"""
+        texto = ' ' + re.sub(r'[^\w/]+', ' ', dobrar(pergunta)) + ' '
+        hoje = hoje or timezone.localdate()
+
+        periodo, texto, valido = self._periodo(texto, hoje)
+        if not valido:
+            return None
+
+        entidade, lado = None, None
+        for padrao, nome, lado_parcelas in PADROES_ENTIDADE:
+            if re.search(padrao, texto):
+                if entidade is not None and nome != entidade:
+                    return None
+                entidade = nome
+                lado = lado or lado_parcelas
+                texto = re.sub(padrao, ' ', texto)
+        if entidade is None:
+            return None
+
+        status = []
+        for padrao, valor in PADROES_STATUS:
+            if re.search(padrao, texto):
+                status.append(valor)
+                texto = re.sub(padrao, ' ', texto)
+
+        metrica = None
+        for padrao, valor in PADROES_METRICA:
+            if re.search(padrao, texto):
+                metrica = metrica or valor
+                texto = re.sub(padrao, ' ', texto)
+        if metrica is None:
+            return None
+
+        # Algo que a gramática não conhece (nome, filtro, outra pergunta): fluxo normal do RAG
+        definicao = ENTIDADES[entidade]
+        permitidas = PALAVRAS_LIGACAO | definicao.get('palavras_data', set())
+        if any(palavra not in permitidas for palavra in texto.split()):
+            return None
+
+        if definicao['valor'] is None and (metrica != METRICA_CONTAGEM or status or periodo):
+            return None
+
+        status_padrao = not status and 'status_padrao' in definicao
+        if status_padrao:
+            status = list(definicao['status_padrao'])
+        return ConsultaAgregada(metrica, entidade, lado, status, periodo, status_padrao)
+
+    def _queryset(self, consulta: ConsultaAgregada):
+        definicao = ENTIDADES[consulta.entidade]
+        queryset = definicao['model'].objects.filter(ativo=True)
+        if consulta.lado == 'pagar':
+            queryset = queryset.filter(pk__in=ContaPagar.parcelas.through.objects.values('parcela_id'))
+        elif consulta.lado == 'receber':
+            queryset = queryset.filter(pk__in=ContaReceber.parcelas.through.objects.values('parcela_id'))
+        if consulta.status:
+            queryset = queryset.filter(status__in=consulta.status)
+        if consulta.periodo:
+            inicio, fim, _ = consulta.periodo
+            queryset = queryset.filter(**{f"{definicao['data']}__range": (inicio, fim)})
+        return queryset
+
+    def executar(self, consulta: ConsultaAgregada) -> Dict[str, Any]:
+        """Quantidade, soma e média em um único aggregate"""
+        definicao = ENTIDADES[consulta.entidade]
+        queryset = self._queryset(consulta)
+        if definicao['valor'] is None:
+            return {'quantidade': queryset.count()}
+        return queryset.aggregate(
+            quantidade=Count('pk'), soma=Sum(definicao['valor']), media=Avg(definicao['valor'])
+        )
+
+    def _descricao(self, consulta: ConsultaAgregada, plural: bool = True) -> str:
+        """'parcelas a pagar vencidas com vencimento em março/2026'"""
+        definicao = ENTIDADES[consulta.entidade]
+        descricao = definicao['nomes'][1 if plural else 0]
+        if consulta.lado:
+            descricao += f" a {consulta.lado}"
+        if consulta.status:
+            sufixo = 's' if plural else ''
+            descricao += " " + " ou ".join(STATUS_ROTULOS[status] + sufixo for status in consulta.status)
+        if consulta.periodo:
+            descricao += f" com {definicao['rotulo_data']} em {consulta.periodo[2]}"
+        return descricao
+
+    def redigir(self, consulta: ConsultaAgregada, valores: Dict[str, Any]) -> str:
+        """Resposta em texto a partir dos valores calculados"""
+        quantidade = valores['quantidade'] or 0
+        # Status assumido, não pedido: a resposta diz o que ficou de fora
+        nota = " Contas pagas e canceladas não entram." if consulta.status_padrao else ""
+        if not quantidade:
+            return f"Não há {self._descricao(consulta)} no sistema.{nota}"
+        if ENTIDADES[consulta.entidade]['valor'] is None:
+            return f"Há {quantidade} {self._descricao(consulta, plural=quantidade != 1)} no sistema."
+
+        soma = formatar_reais(valores['soma'])
+        contagem = f"{quantidade} {ENTIDADES[consulta.entidade]['nomes'][0 if quantidade == 1 else 1]}"
+        if consulta.metrica == METRICA_CONTAGEM:
+            return f"Há {quantidade} {self._descricao(consulta, plural=quantidade != 1)}, somando {soma}.{nota}"
+        if consulta.metrica == METRICA_MEDIA:
+            return (f"O valor médio de {self._descricao(consulta)} é {formatar_reais(valores['media'])} "
+                    f"({contagem}, total de {soma}).{nota}")
+        return f"O valor total de {self._descricao(consulta)} é {soma} ({contagem}).{nota}"
+
+    def responder(self, pergunta: str) -> Optional[Dict[str, Any]]:
+        """
+        Resultado no formato dos serviços RAG, ou None para seguir o fluxo normal
+        """
+        if not self.ativo:
+            return None
+        inicio = time.time()
+        try:
+            consulta = self.interpretar(pergunta)
+            if consulta is None:
+                self.nao_reconhecidas += 1
+                return None
+            valores = self.executar(consulta)
+            resposta = self.redigir(consulta, valores)
+        except Exception as e:
+            print(f"Erro na consulta agregada: {str(e)}")
+            return None
+
+        self.respondidas += 1
+        return {
+            'success': True,
+            'resposta': resposta,
+            'contexto': f"Consulta agregada calculada no banco de dados: {consulta!r} -> {valores}",
+            'tempo_resposta': time.time() - inicio,
+            'agregado': True,
+        }
+
+    def estatisticas(self) -> Dict[str, Any]:
+        return {
+            'ativo': self.ativo,
+            'respondidas': self.respondidas,
+            'nao_reconhecidas': self.nao_reconhecidas,
+        }
+
+
+motor_agregados = MotorAgregados(ativo=getattr(settings, 'RAG_AGREGADOS_ATIVO', True))
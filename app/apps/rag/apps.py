@@ -11,3 +11,17 @@ class RagConfig(AppConfig):
     name = 'apps.rag'
     verbose_name = 'RAG - Busca Inteligente'
 
+    def ready(self):
+        from django.conf import settings
+        from .signals import conectar_signals
+        conectar_signals()
+
+        if getattr(settings, 'RAG_EMBEDDINGS_AQUECER', False):
+            self._aquecer_backend()
+
+    def _aquecer_backend(self):
+        """Prepara o backend de embeddings em segundo plano ao iniciar o worker"""
+        import threading
+        from .backends_embeddings import get_backend
+
+        threading.Thread(target=lambda: get_backend().aquecer(), name='rag-aquecimento', daemon=True).start()
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+Arquivo de índice de embeddings mapeado em memória
+
+O rag_build_index grava os vetores normalizados em um arquivo versionado que
+cada worker abre com np.memmap: o cache de páginas do sistema operacional é
+compartilhado entre os processos e nenhum worker precisa reconstruir a matriz.
+
+Os vetores podem ser quantizados em float16 ou int8 (com uma escala float32
+por vetor). Com int8, 1 milhão de vetores de 384 dimensões ocupam ~390 MB
+em vez de ~1,5 GB em float32.
+
+Formato (versão 2):
+    MAGICO (8 bytes) | tamanho do cabeçalho (uint32) | cabeçalho JSON
+    | vetores (n x dim) | escalas (n float32, só int8) | chaves (n int64)
+    | chaves ordenadas (n int64) | ordem das chaves (n int32)
+    | [IVF: centroides (listas x dim float32) | inícios das listas (listas + 1 int64)]
+As seções começam em offsets alinhados a 64 bytes. `chaves` segue a ordem
+das linhas; `chaves ordenadas` e `ordem das chaves` (linha de cada chave
+ordenada) permitem localizar um registro com busca binária.
+Com IVF (ver ivf.py), as linhas ficam agrupadas por lista: a lista i ocupa
+as linhas inícios[i]:inícios[i + 1], lidas de forma contígua na consulta.
+"""
+
+import json
+import os
+import struct
+from datetime import datetime
+from typing import Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from .busca_vetorial import normalizar
+from .ivf import atribuir, listas_proximas, treinar_centroides
+
+
+MAGICO = b'RAGIDX\x00\x01'
+VERSAO_FORMATO = 2
+ALINHAMENTO = 64
+QUANTIZACOES = ('float32', 'float16', 'int8')
+SECOES = ('vetores', 'escalas', 'chaves', 'chaves_ordenadas', 'ordem_chaves', 'centroides', 'ivf_inicios')
+
+# Chave composta: código da tabela nos 16 bits altos, id do registro nos 48 bits baixos
+BITS_ID = 48
+
+
+def _alinhar(offset: int) -> int:
+    return (offset + ALINHAMENTO - 1) // ALINHAMENTO * ALINHAMENTO
+
+
+def quantizar(vetores: np.ndarray, quantizacao: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Converte vetores normalizados para o tipo de armazenamento.
+    Retorna os dados e, para int8, a escala de cada vetor.
+    """
+    if quantizacao == 'float32':
+        return vetores.astype(np.float32), None
+    if quantizacao == 'float16':
+        return vetores.astype(np.float16), None
+    if quantizacao == 'int8':
+        escalas = np.abs(vetores).max(axis=1) / 127.0
+        escalas[escalas == 0] = 1.0
+        dados = np.clip(np.rint(vetores / escalas[:, None]), -127, 127).astype(np.int8)
+        return dados, escalas.astype(np.float32)
+    raise ValueError(f"Quantização inválida: {quantizacao}")
+
+
+def escrever_arquivo(caminho: str, modelo: str, chaves: List[Tuple[str, int]], vetores: np.ndarray,
+                     quantizacao: str = 'float32', atualizado_ate: Optional[datetime] = None,
+                     n_listas: int = 0):
+    """
+    Grava o arquivo de índice de forma atômica (arquivo temporário + rename).
+    Com n_listas > 0, grava também as listas invertidas (IVF) dos vetores.
+    """
+    tabelas = sorted({tabela for tabela, _ in chaves})
+    codigos = {tabela: i for i, tabela in enumerate(tabelas)}
+    compostas = np.array(
+        [(codigos[tabela] << BITS_ID) | objeto_id for tabela, objeto_id in chaves], dtype=np.int64
+    )
+    escrever_arquivo_compostas(caminho, modelo, tabelas, compostas, vetores, quantizacao=quantizacao,
+                               atualizado_ate=atualizado_ate, n_listas=n_listas)
+
+
+def escrever_arquivo_compostas(caminho: str, modelo: str, tabelas: List[str], compostas: np.ndarray,
+                               vetores: np.ndarray, quantizacao: str = 'float32',
+                               atualizado_ate: Optional[datetime] = None, n_listas: int = 0):
+    """
+    Como escrever_arquivo, com as chaves já compostas (tabelas[i] tem o código i).
+    vetores pode ser um np.memmap: o IVF é treinado em uma amostra e os vetores são
+    lidos, normalizados, quantizados e gravados em blocos de ArquivoIndice.BLOCO linhas
+    """
+    n = len(compostas)
+    if not n:
+        vetores = np.zeros((0, 0), dtype=np.float32)
+    dim = vetores.shape[1]
+
+    # Linhas ordenadas por lista IVF (se houver) e, dentro da lista, por chave
+    centroides = ivf_inicios = None
+    n_listas = min(n_listas, n)
+    if n_listas > 0:
+        centroides = treinar_centroides(vetores, n_listas)
+        atribuicoes = atribuir(vetores, centroides)
+        ordem = np.lexsort((compostas, atribuicoes))
+        ivf_inicios = np.searchsorted(atribuicoes[ordem], np.arange(n_listas + 1)).astype(np.int64)
+    else:
+        ordem = np.argsort(compostas, kind='stable')
+    compostas = compostas[ordem]
+    ordem_chaves = np.argsort(compostas, kind='stable').astype(np.int32)
+    chaves_ordenadas = compostas[ordem_chaves]
+    escalas = np.empty(n, dtype=np.float32) if quantizacao == 'int8' else None
+
+    cabecalho = {
+        'versao_formato': VERSAO_FORMATO,
+        'modelo': modelo,
+        'n': int(n),
+        'dim': int(dim),
+        'quantizacao': quantizacao,
+        'tabelas': list(tabelas),
+        'atualizado_ate': atualizado_ate.isoformat() if atualizado_ate else None,
+        'ivf_listas': int(n_listas) if centroides is not None else 0,
+        'criado_em': datetime.now().isoformat(),
+    }
+    conteudos = {
+        'escalas': escalas,
+        'chaves': compostas,
+        'chaves_ordenadas': chaves_ordenadas,
+        'ordem_chaves': ordem_chaves,
+        'centroides': centroides,
+        'ivf_inicios': ivf_inicios,
+    }
+    tamanhos = {secao: conteudo.nbytes for secao, conteudo in conteudos.items() if conteudo is not None}
+    tamanhos['vetores'] = n * dim * np.dtype(quantizacao).itemsize
+    # Offsets dependem do tamanho do cabeçalho, que depende dos offsets: reservar espaço fixo
+    cabecalho['offsets'] = {secao: 0 for secao in SECOES}
+    tamanho_cabecalho = len(json.dumps(cabecalho).encode('utf-8')) + 64 * len(SECOES)
+    offset = _alinhar(len(MAGICO) + 4 + tamanho_cabecalho)
+    offsets = {}
+    for secao in SECOES:
+        if secao not in tamanhos:
+            continue
+        offsets[secao] = offset
+        offset = _alinhar(offset + tamanhos[secao])
+    cabecalho['offsets'] = offsets
+
+    corpo_cabecalho = json.dumps(cabecalho).encode('utf-8')
+    assert len(corpo_cabecalho) <= tamanho_cabecalho
+    corpo_cabecalho = corpo_cabecalho.ljust(tamanho_cabecalho)
+
+    os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+    temporario = f"{caminho}.tmp{os.getpid()}"
+    with open(temporario, 'wb') as arquivo:
+        arquivo.write(MAGICO)
+        arquivo.write(struct.pack('<I', len(corpo_cabecalho)))
+        arquivo.write(corpo_cabecalho)
+
+        # Normalização e quantização em blocos, sem cópias completas da matriz
+        arquivo.seek(offsets['vetores'])
+        for inicio in range(0, n, ArquivoIndice.BLOCO):
+            fim = min(inicio + ArquivoIndice.BLOCO, n)
+            dados, escalas_bloco = quantizar(normalizar(vetores[ordem[inicio:fim]]), quantizacao)
+            arquivo.write(np.ascontiguousarray(dados).tobytes())
+            if escalas is not None:
+                escalas[inicio:fim] = escalas_bloco
+
+        for secao, offset in offsets.items():
+            if secao == 'vetores':
+                continue
+            arquivo.seek(offset)
+            arquivo.write(np.ascontiguousarray(conteudos[secao]).tobytes())
+        arquivo.flush()
+        os.fsync(arquivo.fileno())
+    os.replace(temporario, caminho)
+
+
+class ArquivoIndice:
+    """
+    Leitura de um arquivo de índice via np.memmap (somente leitura)
+    """
+
+    BLOCO = 65536
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        with open(caminho, 'rb') as arquivo:
+            if arquivo.read(len(MAGICO)) != MAGICO:
+                raise ValueError(f"{caminho} não é um arquivo de índice RAG")
+            (tamanho,) = struct.unpack('<I', arquivo.read(4))
+            cabecalho = json.loads(arquivo.read(tamanho).decode('utf-8'))
+        if cabecalho['versao_formato'] != VERSAO_FORMATO:
+            raise ValueError(f"Versão de formato não suportada: {cabecalho['versao_formato']}")
+
+        self.cabecalho = cabecalho
+        self.modelo = cabecalho['modelo']
+        self.n = cabecalho['n']
+        self.dim = cabecalho['dim']
+        self.quantizacao = cabecalho['quantizacao']
+        self.tabelas = cabecalho['tabelas']
+        self.codigos = {tabela: i for i, tabela in enumerate(self.tabelas)}
+        self.atualizado_ate = (
+            datetime.fromisoformat(cabecalho['atualizado_ate']) if cabecalho['atualizado_ate'] else None
+        )
+
+        offsets = cabecalho['offsets']
+        self.vetores = self.escalas = None
+        self.chaves = np.zeros(0, dtype=np.int64)
+        if self.n:
+            self.vetores = np.memmap(caminho, dtype=self.quantizacao, mode='r',
+                                     offset=offsets['vetores'], shape=(self.n, self.dim))
+            if self.quantizacao == 'int8':
+                self.escalas = np.memmap(caminho, dtype=np.float32, mode='r',
+                                         offset=offsets['escalas'], shape=(self.n,))
+            self.chaves = np.memmap(caminho, dtype=np.int64, mode='r',
+                                    offset=offsets['chaves'], shape=(self.n,))
+            self.chaves_ordenadas = np.memmap(caminho, dtype=np.int64, mode='r',
+                                              offset=offsets['chaves_ordenadas'], shape=(self.n,))
+            self.ordem_chaves = np.memmap(caminho, dtype=np.int32, mode='r',
+                                          offset=offsets['ordem_chaves'], shape=(self.n,))
+
+        # Listas invertidas (opcionais); centroides e inícios são pequenos e ficam em memória
+        self.ivf_listas = cabecalho['ivf_listas'] if self.n else 0
+        self.centroides = self.ivf_inicios = None
+        if self.ivf_listas:
+            self.centroides = np.fromfile(caminho, dtype=np.float32, offset=offsets['centroides'],
+                                          count=self.ivf_listas * self.dim).reshape(self.ivf_listas, self.dim)
+            self.ivf_inicios = np.fromfile(caminho, dtype=np.int64, offset=offsets['ivf_inicios'],
+                                           count=self.ivf_listas + 1)
+
+    def composta(self, chave: Hashable) -> Optional[int]:
+        tabela, objeto_id = chave
+        codigo = self.codigos.get(tabela)
+        if codigo is None:
+            return None
+        return (codigo << BITS_ID) | int(objeto_id)
+
+    def posicao(self, chave: Hashable) -> Optional[int]:
+        """Posição do registro no arquivo (busca binária nas chaves ordenadas)"""
+        composta = self.composta(chave)
+        if composta is None or not self.n:
+            return None
+        indice = int(np.searchsorted(self.chaves_ordenadas, composta))
+        if indice < self.n and self.chaves_ordenadas[indice] == composta:
+            return int(self.ordem_chaves[indice])
+        return None
+
+    def chave(self, posicao: int) -> Tuple[str, int]:
+        composta = int(self.chaves[posicao])
+        return self.tabelas[composta >> BITS_ID], composta & ((1 << BITS_ID) - 1)
+
+    def pontuar(self, consulta: np.ndarray, inicio: int = 0, fim: Optional[int] = None) -> np.ndarray:
+        """
+        Similaridade de cosseno da consulta (já normalizada) com as linhas inicio:fim
+        (padrão: todas), calculada em blocos
+        """
+        fim = self.n if fim is None else fim
+        pontuacoes = np.empty(fim - inicio, dtype=np.float32)
+        for bloco_inicio in range(inicio, fim, self.BLOCO):
+            bloco_fim = min(bloco_inicio + self.BLOCO, fim)
+            bloco = self.vetores[bloco_inicio:bloco_fim]
+            if self.quantizacao != 'float32':
+                bloco = bloco.astype(np.float32)
+            trecho = pontuacoes[bloco_inicio - inicio:bloco_fim - inicio]
+            trecho[:] = bloco @ consulta
+            if self.escalas is not None:
+                trecho *= self.escalas[bloco_inicio:bloco_fim]
+        return pontuacoes
+
+    def pontuar_listas(self, consulta: np.ndarray, nprobe: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Pontua apenas as nprobe listas IVF mais próximas da consulta.
+        Retorna as posições pontuadas e as similaridades.
+        """
+        posicoes = []
+        pontuacoes = []
+        for lista in listas_proximas(self.centroides, consulta, nprobe):
+            inicio, fim = int(self.ivf_inicios[lista]), int(self.ivf_inicios[lista + 1])
+            if inicio == fim:
+                continue
+            posicoes.append(np.arange(inicio, fim))
+            pontuacoes.append(self.pontuar(consulta, inicio, fim))
+        if not posicoes:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return np.concatenate(posicoes), np.concatenate(pontuacoes)
+
+
+def medir_recall(vetores: np.ndarray, quantizacao: str, k: int = 10, amostras: int = 200,
+                 semente: int = 0) -> float:
+    """
+    Recall@k da busca sobre vetores quantizados em relação à busca exata em float32.
+    As consultas são documentos do próprio índice, sorteados.
+    """
+    vetores = normalizar(vetores)
+    n = len(vetores)
+    if n == 0:
+        return 1.0
+    k = min(k, n)
+    dados, escalas = quantizar(vetores, quantizacao)
+    reconstruidos = dados.astype(np.float32)
+    if escalas is not None:
+        reconstruidos *= escalas[:, None]
+
+    gerador = np.random.default_rng(semente)
+    consultas = vetores[gerador.choice(n, size=min(amostras, n), replace=False)]
+    acertos = 0
+    for consulta in consultas:
+        exatos = np.argpartition(-(vetores @ consulta), k - 1)[:k]
+        aproximados = np.argpartition(-(reconstruidos @ consulta), k - 1)[:k]
+        acertos += len(np.intersect1d(exatos, aproximados))
+    return acertos / (len(consultas) * k)
+
+
+def tamanho_estimado_mb(n: int, dim: int, quantizacao: str) -> float:
+    """Tamanho do arquivo de índice para n vetores de dimensão dim"""
+    bytes_por_valor = {'float32': 4, 'float16': 2, 'int8': 1}[quantizacao]
+    escalas = 4 if quantizacao == 'int8' else 0
+    return n * (dim * bytes_por_valor + escalas + 8) / (1024 * 1024)
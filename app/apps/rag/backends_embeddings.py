@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+Backends de embeddings do RAG
+
+O backend é escolhido em settings.RAG_EMBEDDINGS_BACKEND:
+- 'sentence_transformers': modelo carregado no próprio processo (padrão)
+- 'servidor': servidor compartilhado (manage.py rag_embedding_server)
+- 'hashing': n-gramas de caracteres com hashing, TF-IDF e projeção aleatória,
+  em NumPy puro - não precisa de download, inicia em milissegundos
+- caminho pontuado para uma subclasse de BackendEmbeddings
+"""
+
+import hashlib
+import math
+import os
+import re
+import threading
+import unicodedata
+import zlib
+from typing import List, Optional
+
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .modelo_embeddings import get_modelo
+
+
+MODELO_PADRAO = 'paraphrase-multilingual-MiniLM-L12-v2'
+
+
+class BackendEmbeddings:
+    """
+    Interface dos backends de embeddings
+    """
+
+    # Identifica os vetores gerados pelo backend no índice (EmbeddingRAG.modelo)
+    nome = ''
+
+    def disponivel(self) -> bool:
+        """Indica se o backend consegue gerar embeddings neste ambiente"""
+        return True
+
+    def codificar(self, textos: List[str], batch_size: int = 64) -> np.ndarray:
+        """Retorna uma matriz float32 (n, dim) com um vetor por texto"""
+        raise NotImplementedError
+
+    def aquecer(self):
+        """Prepara o backend antes da primeira consulta"""
+        self.codificar(['aquecimento'])
+
+
+class SentenceTransformersBackend(BackendEmbeddings):
+    """
+    SentenceTransformer carregado uma vez por processo
+    """
+
+    def __init__(self, modelo: str = MODELO_PADRAO):
+        self.nome = modelo
+        self.holder = get_modelo(modelo)
+
+    def disponivel(self) -> bool:
+        return self.holder.obter() != 'simple'
+
+    def codificar(self, textos: List[str], batch_size: int = 64) -> np.ndarray:
+        return self.holder.obter().encode(textos, batch_size=batch_size, convert_to_numpy=True)
+
+    def aquecer(self):
+        self.holder.aquecer()
+
+
+class ServidorEmbeddingsBackend(BackendEmbeddings):
+    """
+    Servidor de embeddings compartilhado, acessado por socket Unix
+    """
+
+    def __init__(self, caminho_socket: str, modelo: str = MODELO_PADRAO):
+        from .servidor_embeddings import get_cliente
+        # Mesmo modelo do servidor: os vetores são compatíveis com o backend local
+        self.nome = modelo
+        self.cliente = get_cliente(caminho_socket)
+
+    def codificar(self, textos: List[str], batch_size: int = 64) -> np.ndarray:
+        return self.cliente.encode(textos, batch_size=batch_size)
+
+    def aquecer(self):
+        pass
+
+
+STOPWORDS_PT = frozenset("""
+a ao aos as ate com como da das de dela dele deles do dos e ela ele eles em entre
+era essa esse esta este eu foi ha isso isto ja mais mas me mesmo meu minha na nas
+nem no nos nossa nosso num numa o os ou para pela pelas pelo pelos por qual quais
+quando que quem se sem ser seu seus sua suas tambem te tem temos ter um uma umas
+uns voce voces vos
+""".split())
+
+
+def normalizar_texto(texto: str) -> str:
+    """Minúsculas, sem acentos e sem pontuação"""
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r'[^a-z0-9]+', ' ', texto).strip()
+
+
+class HashingNgramBackend(BackendEmbeddings):
+    """
+    Embeddings sem modelo: n-gramas de caracteres (3 a 5) de cada palavra,
+    ponderados por TF sublinear x IDF e projetados em `dimensao` posições
+    por hashing com sinal (projeção aleatória esparsa).
+
+    Os n-gramas aproximam flexões do português ("parcela"/"parcelas",
+    "vencida"/"vencidas"); acentos e stopwords são removidos antes.
+    O IDF é opcional: é calculado pelo rag_build_index e salvo em `caminho_idf`.
+    """
+
+    SEMENTE_POSICAO_1 = 0x9E3779B9
+    SEMENTE_POSICAO_2 = 0x85EBCA6B
+
+    def __init__(self, dimensao: int = 256, buckets_idf: int = 1 << 18,
+                 ngramas=(3, 5), caminho_idf: Optional[str] = None):
+        self.dimensao = dimensao
+        self.buckets_idf = buckets_idf
+        self.ngramas = ngramas
+        self.caminho_idf = caminho_idf
+        self.idf = None
+        if caminho_idf and os.path.exists(caminho_idf):
+            self.idf = np.load(caminho_idf).astype(np.float32)
+        self.nome = self._gerar_nome()
+
+    def _gerar_nome(self) -> str:
+        versao = 'sem-idf'
+        if self.idf is not None:
+            versao = hashlib.sha256(self.idf.tobytes()).hexdigest()[:8]
+        return f'hashing-ngram-{self.ngramas[0]}-{self.ngramas[1]}-{self.dimensao}-{versao}'
+
+    def _caracteristicas(self, texto: str) -> List[bytes]:
+        caracteristicas = []
+        minimo, maximo = self.ngramas
+        for palavra in normalizar_texto(texto).split():
+            if palavra in STOPWORDS_PT:
+                continue
+            caracteristicas.append(palavra.encode())
+            marcada = f' {palavra} '
+            for n in range(minimo, maximo + 1):
+                for inicio in range(len(marcada) - n + 1):
+                    caracteristicas.append(marcada[inicio:inicio + n].encode())
+        return caracteristicas
+
+    def codificar(self, textos: List[str], batch_size: int = 64) -> np.ndarray:
+        vetores = np.zeros((len(textos), self.dimensao), dtype=np.float32)
+        for linha, texto in enumerate(textos):
+            contagem = {}
+            for caracteristica in self._caracteristicas(texto):
+                contagem[caracteristica] = contagem.get(caracteristica, 0) + 1
+            if not contagem:
+                continue
+
+            posicoes = []
+            pesos = []
+            for caracteristica, tf in contagem.items():
+                peso = 1.0 + math.log(tf)
+                if self.idf is not None:
+                    peso *= self.idf[zlib.crc32(caracteristica) % self.buckets_idf]
+                for semente in (self.SEMENTE_POSICAO_1, self.SEMENTE_POSICAO_2):
+                    h = zlib.crc32(caracteristica, semente)
+                    posicoes.append(h % self.dimensao)
+                    pesos.append(peso if h & 0x80000000 else -peso)
+            np.add.at(vetores[linha], posicoes, pesos)
+
+        normas = np.linalg.norm(vetores, axis=1, keepdims=True)
+        normas[normas == 0] = 1.0
+        return vetores / normas
+
+    def ajustar_idf(self, textos) -> int:
+        """
+        Calcula o IDF (por bucket de hash) a partir dos documentos e salva em caminho_idf.
+        Retorna a quantidade de documentos usados.
+        """
+        df = np.zeros(self.buckets_idf, dtype=np.int64)
+        total = 0
+        for texto in textos:
+            buckets = {zlib.crc32(c) % self.buckets_idf for c in self._caracteristicas(texto)}
+            if buckets:
+                df[list(buckets)] += 1
+            total += 1
+        self.idf = np.log((1 + total) / (1 + df)).astype(np.float32) + 1.0
+        if self.caminho_idf:
+            os.makedirs(os.path.dirname(self.caminho_idf) or '.', exist_ok=True)
+            np.save(self.caminho_idf, self.idf)
+        self.nome = self._gerar_nome()
+        return total
+
+    def aquecer(self):
+        pass
+
+
+_backend = None
+_lock_backend = threading.Lock()
+
+
+def criar_backend() -> BackendEmbeddings:
+    """Cria o backend configurado em settings"""
+    caminho_socket = getattr(settings, 'RAG_EMBEDDINGS_SOCKET', '')
+    escolha = getattr(settings, 'RAG_EMBEDDINGS_BACKEND', '') or ('servidor' if caminho_socket else 'sentence_transformers')
+
+    if escolha == 'sentence_transformers':
+        return SentenceTransformersBackend()
+    if escolha == 'servidor':
+        return ServidorEmbeddingsBackend(caminho_socket or '/tmp/rag_embeddings.sock')
+    if escolha == 'hashing':
+        return HashingNgramBackend(
+            dimensao=getattr(settings, 'RAG_EMBEDDINGS_HASHING_DIMENSAO', 256),
+            caminho_idf=getattr(settings, 'RAG_EMBEDDINGS_HASHING_IDF', None),
+        )
+    return import_string(escolha)()
+
+
+def get_backend() -> BackendEmbeddings:
+    """Retorna o backend de embeddings do processo"""
+    global _backend
+    with _lock_backend:
+        if _backend is None:
+            _backend = criar_backend()
+        return _backend
+
+
+def iniciar_processo_codificacao():
+    """
+    Inicializa um processo do pool de codificação do rag_build_index.
+    Fica neste módulo porque ele pode ser importado antes do django.setup().
+    """
+    import django
+    django.setup()
+    get_backend().aquecer()
+
+
+def codificar_em_processo(modelo: str, textos: List[str], tamanho_lote: int) -> np.ndarray:
+    """Codifica um lote em um processo do pool (o backend precisa ser o mesmo do índice)"""
+    backend = get_backend()
+    if backend.nome != modelo:
+        raise RuntimeError(f"Backend do processo ({backend.nome}) difere do índice em construção ({modelo})")
+    return np.asarray(backend.codificar(textos, batch_size=tamanho_lote), dtype=np.float32)
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Motor de busca vetorial - similaridade de cosseno em lote
+
+Todos os vetores ficam normalizados (norma L2 = 1) em uma única matriz
+float32 contígua. A similaridade de todos os registros é calculada com um
+único produto matriz-vetor e o top-k é selecionado com argpartition.
+
+Opcionalmente o motor usa como base um arquivo de índice mapeado em memória
+(ver arquivo_indice.py); a matriz em memória guarda então apenas os registros
+alterados depois da geração do arquivo.
+
+A partir de `ivf_minimo` vetores a busca deixa de ser exaustiva: apenas as
+listas invertidas (ver ivf.py) mais próximas da pergunta são pontuadas.
+"""
+
+import threading
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .ivf import ListasInvertidas, n_listas_sugerido, treinar_centroides
+
+
+def normalizar(vetores: np.ndarray) -> np.ndarray:
+    """Normaliza as linhas para norma L2 = 1 (linhas nulas continuam nulas)"""
+    vetores = np.asarray(vetores, dtype=np.float32)
+    normas = np.linalg.norm(vetores, axis=-1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return vetores / normas
+
+
+class MotorBuscaVetorial:
+    """
+    Matriz de embeddings normalizados com busca top-k por similaridade de cosseno
+    """
+
+    CAPACIDADE_INICIAL = 1024
+
+    def __init__(self, dimensao: Optional[int] = None, nprobe: int = 8, ivf_minimo: Optional[int] = 50000,
+                 ivf_listas: Optional[int] = None):
+        """
+        nprobe: quantidade de listas invertidas pontuadas por consulta
+        ivf_minimo: tamanho a partir do qual a matriz em memória ganha listas invertidas
+                    (None desativa; o arquivo base usa as listas gravadas nele)
+        ivf_listas: quantidade de listas (padrão: ~sqrt(n))
+        """
+        self.dimensao = dimensao
+        self.nprobe = nprobe
+        self.ivf_minimo = ivf_minimo
+        self.ivf_listas = ivf_listas
+        self._ivf: Optional[ListasInvertidas] = None
+        self._ivf_treinado_com = 0
+        self._matriz = None
+        self._tamanho = 0
+        self._chaves: List[Hashable] = []
+        self._posicoes: Dict[Hashable, int] = {}
+        self._base = None
+        self._base_removidos = None
+        self._base_vivos = 0
+        self._versao = 0  # muda a cada inserção ou remoção
+        self._lock = threading.RLock()
+        self._lock_treino = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._tamanho + self._base_vivos
+
+    @property
+    def listas_ivf(self) -> int:
+        """Quantidade de listas invertidas da matriz em memória (0 = busca exata)"""
+        return self._ivf.n_listas if self._ivf is not None else 0
+
+    def __contains__(self, chave) -> bool:
+        if chave in self._posicoes:
+            return True
+        if self._base is not None:
+            posicao = self._base.posicao(chave)
+            return posicao is not None and not self._base_removidos[posicao]
+        return False
+
+    def definir_base(self, arquivo):
+        """Usa um ArquivoIndice (somente leitura) como base do motor"""
+        with self._lock:
+            self._base = arquivo
+            self._base_removidos = np.zeros(arquivo.n, dtype=bool)
+            self._base_vivos = arquivo.n
+            if self.dimensao is None:
+                self.dimensao = arquivo.dim
+
+    def _remover_da_base(self, chave):
+        if self._base is None:
+            return
+        posicao = self._base.posicao(chave)
+        if posicao is not None and not self._base_removidos[posicao]:
+            self._base_removidos[posicao] = True
+            self._base_vivos -= 1
+
+    def _garantir_capacidade(self, necessario: int):
+        capacidade = 0 if self._matriz is None else self._matriz.shape[0]
+        if necessario <= capacidade:
+            return
+        nova_capacidade = max(self.CAPACIDADE_INICIAL, capacidade)
+        while nova_capacidade < necessario:
+            nova_capacidade *= 2
+        nova = np.zeros((nova_capacidade, self.dimensao), dtype=np.float32)
+        if self._tamanho:
+            nova[:self._tamanho] = self._matriz[:self._tamanho]
+        self._matriz = nova
+
+    def _treinar_ivf(self):
+        """(Re)cria as listas invertidas da matriz em memória quando ela atinge ivf_minimo"""
+        if self.ivf_minimo is None or self._tamanho < self.ivf_minimo:
+            self._ivf = None
+            return
+        vetores = self._matriz[:self._tamanho]
+        centroides = treinar_centroides(vetores, self.ivf_listas or n_listas_sugerido(self._tamanho))
+        self._ivf = ListasInvertidas(centroides, nprobe=self.nprobe)
+        self._ivf.construir(vetores)
+        self._ivf_treinado_com = self._tamanho
+
+    def _retreinar_ivf(self):
+        """
+        Retreina as listas invertidas sem segurar o lock das buscas: o k-means e a
+        distribuição rodam sobre a matriz atual e as listas novas substituem as antigas
+        de uma vez. Se o motor mudou nesse meio tempo, a distribuição é refeita com o lock
+        """
+        if not self._lock_treino.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                vetores = self._matriz[:self._tamanho]
+                versao = self._versao
+            centroides = treinar_centroides(vetores, self.ivf_listas or n_listas_sugerido(len(vetores)))
+            ivf = ListasInvertidas(centroides, nprobe=self.nprobe)
+            ivf.construir(vetores)
+            with self._lock:
+                if self._versao != versao:
+                    ivf.construir(self._matriz[:self._tamanho])
+                self._ivf = ivf
+                self._ivf_treinado_com = self._tamanho
+        finally:
+            self._lock_treino.release()
+
+    def carregar(self, chaves: List[Hashable], vetores: np.ndarray):
+        """Substitui todo o conteúdo do motor"""
+        with self._lock:
+            self._matriz = None
+            self._tamanho = 0
+            self._chaves = []
+            self._posicoes = {}
+            self._base = None
+            self._base_removidos = None
+            self._base_vivos = 0
+            if len(chaves):
+                self._matriz = np.ascontiguousarray(normalizar(vetores))
+                self.dimensao = self._matriz.shape[1]
+                self._tamanho = len(chaves)
+                self._chaves = list(chaves)
+                self._posicoes = {chave: posicao for posicao, chave in enumerate(self._chaves)}
+            self._treinar_ivf()
+
+    def atualizar(self, chaves: List[Hashable], vetores: np.ndarray):
+        """Insere ou substitui os vetores das chaves informadas"""
+        if not len(chaves):
+            return
+        vetores = normalizar(vetores)
+        retreinar = False
+        with self._lock:
+            self._versao += 1
+            if self.dimensao is None:
+                self.dimensao = vetores.shape[1]
+            self._garantir_capacidade(self._tamanho + len(chaves))
+            posicoes = []
+            for chave, vetor in zip(chaves, vetores):
+                # A versão em memória substitui a do arquivo base
+                self._remover_da_base(chave)
+                posicao = self._posicoes.get(chave)
+                if posicao is None:
+                    posicao = self._tamanho
+                    self._tamanho += 1
+                    self._chaves.append(chave)
+                    self._posicoes[chave] = posicao
+                self._matriz[posicao] = vetor
+                posicoes.append(posicao)
+
+            # Centroides treinados com menos da metade dos vetores atuais ficam desatualizados
+            if self._ivf is None or self._tamanho >= 2 * self._ivf_treinado_com:
+                retreinar = self.ivf_minimo is not None and self._tamanho >= self.ivf_minimo
+            if self._ivf is not None:
+                self._ivf.adicionar(posicoes, self._matriz[posicoes])
+        if retreinar:
+            self._retreinar_ivf()
+
+    def remover(self, chaves: Iterable[Hashable]):
+        """Remove as chaves informadas (a última linha ocupa o lugar da removida)"""
+        with self._lock:
+            self._versao += 1
+            for chave in chaves:
+                self._remover_da_base(chave)
+                posicao = self._posicoes.pop(chave, None)
+                if posicao is None:
+                    continue
+                ultima = self._tamanho - 1
+                if self._ivf is not None:
+                    self._ivf.remover(posicao)
+                if posicao != ultima:
+                    chave_ultima = self._chaves[ultima]
+                    self._matriz[posicao] = self._matriz[ultima]
+                    self._chaves[posicao] = chave_ultima
+                    self._posicoes[chave_ultima] = posicao
+                    if self._ivf is not None:
+                        self._ivf.mover(ultima, posicao)
+                self._chaves.pop()
+                self._tamanho -= 1
+
+    def remover_ausentes(self, chaves_validas: Set[Hashable]):
+        """Remove todas as chaves que não estão em chaves_validas"""
+        with self._lock:
+            self.remover([chave for chave in self._chaves[:self._tamanho] if chave not in chaves_validas])
+            if self._base is not None and self._base.n:
+                compostas = [self._base.composta(chave) for chave in chaves_validas]
+                validas = np.array([c for c in compostas if c is not None], dtype=np.int64)
+                ausentes = ~np.isin(self._base.chaves, validas) & ~self._base_removidos
+                self._base_removidos |= ausentes
+                self._base_vivos -= int(ausentes.sum())
+
+    @staticmethod
+    def _melhores(pontuacoes: np.ndarray, k: int) -> np.ndarray:
+        """Posições das k maiores pontuações, em ordem decrescente"""
+        n = len(pontuacoes)
+        k = min(k, n)
+        if k < n:
+            candidatos = np.argpartition(-pontuacoes, k - 1)[:k]
+        else:
+            candidatos = np.arange(n)
+        return candidatos[np.argsort(-pontuacoes[candidatos])]
+
+    def buscar(self, vetor: np.ndarray, k: int = 10, limiar: Optional[float] = None,
+               nprobe: Optional[int] = None, exata: bool = False) -> List[Tuple[float, Hashable]]:
+        """
+        Retorna até k pares (similaridade, chave) ordenados por similaridade decrescente.
+        nprobe substitui o padrão do motor; exata=True ignora as listas invertidas.
+        """
+        nprobe = nprobe or self.nprobe
+        with self._lock:
+            if len(self) == 0 or k <= 0:
+                return []
+            consulta = normalizar(np.asarray(vetor, dtype=np.float32).reshape(-1))
+            resultados = []
+
+            if self._tamanho:
+                if self._ivf is not None and not exata:
+                    posicoes = self._ivf.candidatos(consulta, nprobe)
+                    pontuacoes = self._matriz[posicoes] @ consulta
+                else:
+                    posicoes = None
+                    pontuacoes = self._matriz[:self._tamanho] @ consulta
+                for indice in self._melhores(pontuacoes, k):
+                    posicao = indice if posicoes is None else posicoes[indice]
+                    resultados.append((float(pontuacoes[indice]), self._chaves[posicao]))
+
+            if self._base_vivos:
+                if self._base.ivf_listas and not exata:
+                    posicoes, pontuacoes = self._base.pontuar_listas(consulta, nprobe)
+                    vivas = ~self._base_removidos[posicoes]
+                    posicoes, pontuacoes = posicoes[vivas], pontuacoes[vivas]
+                else:
+                    posicoes = np.flatnonzero(~self._base_removidos) if self._base_vivos < self._base.n else None
+                    pontuacoes = self._base.pontuar(consulta)
+                    if posicoes is not None:
+                        pontuacoes = pontuacoes[posicoes]
+                for indice in self._melhores(pontuacoes, k):
+                    posicao = indice if posicoes is None else posicoes[indice]
+                    resultados.append((float(pontuacoes[indice]), self._base.chave(posicao)))
+
+        resultados.sort(key=lambda item: item[0], reverse=True)
+        if limiar is not None:
+            resultados = [item for item in resultados if item[0] > limiar]
+        return resultados[:k]
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Caches do RAG
+
+- CacheLRU: dicionário limitado, com expiração (TTL) e contadores de acertos/falhas
+- cache_embeddings_perguntas: embeddings das perguntas, por texto normalizado.
+  Perguntas repetidas ("quantas parcelas vencidas", "total a pagar") não
+  passam de novo pelo modelo de embeddings.
+- cache_respostas: respostas completas (busca + LLM) no cache do Django, por
+  (pergunta normalizada, tipo de RAG, versões dos dados - ver versoes.py)
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .versoes import hash_versoes
+
+
+def normalizar_pergunta(texto: str) -> str:
+    """
+    Chave de cache de uma pergunta: minúsculas, sem acentos, espaços colapsados
+    e sem pontuação nas extremidades ("Quantas parcelas vencidas?" == "quantas  parcelas vencidas")
+    """
+    texto = unicodedata.normalize('NFKD', (texto or '').lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r'\s+', ' ', texto).strip()
+    return texto.strip('?!.,;: ')
+
+
+class CacheLRU:
+    """
+    Cache LRU thread-safe com expiração por tempo
+    """
+
+    def __init__(self, capacidade: int = 1024, ttl: Optional[float] = None):
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self._itens: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.remocoes = 0
+        self.expirados = 0
+
+    def __len__(self) -> int:
+        return len(self._itens)
+
+    def obter(self, chave: Hashable) -> Optional[Any]:
+        """Valor da chave, ou None se ausente/expirado"""
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None:
+                valor, expira_em = item
+                if expira_em is None or expira_em > time.monotonic():
+                    self._itens.move_to_end(chave)
+                    self.acertos += 1
+                    return valor
+                del self._itens[chave]
+                self.expirados += 1
+            self.falhas += 1
+            return None
+
+    def guardar(self, chave: Hashable, valor: Any):
+        expira_em = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._itens[chave] = (valor, expira_em)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.capacidade:
+                self._itens.popitem(last=False)
+                self.remocoes += 1
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Contadores para monitoramento"""
+        consultas = self.acertos + self.falhas
+        return {
+            'itens': len(self._itens),
+            'capacidade': self.capacidade,
+            'ttl': self.ttl,
+            'acertos': self.acertos,
+            'falhas': self.falhas,
+            'taxa_acerto': round(self.acertos / consultas, 4) if consultas else None,
+            'remocoes': self.remocoes,
+            'expirados': self.expirados,
+        }
+
+
+cache_embeddings_perguntas = CacheLRU(
+    capacidade=getattr(settings, 'RAG_CACHE_EMBEDDINGS_TAMANHO', 1024),
+    ttl=getattr(settings, 'RAG_CACHE_EMBEDDINGS_TTL', 3600),
+)
+
+
+class CacheRespostas:
+    """
+    Respostas do RAG no cache do Django (compartilhado entre processos se
+    CACHES usar Redis/Memcached), invalidadas pelas versões dos dados
+    """
+
+    PREFIXO = 'rag:resposta:'
+
+    def __init__(self, alias: str = 'default', ttl: int = 86400):
+        self.alias = alias
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    @property
+    def ativo(self) -> bool:
+        return bool(self.ttl)
+
+    def chave(self, pergunta: str, tipo_rag: str, versao_dados: Optional[str] = None) -> str:
+        """Chave da resposta para a pergunta sobre os dados na versão informada (padrão: atual)"""
+        conteudo = json.dumps([normalizar_pergunta(pergunta), tipo_rag, versao_dados or hash_versoes()])
+        return self.PREFIXO + hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+    def obter(self, chave: str) -> Optional[Dict[str, Any]]:
+        try:
+            resultado = caches[self.alias].get(chave)
+        except Exception as e:
+            print(f"Erro ao ler cache de respostas: {str(e)}")
+            resultado = None
+        with self._lock:
+            if resultado is None:
+                self.falhas += 1
+            else:
+                self.acertos += 1
+        return resultado
+
+    def guardar(self, chave: str, resultado: Dict[str, Any]):
+        try:
+            caches[self.alias].set(chave, resultado, self.ttl)
+        except Exception as e:
+            print(f"Erro ao gravar cache de respostas: {str(e)}")
+
+    def estatisticas(self) -> Dict[str, Any]:
+        consultas = self.acertos + self.falhas
+        return {
+            'ativo': self.ativo,
+            'ttl': self.ttl,
+            'acertos': self.acertos,
+            'falhas': self.falhas,
+            'taxa_acerto': round(self.acertos / consultas, 4) if consultas else None,
+        }
+
+
+cache_respostas = CacheRespostas(
+    alias=getattr(settings, 'RAG_CACHE_RESPOSTAS_ALIAS', 'default'),
+    ttl=getattr(settings, 'RAG_CACHE_RESPOSTAS_TTL', 86400),
+)
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+Cache semântico de respostas do RAG
+
+Reaproveita a resposta de uma ConsultaRAG recente quando a nova pergunta é
+parecida o suficiente (similaridade de cosseno >= limiar entre os embeddings)
+e os dados não mudaram desde então (mesma versão - ver versoes.py).
+Ex.: "quantas parcelas estão vencidas?" e "qual o número de parcelas vencidas".
+
+Além da similaridade, as duas perguntas precisam citar os mesmos números,
+meses, status e períodos (ver restricoes): "total a pagar em março" não
+reaproveita a resposta de "total a pagar em abril".
+
+Cada processo mantém um pequeno índice vetorial das perguntas recentes,
+um por tipo de RAG com embeddings (`tipos`), limitado a `capacidade`
+perguntas (as menos usadas saem primeiro). Quando a versão dos dados muda,
+o índice é descartado e recarregado em segundo plano com as consultas já
+gravadas na nova versão; enquanto o índice está vazio a pergunta nem é codificada.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Iterable, Optional
+
+from django.conf import settings
+from django.db import connection
+
+from .agregados import MESES, PADROES_STATUS
+from .busca_vetorial import MotorBuscaVetorial
+from .models import ConsultaRAG
+from .palavras_chave import dobrar
+
+
+# Períodos relativos, do mais específico ao mais genérico (cada trecho conta uma vez)
+PADROES_PERIODO = [
+    (r'\bhoje\b', 'hoje'),
+    (r'\bontem\b', 'ontem'),
+    (r'\bamanha\b', 'amanha'),
+    (r'\bsemana\s+(?:passada|anterior)\b|\bultima\s+semana\b', 'semana_passada'),
+    (r'\bproxima\s+semana\b|\bsemana\s+que\s+vem\b', 'semana_seguinte'),
+    (r'\bsemana\b', 'semana'),
+    (r'\bmes\s+(?:passado|anterior)\b|\bultimo\s+mes\b', 'mes_passado'),
+    (r'\bproximo\s+mes\b|\bmes\s+que\s+vem\b', 'mes_seguinte'),
+    (r'\bmes\b', 'mes'),
+    (r'\bano\s+(?:passado|anterior)\b', 'ano_passado'),
+    (r'\bproximo\s+ano\b|\bano\s+que\s+vem\b', 'ano_seguinte'),
+    (r'\bano\b', 'ano'),
+]
+PADROES_LADO = [(r'\bpagar\b', 'pagar'), (r'\breceber\b', 'receber')]
+
+# Perguntas codificadas por vez ao recarregar o índice em segundo plano
+LOTE_AQUECIMENTO = 64
+
+
+def restricoes(pergunta: str) -> FrozenSet[str]:
+    """
+    Números, meses, status, períodos e lado (pagar/receber) citados na pergunta.
+    Perguntas parecidas só compartilham a resposta se citarem os mesmos
+    ("total a pagar em março" e "total a pagar em abril" são parecidas demais
+    para o embedding, mas têm respostas diferentes)
+    """
+    texto = dobrar(pergunta)
+    encontradas = {f'numero:{numero}' for numero in re.findall(r'\d+(?:[.,]\d+)*', texto)}
+    encontradas.update(f'mes:{mes}' for mes in re.findall(r'\b(' + '|'.join(MESES) + r')\b', texto))
+    for padroes, prefixo in ((PADROES_STATUS, 'status'), (PADROES_PERIODO, 'periodo'), (PADROES_LADO, 'lado')):
+        for padrao, valor in padroes:
+            if re.search(padrao, texto):
+                encontradas.add(f'{prefixo}:{valor}')
+                texto = re.sub(padrao, ' ', texto)
+    return frozenset(encontradas)
+
+
+class CacheSemantico:
+    """
+    Índice vetorial das perguntas já respondidas, por tipo de RAG
+    """
+
+    def __init__(self, capacidade: int = 1000, limiar: float = 0.92,
+                 tipos: Iterable[str] = (ConsultaRAG.TIPO_RAG_EMBEDDINGS, ConsultaRAG.TIPO_RAG_HIBRIDO)):
+        self.capacidade = capacidade
+        self.limiar = limiar
+        self.tipos = set(tipos)
+        self._lock = threading.Lock()
+        self._service = None
+        self._versao = None
+        self._motores: Dict[str, MotorBuscaVetorial] = {}
+        self._recentes: Dict[str, 'OrderedDict[int, None]'] = {}
+        self._restricoes: Dict[int, FrozenSet[str]] = {}
+        self.acertos = 0
+        self.falhas = 0
+        self.remocoes = 0
+        self.divergentes = 0
+
+    @property
+    def ativo(self) -> bool:
+        return self.capacidade > 0 and self.limiar > 0 and bool(self.tipos)
+
+    def _obter_service(self):
+        if self._service is None:
+            from .services import RAGEmbeddingsService
+            self._service = RAGEmbeddingsService()
+        return self._service
+
+    def _preparar(self, versao_dados: str):
+        """
+        Descarta o índice se os dados mudaram (chamado com self._lock). As consultas
+        já gravadas na nova versão são recarregadas em segundo plano, sem segurar o lock
+        """
+        if versao_dados == self._versao:
+            return
+        self._versao = versao_dados
+        self._motores = {}
+        self._recentes = {}
+        self._restricoes = {}
+        threading.Thread(
+            target=self._aquecer, args=(versao_dados,), name='rag-cache-semantico', daemon=True
+        ).start()
+
+    def _aquecer(self, versao_dados: str):
+        """Recarrega, das mais recentes para as mais antigas, as consultas da versão"""
+        try:
+            consultas = list(ConsultaRAG.objects.filter(
+                ativo=True, versao_dados=versao_dados, resposta_llm__isnull=False, tipo_rag__in=self.tipos
+            ).order_by('-criado_em').values_list('id', 'pergunta', 'tipo_rag')[:self.capacidade * len(self.tipos)])
+            for inicio in range(0, len(consultas), LOTE_AQUECIMENTO):
+                lote = consultas[inicio:inicio + LOTE_AQUECIMENTO]
+                embeddings = self._obter_service()._gerar_embeddings([pergunta for _, pergunta, _ in lote])
+                if embeddings is None:
+                    return
+                with self._lock:
+                    if versao_dados != self._versao:
+                        return
+                    for (consulta_id, pergunta, tipo_rag), embedding in zip(lote, embeddings):
+                        self._adicionar(consulta_id, tipo_rag, embedding, restricoes(pergunta), antiga=True)
+        except Exception as e:
+            print(f"Erro ao recarregar o cache semântico: {str(e)}")
+        finally:
+            connection.close()
+
+    def _adicionar(self, consulta_id: int, tipo_rag: str, embedding, restricoes_pergunta: FrozenSet[str],
+                   antiga: bool = False):
+        """
+        Inclui a pergunta no índice (chamado com self._lock). As antigas, do
+        recarregamento, entram como as menos usadas e só se houver espaço
+        """
+        recentes = self._recentes.setdefault(tipo_rag, OrderedDict())
+        if antiga and (consulta_id in recentes or len(recentes) >= self.capacidade):
+            return
+        motor = self._motores.setdefault(tipo_rag, MotorBuscaVetorial(ivf_minimo=None))
+        motor.atualizar([consulta_id], embedding.reshape(1, -1))
+        self._restricoes[consulta_id] = restricoes_pergunta
+        recentes[consulta_id] = None
+        recentes.move_to_end(consulta_id, last=not antiga)
+        while len(recentes) > self.capacidade:
+            antiga_id, _ = recentes.popitem(last=False)
+            self._descartar(motor, antiga_id)
+            self.remocoes += 1
+
+    def _descartar(self, motor: MotorBuscaVetorial, consulta_id: int):
+        motor.remover([consulta_id])
+        self._restricoes.pop(consulta_id, None)
+
+    def buscar(self, pergunta: str, tipo_rag: str, versao_dados: str) -> Optional[Dict[str, Any]]:
+        """
+        Resposta de uma pergunta parecida, com os mesmos números, meses e status,
+        sobre os mesmos dados, ou None. Só codifica a pergunta se houver com o que compará-la
+        """
+        if not self.ativo or tipo_rag not in self.tipos:
+            return None
+        try:
+            with self._lock:
+                self._preparar(versao_dados)
+                motor = self._motores.get(tipo_rag)
+                if motor is None or not len(motor):
+                    self.falhas += 1
+                    return None
+
+            embedding = self._obter_service().embedding_pergunta(pergunta)
+            if embedding is None:
+                return None
+            restricoes_pergunta = restricoes(pergunta)
+
+            with self._lock:
+                if versao_dados != self._versao or motor is not self._motores.get(tipo_rag):
+                    self.falhas += 1
+                    return None
+                parecidas = [(similaridade, consulta_id) for similaridade, consulta_id in motor.buscar(embedding, k=5)
+                             if similaridade >= self.limiar]
+                iguais = [(similaridade, consulta_id) for similaridade, consulta_id in parecidas
+                          if self._restricoes.get(consulta_id) == restricoes_pergunta]
+                if parecidas and not iguais:
+                    self.divergentes += 1
+
+            for similaridade, consulta_id in iguais:
+                consulta = ConsultaRAG.objects.filter(pk=consulta_id, ativo=True).first()
+                with self._lock:
+                    if consulta is None:
+                        if motor is self._motores.get(tipo_rag):
+                            self._descartar(motor, consulta_id)
+                            self._recentes[tipo_rag].pop(consulta_id, None)
+                        continue
+                    if consulta_id in self._recentes.get(tipo_rag, {}):
+                        self._recentes[tipo_rag].move_to_end(consulta_id)
+                    self.acertos += 1
+                return {
+                    'success': True,
+                    'resposta': consulta.resposta_llm,
+                    'contexto': consulta.contexto_retornado or '',
+                    'tipo_rag': tipo_rag,
+                    'cache': 'semantico',
+                    'similaridade': round(similaridade, 4),
+                    'pergunta_similar': consulta.pergunta,
+                }
+            with self._lock:
+                self.falhas += 1
+        except Exception as e:
+            print(f"Erro no cache semântico: {str(e)}")
+        return None
+
+    def adicionar(self, consulta: ConsultaRAG):
+        """Registra uma consulta respondida pelo LLM"""
+        if not self.ativo or not consulta.versao_dados or consulta.tipo_rag not in self.tipos:
+            return
+        try:
+            embedding = self._obter_service().embedding_pergunta(consulta.pergunta)
+            if embedding is None:
+                return
+            restricoes_pergunta = restricoes(consulta.pergunta)
+            with self._lock:
+                if consulta.versao_dados == self._versao:
+                    self._adicionar(consulta.pk, consulta.tipo_rag, embedding, restricoes_pergunta)
+        except Exception as e:
+            print(f"Erro no cache semântico: {str(e)}")
+
+    def estatisticas(self) -> Dict[str, Any]:
+        consultas = self.acertos + self.falhas
+        return {
+            'ativo': self.ativo,
+            'limiar': self.limiar,
+            'capacidade': self.capacidade,
+            'itens': sum(len(recentes) for recentes in self._recentes.values()),
+            'acertos': self.acertos,
+            'falhas': self.falhas,
+            'taxa_acerto': round(self.acertos / consultas, 4) if consultas else None,
+            'remocoes': self.remocoes,
+            'divergentes': self.divergentes,
+            'tipos': sorted(self.tipos),
+        }
+
+
+cache_semantico = CacheSemantico(
+    capacidade=getattr(settings, 'RAG_CACHE_SEMANTICO_TAMANHO', 1000),
+    limiar=getattr(settings, 'RAG_CACHE_SEMANTICO_LIMIAR', 0.92),
+    tipos=getattr(settings, 'RAG_CACHE_SEMANTICO_TIPOS', [ConsultaRAG.TIPO_RAG_EMBEDDINGS, ConsultaRAG.TIPO_RAG_HIBRIDO]),
+)
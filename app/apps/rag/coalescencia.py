@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Coalescência de consultas RAG idênticas em andamento (singleflight)
+
+Quando várias pessoas fazem a mesma pergunta ao mesmo tempo (mesma pergunta
+normalizada, tipo de RAG e versão dos dados - a chave do cache de respostas),
+só a primeira requisição faz a busca e chama o LLM; as outras esperam e usam
+o resultado dela.
+
+- No processo: as requisições de outras threads esperam um threading.Event.
+- Entre processos (distribuida=True, CACHES compartilhado como Redis ou
+  Memcached): a primeira requisição trava a chave com cache.add; nos outros
+  processos, a primeira requisição com a mesma chave acompanha o cache de
+  respostas (mesmo alias e chave) até o resultado aparecer ou a trava sumir.
+
+Se quem está respondendo falhar ou passar de espera_maxima segundos, quem
+esperava faz a consulta por conta própria. Só respostas com sucesso são
+compartilhadas.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class ConsultaEmAndamento:
+    """Consulta sendo respondida por uma requisição; as demais esperam o evento"""
+
+    def __init__(self, chave: str):
+        self.chave = chave
+        self.evento = threading.Event()
+        self.resultado: Optional[Dict[str, Any]] = None
+        self.trava: Optional[str] = None
+
+
+class CoalescenciaConsultas:
+    """
+    Registro das consultas em andamento no processo (e, opcionalmente, entre processos)
+    """
+
+    PREFIXO_TRAVA = 'rag:em_andamento:'
+
+    def __init__(self, ativa: bool = True, espera_maxima: float = 90.0, distribuida: bool = False,
+                 alias: str = 'default', intervalo: float = 0.2):
+        self.ativa = ativa
+        self.espera_maxima = espera_maxima
+        self.distribuida = distribuida
+        self.alias = alias
+        self.intervalo = intervalo
+        self._em_andamento: Dict[str, ConsultaEmAndamento] = {}
+        self._lock = threading.Lock()
+        self.lideres = 0
+        self.coalescidas = 0
+        self.coalescidas_no_cache = 0
+        self.esperas_sem_resultado = 0
+
+    def entrar(self, chave: str) -> Tuple[Optional[ConsultaEmAndamento], Optional[Dict[str, Any]]]:
+        """
+        (consulta, None) se esta requisição deve responder - e depois chamar
+        concluir(consulta, resultado) -, ou (None, resultado) com a resposta de
+        outra requisição. (None, None): responder sem compartilhar
+        """
+        if not self.ativa:
+            return None, None
+
+        with self._lock:
+            consulta = self._em_andamento.get(chave)
+            lider = consulta is None
+            if lider:
+                consulta = self._em_andamento[chave] = ConsultaEmAndamento(chave)
+                self.lideres += 1
+
+        if not lider:
+            if consulta.evento.wait(self.espera_maxima) and consulta.resultado is not None:
+                with self._lock:
+                    self.coalescidas += 1
+                return None, consulta.resultado
+            with self._lock:
+                self.esperas_sem_resultado += 1
+            return None, None
+
+        # A consulta anterior pode ter terminado entre a leitura do cache de respostas e este ponto
+        resultado = self._travar_ou_aguardar(consulta) if self.distribuida else self._resposta_guardada(chave)
+        if resultado is not None:
+            self.concluir(consulta, resultado)
+            with self._lock:
+                self.coalescidas_no_cache += 1
+            return None, resultado
+        return consulta, None
+
+    def _resposta_guardada(self, chave: str) -> Optional[Dict[str, Any]]:
+        """Resposta já gravada no cache de respostas para a chave"""
+        try:
+            return caches[self.alias].get(chave)
+        except Exception as e:
+            print(f"Erro ao ler cache de respostas: {str(e)}")
+            return None
+
+    def _travar_ou_aguardar(self, consulta: ConsultaEmAndamento) -> Optional[Dict[str, Any]]:
+        """Trava a chave no cache; se outro processo já travou, espera a resposta dele no cache de respostas"""
+        trava = self.PREFIXO_TRAVA + consulta.chave
+        try:
+            cache = caches[self.alias]
+            limite = time.monotonic() + self.espera_maxima
+            while True:
+                if cache.add(trava, os.getpid(), timeout=int(self.espera_maxima) + 1):
+                    consulta.trava = trava
+                    return self._resposta_guardada(consulta.chave)
+                resultado = cache.get(consulta.chave)
+                if resultado is not None:
+                    return resultado
+                if time.monotonic() > limite:
+                    with self._lock:
+                        self.esperas_sem_resultado += 1
+                    return None
+                time.sleep(self.intervalo)
+        except Exception as e:
+            print(f"Erro na coalescência entre processos: {str(e)}")
+            return None
+
+    def concluir(self, consulta: Optional[ConsultaEmAndamento], resultado: Optional[Dict[str, Any]]):
+        """Libera quem espera pela consulta (com o resultado, se teve sucesso)"""
+        if consulta is None:
+            return
+        with self._lock:
+            if self._em_andamento.get(consulta.chave) is consulta:
+                del self._em_andamento[consulta.chave]
+        consulta.resultado = resultado if resultado and resultado.get('success') else None
+        consulta.evento.set()
+        if consulta.trava:
+            try:
+                caches[self.alias].delete(consulta.trava)
+            except Exception as e:
+                print(f"Erro ao liberar trava da consulta: {str(e)}")
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'ativa': self.ativa,
+                'distribuida': self.distribuida,
+                'em_andamento': len(self._em_andamento),
+                'lideres': self.lideres,
+                'coalescidas': self.coalescidas,
+                'coalescidas_no_cache': self.coalescidas_no_cache,
+                'esperas_sem_resultado': self.esperas_sem_resultado,
+            }
+
+
+coalescencia = CoalescenciaConsultas(
+    ativa=getattr(settings, 'RAG_COALESCENCIA_ATIVA', True),
+    espera_maxima=getattr(settings, 'RAG_COALESCENCIA_ESPERA', 90.0),
+    distribuida=getattr(settings, 'RAG_COALESCENCIA_DISTRIBUIDA', False),
+    alias=getattr(settings, 'RAG_CACHE_RESPOSTAS_ALIAS', 'default'),
+)
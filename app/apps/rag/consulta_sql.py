@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Modo SQL do RAG: o LLM escreve um SELECT, o sistema valida e executa
+
+- descrever_esquema: descrição compacta das tabelas RAG para o prompt
+  (uma linha por tabela, com chaves estrangeiras e valores de status)
+- extrair_sql / validar_sql: um único SELECT, só sobre as tabelas permitidas,
+  sem comandos de escrita, pragmas ou funções fora da lista
+- executar_somente_leitura: executa em conexão somente leitura, com limite de
+  linhas e de tempo. No SQLite, conexão própria aberta com mode=ro e um
+  authorizer que só permite ler as tabelas permitidas; no PostgreSQL, transação
+  READ ONLY com statement_timeout, sempre desfeita
+"""
+
+import re
+import sqlite3
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import sqlparse
+from django.conf import settings
+from django.db import connections, transaction
+
+from .documentos import TABELAS_RAG
+
+
+class SQLInvalido(ValueError):
+    """SQL gerado pelo LLM recusado na validação ou na execução"""
+
+
+# Colunas que não ajudam a responder perguntas e só aumentam o prompt
+COLUNAS_OMITIDAS = {'atualizado_em', 'criado_por_id', 'atualizado_por_id', 'observacoes', 'palavras_chave', 'cor'}
+TIPOS_OMITIDOS = {'FileField', 'JSONField'}
+
+TIPOS_CURTOS = {
+    'AutoField': 'int', 'BigAutoField': 'int', 'IntegerField': 'int', 'BigIntegerField': 'int',
+    'PositiveIntegerField': 'int', 'PositiveSmallIntegerField': 'int', 'SmallIntegerField': 'int',
+    'CharField': 'texto', 'TextField': 'texto', 'EmailField': 'texto', 'DecimalField': 'decimal',
+    'FloatField': 'decimal', 'DateField': 'data', 'DateTimeField': 'data_hora', 'BooleanField': 'bool',
+    'DurationField': 'duracao',
+}
+
+PALAVRAS_PROIBIDAS = re.compile(
+    r'\b(insert|update|delete|drop|alter|create|attach|detach|pragma|replace|vacuum|reindex|analyze|'
+    r'into|recursive|grant|revoke|truncate|copy|exec|execute|call|lock|set|begin|commit|rollback|savepoint|release|'
+    r'load_extension|information_schema|pg_\w+|sqlite_\w+)\b',
+    re.IGNORECASE,
+)
+
+FUNCOES_PERMITIDAS = {
+    'count', 'sum', 'avg', 'min', 'max', 'total', 'round', 'abs', 'coalesce', 'ifnull', 'nullif', 'iif',
+    'lower', 'upper', 'trim', 'ltrim', 'rtrim', 'substr', 'substring', 'length', 'instr', 'printf',
+    'strftime', 'date', 'datetime', 'julianday', 'group_concat', 'cast', 'extract', 'date_trunc',
+    'to_char', 'string_agg', 'now', 'current_date',
+}
+
+# Palavras da linguagem que podem vir antes de "(" sem serem funções
+PALAVRAS_SQL = {
+    'in', 'exists', 'as', 'on', 'and', 'or', 'not', 'from', 'select', 'where', 'join', 'over', 'filter',
+    'then', 'else', 'when', 'case', 'by', 'between', 'is', 'like', 'having', 'union', 'all', 'with',
+    'recursive', 'using', 'any', 'distinct',
+}
+
+
+def tabelas_permitidas() -> Dict[str, object]:
+    """Tabelas que o SQL gerado pode ler (db_table -> modelo): as tabelas RAG e suas tabelas de ligação"""
+    tabelas = {}
+    for definicao in TABELAS_RAG:
+        tabelas[definicao.model._meta.db_table] = definicao.model
+        for campo in definicao.model._meta.many_to_many:
+            through = campo.remote_field.through
+            tabelas[through._meta.db_table] = through
+    return tabelas
+
+
+def descrever_esquema() -> str:
+    """Uma linha por tabela: nome(coluna tipo, fk_id->tabela, status in {...})"""
+    permitidas = tabelas_permitidas()
+    linhas = []
+    for db_table, model in permitidas.items():
+        colunas = []
+        for campo in model._meta.concrete_fields:
+            tipo = campo.get_internal_type()
+            if campo.column in COLUNAS_OMITIDAS or tipo in TIPOS_OMITIDOS:
+                continue
+            if campo.is_relation:
+                destino = campo.related_model._meta.db_table
+                if destino in permitidas:
+                    colunas.append(f"{campo.column}->{destino}")
+                continue
+            descricao = f"{campo.column} {TIPOS_CURTOS.get(tipo, 'texto')}"
+            if campo.choices:
+                descricao += " in {" + ",".join(str(valor) for valor, _ in campo.choices) + "}"
+            colunas.append(descricao)
+        linhas.append(f"{db_table}({', '.join(colunas)})")
+    return "\n".join(linhas)
+
+
+def extrair_sql(texto: str) -> str:
+    """SQL da resposta do LLM (dentro de ```sql ... ``` ou o texto todo)"""
+    bloco = re.search(r'```(?:sql)?\s*(.*?)```', texto or '', re.DOTALL | re.IGNORECASE)
+    sql = bloco.group(1) if bloco else (texto or '')
+    return sql.strip().rstrip(';').strip()
+
+
+def _sem_literais(sql: str) -> str:
+    """SQL sem comentários e com os textos entre aspas simples esvaziados"""
+    sql = sqlparse.format(sql, strip_comments=True)
+    return re.sub(r"'(?:[^']|'')*'", "''", sql)
+
+
+def validar_sql(sql: str, permitidas: Optional[Set[str]] = None) -> str:
+    """
+    Confere que o SQL é um único SELECT sobre as tabelas permitidas.
+    Retorna o SQL normalizado ou levanta SQLInvalido com o motivo
+    """
+    permitidas = permitidas if permitidas is not None else set(tabelas_permitidas())
+    sql = extrair_sql(sql)
+    if not sql:
+        raise SQLInvalido('SQL vazio')
+
+    comandos = [comando for comando in sqlparse.split(sql) if comando.strip().strip(';')]
+    if len(comandos) != 1:
+        raise SQLInvalido('Apenas um comando SQL é permitido')
+    if sqlparse.parse(sql)[0].get_type() != 'SELECT':
+        raise SQLInvalido('Apenas consultas SELECT são permitidas')
+
+    limpo = _sem_literais(sql)
+    if ';' in limpo or '"' in limpo or '`' in limpo:
+        raise SQLInvalido('Caracteres não permitidos no SQL')
+    proibida = PALAVRAS_PROIBIDAS.search(limpo)
+    if proibida:
+        raise SQLInvalido(f"Comando não permitido: {proibida.group(0)}")
+
+    # CTEs ("WITH nome AS (" ou "WITH nome(colunas) AS (") podem ser lidas como tabelas
+    ctes = {nome.lower() for nome in re.findall(
+        r'(?:\bwith\b|,)\s*([A-Za-z_]\w*)\s*(?:\([\w\s,]*\))?\s*as\s*\(', limpo, re.IGNORECASE
+    )}
+
+    for funcao in re.findall(r'\b([A-Za-z_]\w*)\s*\(', limpo):
+        nome = funcao.lower()
+        if nome not in FUNCOES_PERMITIDAS and nome not in PALAVRAS_SQL and nome not in ctes:
+            raise SQLInvalido(f"Função não permitida: {funcao}")
+
+    # Tabelas citadas depois de FROM/JOIN (e em listas "FROM a, b") precisam estar liberadas (ou ser CTEs)
+    limpo = re.sub(r'\bextract\s*\(\s*\w+\s+from\b', 'extract(', limpo, flags=re.IGNORECASE)
+    referencias = re.findall(r'\b(?:from|join)\s+([A-Za-z_][\w.]*)', limpo, re.IGNORECASE)
+    for lista in re.findall(r'\bfrom\s+((?:[A-Za-z_]\w*(?:\s+(?:as\s+)?[A-Za-z_]\w*)?\s*,\s*)+[A-Za-z_]\w*)', limpo, re.IGNORECASE):
+        referencias += [parte.split()[0] for parte in lista.split(',')]
+    for referencia in referencias:
+        nome = referencia.lower()
+        if nome in ctes or nome in {'select', 'lateral'}:
+            continue
+        if nome not in permitidas:
+            raise SQLInvalido(f"Tabela não permitida: {referencia}")
+    return sql
+
+
+def _executar_sqlite(sql: str, permitidas: Set[str], limite_linhas: int, timeout: float,
+                     alias: str) -> Tuple[List[str], List[tuple]]:
+    """Conexão própria, somente leitura (mode=ro), com authorizer e interrupção por tempo"""
+    nome = str(connections[alias].settings_dict['NAME'])
+    uri = nome if nome.startswith('file:') else f"file:{nome}"
+    uri += ('&' if '?' in uri else '?') + 'mode=ro'
+    conexao = sqlite3.connect(uri, uri=True, timeout=timeout)
+    try:
+        def autorizar(acao, arg1, arg2, banco, origem):
+            if acao in (sqlite3.SQLITE_SELECT, sqlite3.SQLITE_RECURSIVE):
+                return sqlite3.SQLITE_OK
+            if acao == sqlite3.SQLITE_READ:
+                return sqlite3.SQLITE_OK if (arg1 or '').lower() in permitidas else sqlite3.SQLITE_DENY
+            if acao == sqlite3.SQLITE_FUNCTION:
+                return sqlite3.SQLITE_OK if (arg2 or '').lower() in FUNCOES_PERMITIDAS else sqlite3.SQLITE_DENY
+            return sqlite3.SQLITE_DENY
+
+        limite_tempo = time.monotonic() + timeout
+        conexao.set_authorizer(autorizar)
+        conexao.set_progress_handler(lambda: 1 if time.monotonic() > limite_tempo else 0, 10000)
+        cursor = conexao.execute(f"SELECT * FROM ({sql}) AS consulta_rag LIMIT {int(limite_linhas) + 1}")
+        colunas = [descricao[0] for descricao in cursor.description or []]
+        return colunas, cursor.fetchall()
+    except sqlite3.DatabaseError as e:
+        raise SQLInvalido(f"Erro ao executar o SQL: {str(e)}")
+    finally:
+        conexao.close()
+
+
+def _executar_postgresql(sql: str, limite_linhas: int, timeout: float, alias: str) -> Tuple[List[str], List[tuple]]:
+    """Transação READ ONLY com statement_timeout, sempre desfeita"""
+    try:
+        with transaction.atomic(using=alias):
+            with connections[alias].cursor() as cursor:
+                cursor.execute("SET TRANSACTION READ ONLY")
+                cursor.execute("SET LOCAL statement_timeout = %s", [int(timeout * 1000)])
+                cursor.execute(f"SELECT * FROM ({sql}) AS consulta_rag LIMIT {int(limite_linhas) + 1}")
+                colunas = [descricao[0] for descricao in cursor.description or []]
+                linhas = cursor.fetchall()
+            transaction.set_rollback(True, using=alias)
+        return colunas, linhas
+    except Exception as e:
+        raise SQLInvalido(f"Erro ao executar o SQL: {str(e)}")
+
+
+def executar_somente_leitura(sql: str, limite_linhas: int = 50, timeout: float = 2.0,
+                             alias: str = 'default') -> Dict[str, object]:
+    """
+    Valida e executa o SELECT. Retorna colunas, linhas (no máximo limite_linhas)
+    e se o resultado foi truncado
+    """
+    permitidas = set(tabelas_permitidas())
+    sql = validar_sql(sql, permitidas)
+    vendor = connections[alias].vendor
+    if vendor == 'sqlite':
+        colunas, linhas = _executar_sqlite(sql, permitidas, limite_linhas, timeout, alias)
+    elif vendor == 'postgresql':
+        colunas, linhas = _executar_postgresql(sql, limite_linhas, timeout, alias)
+    else:
+        raise SQLInvalido(f"Modo SQL não suportado para o banco {vendor}")
+    return {
+        'sql': sql,
+        'colunas': colunas,
+        'linhas': linhas[:limite_linhas],
+        'truncado': len(linhas) > limite_linhas,
+    }
+
+
+def formatar_resultado(resultado: Dict[str, object]) -> str:
+    """Resultado em texto compacto: cabeçalho e uma linha por registro, separados por |"""
+    linhas = [" | ".join(resultado['colunas'])]
+    for linha in resultado['linhas']:
+        linhas.append(" | ".join('' if valor is None else str(valor) for valor in linha))
+    if not resultado['linhas']:
+        linhas.append("(nenhuma linha)")
+    if resultado['truncado']:
+        linhas.append(f"(mostrando as primeiras {len(resultado['linhas'])} linhas)")
+    return "\n".join(linhas)
+
+
+def limites() -> Tuple[int, float]:
+    """Limite de linhas e de tempo (segundos) das consultas geradas"""
+    return (getattr(settings, 'RAG_SQL_LIMITE_LINHAS', 50), getattr(settings, 'RAG_SQL_TIMEOUT', 2.0))
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Montagem do contexto dos prompts do RAG com orçamento de tokens
+
+- PREAMBULO_SISTEMA: explicação do sistema, montada uma vez por processo
+- ConstrutorContexto: preâmbulo + seções fixas (estatísticas) + registros
+  encontrados em formato tabular compacto: um bloco por tipo de registro, com
+  as colunas no cabeçalho e uma linha "valor | valor | ..." por registro. Listas
+  (parcelas de uma conta) viram uma célula "1,100.0,2026-01-10,PAGA; 2,...".
+  Se o contexto passar do orçamento, os registros de menor pontuação saem
+  primeiro; o total de tokens (estimado) fica em construtor.tokens.
+
+A contagem de tokens é uma estimativa (CARACTERES_POR_TOKEN caracteres por
+token, próxima do tokenizador do Gemini para texto em português), suficiente
+para limitar o tamanho do prompt sem depender da API.
+"""
+
+import math
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+
+
+CARACTERES_POR_TOKEN = 4
+RESERVA_AVISO_OMITIDOS = 20  # tokens da linha que avisa os registros omitidos
+
+
+def estimar_tokens(texto: str) -> int:
+    """Tokens aproximados do texto"""
+    return math.ceil(len(texto or '') / CARACTERES_POR_TOKEN)
+
+
+PREAMBULO_SISTEMA = """=== CONTEXTO DO SISTEMA ADMINISTRATIVO-FINANCEIRO ===
+
+Este é um sistema administrativo-financeiro para gestão de despesas e receitas, especialmente focado em operações agrícolas.
+
+FUNCIONALIDADES PRINCIPAIS:
+
+1. PROCESSAMENTO DE PDFs:
+   - O sistema processa PDFs de notas fiscais e boletos usando Inteligência Artificial (Google Gemini)
+   - Os PDFs são extraídos, analisados e classificados automaticamente
+   - Os dados extraídos são armazenados em ProcessamentoPDF
+
+2. CLASSIFICAÇÕES E ENTIDADES DO SISTEMA:
+
+   a) FORNECEDORES:
+      - Empresas que fornecem produtos/serviços
+      - Campos: Razão Social, Nome Fantasia, CNPJ, Email, Telefone, Endereço
+      - Relacionado com: Contas a Pagar
+
+   b) CLIENTES:
+      - Pessoas físicas que compram produtos/serviços
+      - Campos: Nome, CPF, Email, Telefone, Endereço, Data de Nascimento
+      - Relacionado com: Contas a Receber
+
+   c) FATURADOS:
+      - Pessoas físicas para quem as notas fiscais são emitidas
+      - Campos: Nome Completo, CPF, Email, Telefone, Endereço
+      - Relacionado com: Contas a Pagar
+
+   d) TIPOS DE DESPESA:
+      - Classificação das despesas em categorias:
+        * INSUMOS_AGRICOLAS: Sementes, Fertilizantes, Defensivos, Corretivos
+        * MANUTENCAO_OPERACAO: Combustíveis, Peças, Manutenção, Ferramentas
+        * RECURSOS_HUMANOS: Mão de Obra, Salários, Encargos
+        * SERVICOS_OPERACIONAIS: Frete, Colheita, Secagem, Pulverização
+        * INFRAESTRUTURA_UTILIDADES: Energia, Arrendamento, Construções
+        * ADMINISTRATIVAS: Honorários, Despesas Bancárias
+        * SEGUROS_PROTECAO: Seguro Agrícola, Seguro de Ativos
+        * IMPOSTOS_TAXAS: ITR, IPTU, IPVA, INCRA-CCIR
+        * INVESTIMENTOS: Máquinas, Veículos, Imóveis, Infraestrutura
+        * OUTROS: Outras despesas não categorizadas
+      - Relacionado com: Contas a Pagar
+
+   e) TIPOS DE RECEITA:
+      - Classificação das receitas
+      - Campos: Nome, Descrição, Código
+      - Relacionado com: Contas a Receber
+
+   f) CONTAS A PAGAR:
+      - Notas fiscais e faturas que a empresa deve pagar
+      - Campos: Fornecedor, Faturado, Número da Nota Fiscal, Data de Emissão, 
+                Descrição dos Produtos, Valor Total, Quantidade de Parcelas, Status
+      - Status: PENDENTE, PAGA, VENCIDA, CANCELADA
+      - Relacionado com: Fornecedor, Faturado, Parcelas, Tipos de Despesa
+
+   g) CONTAS A RECEBER:
+      - Documentos e faturas que a empresa deve receber
+      - Campos: Cliente, Número do Documento, Data de Emissão, Descrição,
+                Valor Total, Quantidade de Parcelas, Status
+      - Status: PENDENTE, PAGA, VENCIDA, CANCELADA
+      - Relacionado com: Cliente, Parcelas, Tipos de Receita
+
+   h) PARCELAS:
+      - Divisão de contas em múltiplas parcelas com datas de vencimento distintas
+      - Campos: Número da Parcela, Data de Vencimento, Valor, Status,
+                Data de Pagamento, Valor Pago
+      - Status: PENDENTE, PAGA, VENCIDA, CANCELADA
+      - Relacionado com: Contas a Pagar, Contas a Receber
+
+   i) PROCESSAMENTO DE PDF:
+      - Registro de todos os PDFs processados pelo sistema
+      - Campos: Nome do Arquivo, Tamanho, Status do Processamento,
+                Dados Extraídos (JSON), Erro (se houver), Data de Processamento
+      - Status: PENDENTE, PROCESSANDO, SUCESSO, ERRO, DUPLICADO
+      - Os dados extraídos incluem: Fornecedor, Cliente, Nota Fiscal, Itens, Parcelas, Classificação
+
+3. FLUXO DE TRABALHO:
+   - PDF de nota fiscal/boleto é enviado ao sistema
+   - IA extrai dados do PDF (fornecedor, valores, produtos, parcelas)
+   - Sistema classifica automaticamente a despesa
+   - Dados são armazenados em Contas a Pagar com Parcelas associadas
+   - Sistema permite consulta e gestão de todas as informações
+
+4. CONSULTAS DISPONÍVEIS:
+   - Quantidade de registros em cada tabela
+   - Valores totais a pagar/receber
+   - Parcelas pendentes/vencidas
+   - Status de processamento de PDFs
+   - Classificações de despesas/receitas
+   - Informações de fornecedores/clientes/faturados
+
+===========================================
+"""
+
+TOKENS_PREAMBULO = estimar_tokens(PREAMBULO_SISTEMA)
+
+
+def _celula(valor: Any) -> str:
+    """Valor em uma célula da tabela: sem quebras de linha nem o separador"""
+    if valor is None:
+        return ''
+    if isinstance(valor, list):
+        return '; '.join(
+            ','.join(_celula(v) for v in item.values()) if isinstance(item, dict) else _celula(item)
+            for item in valor
+        )
+    return ' '.join(str(valor).split()).replace('|', '/')
+
+
+def _coluna(nome: str, valores: List[Any]) -> str:
+    """Nome da coluna; listas de dicionários indicam os campos de cada item: parcelas[numero,valor,...]"""
+    for valor in valores:
+        if isinstance(valor, list) and valor and isinstance(valor[0], dict):
+            return f"{nome}[{','.join(valor[0])}]"
+    return nome
+
+
+class ConstrutorContexto:
+    """
+    Contexto de um prompt limitado a orcamento_tokens (preâmbulo incluído)
+    """
+
+    def __init__(self, titulo: str = "DADOS ENCONTRADOS NO BANCO DE DADOS", orcamento_tokens: Optional[int] = None,
+                 mensagem_vazia: str = "Nenhum resultado específico encontrado no banco de dados para a consulta.",
+                 preambulo: bool = True):
+        self.titulo = titulo
+        self.orcamento_tokens = orcamento_tokens if orcamento_tokens is not None else getattr(settings, 'RAG_CONTEXTO_MAX_TOKENS', 3000)
+        self.mensagem_vazia = mensagem_vazia
+        self.preambulo = preambulo
+        self._secoes: List[str] = []
+        self._registros: List[Dict[str, Any]] = []
+        self.tokens = 0
+        self.incluidos = 0
+        self.omitidos = 0
+
+    def adicionar_secao(self, titulo: str, linhas: List[str]):
+        """Seção sempre incluída (ex.: estatísticas gerais)"""
+        self._secoes.append(f"=== {titulo} ===\n" + "\n".join(linhas) + "\n")
+
+    def adicionar_registro(self, tipo: str, dados: Dict[str, Any], pontuacao: float = 0.0,
+                           relevancia: Optional[str] = None):
+        """Registro encontrado; relevancia é um texto opcional mostrado na primeira coluna"""
+        self._registros.append({
+            'tipo': tipo,
+            'dados': {chave: valor for chave, valor in dados.items() if chave != 'tipo'},
+            'pontuacao': pontuacao,
+            'relevancia': relevancia,
+            'ordem': len(self._registros),
+        })
+
+    def _blocos(self, registros: List[Dict[str, Any]]) -> List[str]:
+        """Um bloco por tipo (na ordem do registro mais relevante de cada tipo): cabeçalho + linhas"""
+        por_tipo: Dict[str, List[Dict[str, Any]]] = {}
+        for registro in registros:
+            por_tipo.setdefault(registro['tipo'], []).append(registro)
+
+        blocos = []
+        for tipo, itens in por_tipo.items():
+            campos = []
+            for item in itens:
+                campos.extend(campo for campo in item['dados'] if campo not in campos)
+            colunas = [_coluna(campo, [item['dados'].get(campo) for item in itens]) for campo in campos]
+            com_relevancia = any(item['relevancia'] for item in itens)
+            if com_relevancia:
+                colunas.insert(0, 'relevancia')
+
+            linhas = [f"{tipo} ({len(itens)}):", ' | '.join(colunas)]
+            for item in itens:
+                celulas = [_celula(item['dados'].get(campo)) for campo in campos]
+                if com_relevancia:
+                    celulas.insert(0, _celula(item['relevancia']))
+                linhas.append(' | '.join(celulas))
+            blocos.append("\n".join(linhas) + "\n")
+        return blocos
+
+    def construir(self) -> str:
+        """Contexto final; registros de menor pontuação saem até caber no orçamento"""
+        fixo = (PREAMBULO_SISTEMA + "\n" if self.preambulo else "") + "\n".join(self._secoes)
+        cabecalho = f"\n=== {self.titulo} ===\n"
+        disponivel = self.orcamento_tokens - estimar_tokens(fixo) - estimar_tokens(cabecalho)
+
+        # Mais relevantes primeiro (empates na ordem em que foram adicionados)
+        registros = sorted(self._registros, key=lambda r: (-r['pontuacao'], r['ordem']))
+
+        def tokens_dos_primeiros(n: int) -> int:
+            return estimar_tokens("\n".join(self._blocos(registros[:n])))
+
+        # Maior quantidade dos mais relevantes que cabe no orçamento (busca binária)
+        quantidade = len(registros)
+        if tokens_dos_primeiros(quantidade) > disponivel:
+            disponivel -= RESERVA_AVISO_OMITIDOS
+            menor, maior = 0, quantidade - 1
+            while menor < maior:
+                meio = (menor + maior + 1) // 2
+                if tokens_dos_primeiros(meio) <= disponivel:
+                    menor = meio
+                else:
+                    maior = meio - 1
+            quantidade = menor
+        incluidos = registros[:quantidade]
+
+        self.incluidos = len(incluidos)
+        self.omitidos = len(registros) - len(incluidos)
+        if incluidos:
+            corpo = "\n".join(self._blocos(incluidos))
+            if self.omitidos:
+                corpo += f"\n({self.omitidos} registros menos relevantes omitidos pelo limite do contexto)\n"
+        elif registros:
+            corpo = f"({self.omitidos} registros encontrados não couberam no limite do contexto)\n"
+        else:
+            corpo = self.mensagem_vazia + "\n"
+
+        contexto = fixo + cabecalho + corpo
+        self.tokens = estimar_tokens(contexto)
+        return contexto
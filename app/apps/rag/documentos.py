@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Documentos RAG - Definição das tabelas indexadas pela busca semântica
+
+Cada tabela define como um registro vira texto (para gerar o embedding),
+quais campos entram no índice de palavras-chave do RAG Simples e quais
+dados do registro vão para o contexto enviado ao LLM.
+"""
+
+from typing import Dict, Any, List, Optional
+
+from apps.clientes.models import Cliente
+from apps.fornecedores.models import Fornecedor
+from apps.contas_pagar.models import ContaPagar
+from apps.contas_receber.models import ContaReceber
+from apps.parcelas.models import Parcela
+from apps.tipos_despesa.models import TipoDespesa
+from apps.tipos_receita.models import TipoReceita
+from apps.faturados.models import Faturado
+from apps.pdf_processor.models import ProcessamentoPDF
+
+
+class TabelaRAG:
+    """
+    Descreve uma tabela indexada: modelo, texto do documento, palavras-chave e dados de contexto
+    """
+
+    def __init__(self, nome: str, tipo: str, model, texto, dados, palavras_chave=None,
+                 campos_busca: Optional[List[str]] = None,
+                 select_related: Optional[List[str]] = None,
+                 prefetch_related: Optional[List[str]] = None,
+                 ordering: Optional[List[str]] = None):
+        self.nome = nome
+        self.tipo = tipo
+        self.model = model
+        self.texto = texto
+        self.dados = dados
+        self.palavras_chave = palavras_chave or texto
+        # Campos das palavras-chave, para a busca sem índice (icontains) enquanto ele é construído
+        self.campos_busca = campos_busca or []
+        self.select_related = select_related or []
+        self.prefetch_related = prefetch_related or []
+        self.ordering = ordering
+
+    def get_queryset(self):
+        """Retorna os registros ativos da tabela, com os relacionamentos necessários"""
+        queryset = self.model.objects.filter(ativo=True)
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        if self.ordering:
+            queryset = queryset.order_by(*self.ordering)
+        return queryset
+
+    def documento(self, obj) -> str:
+        """Texto do registro usado para gerar o embedding"""
+        return self.texto(obj)
+
+    def texto_palavras_chave(self, obj) -> str:
+        """Texto do registro usado no índice de palavras-chave"""
+        return self.palavras_chave(obj)
+
+    def contexto(self, obj) -> Dict[str, Any]:
+        """Dados do registro enviados no contexto do LLM"""
+        return self.dados(obj)
+
+
+def _parcelas_resumo(conta) -> List[Dict[str, Any]]:
+    return [
+        {'numero': p.numero_parcela, 'valor': float(p.valor), 'vencimento': str(p.data_vencimento), 'status': p.status}
+        for p in conta.parcelas.all()[:3]
+    ]
+
+
+def _dados_conta_pagar(conta) -> Dict[str, Any]:
+    dados = {
+        'id': conta.id,
+        'numero_nota_fiscal': conta.numero_nota_fiscal,
+        'fornecedor': conta.fornecedor.razao_social,
+        'valor_total': float(conta.valor_total),
+        'status': conta.status,
+        'quantidade_parcelas': conta.quantidade_parcelas,
+    }
+    parcelas_info = _parcelas_resumo(conta)
+    if parcelas_info:
+        dados['parcelas'] = parcelas_info
+    return dados
+
+
+def _dados_conta_receber(conta) -> Dict[str, Any]:
+    dados = {
+        'id': conta.id,
+        'numero_documento': conta.numero_documento,
+        'cliente': conta.cliente.nome,
+        'valor_total': float(conta.valor_total),
+        'status': conta.status,
+        'quantidade_parcelas': conta.quantidade_parcelas,
+    }
+    parcelas_info = _parcelas_resumo(conta)
+    if parcelas_info:
+        dados['parcelas'] = parcelas_info
+    return dados
+
+
+TABELAS_RAG = [
+    TabelaRAG(
+        'clientes', 'Cliente', Cliente,
+        texto=lambda c: f"{c.nome} {c.cpf} {c.email or ''} {c.endereco or ''}",
+        palavras_chave=lambda c: f"{c.nome} {c.cpf} {c.email or ''}",
+        campos_busca=['nome', 'cpf', 'email'],
+        dados=lambda c: {
+            'id': c.id,
+            'nome': c.nome,
+            'cpf': c.cpf,
+            'email': c.email,
+            'telefone': c.telefone,
+        },
+    ),
+    TabelaRAG(
+        'fornecedores', 'Fornecedor', Fornecedor,
+        texto=lambda f: f"{f.razao_social} {f.fantasia or ''} {f.cnpj}",
+        palavras_chave=lambda f: f"{f.razao_social} {f.fantasia or ''} {f.cnpj}",
+        campos_busca=['razao_social', 'fantasia', 'cnpj'],
+        dados=lambda f: {
+            'id': f.id,
+            'razao_social': f.razao_social,
+            'fantasia': f.fantasia,
+            'cnpj': f.cnpj,
+        },
+    ),
+    TabelaRAG(
+        'contas_pagar', 'Conta a Pagar', ContaPagar,
+        texto=lambda c: f"{c.numero_nota_fiscal} {c.descricao_produtos} {c.fornecedor.razao_social} conta pagar pagamento despesa",
+        palavras_chave=lambda c: f"{c.numero_nota_fiscal} {c.descricao_produtos} {c.fornecedor.razao_social}",
+        campos_busca=['numero_nota_fiscal', 'descricao_produtos', 'fornecedor__razao_social'],
+        dados=_dados_conta_pagar,
+        select_related=['fornecedor'],
+        prefetch_related=['parcelas'],
+    ),
+    TabelaRAG(
+        'contas_receber', 'Conta a Receber', ContaReceber,
+        texto=lambda c: f"{c.numero_documento} {c.descricao} {c.cliente.nome} conta receber recebimento",
+        palavras_chave=lambda c: f"{c.numero_documento} {c.descricao} {c.cliente.nome}",
+        campos_busca=['numero_documento', 'descricao', 'cliente__nome'],
+        dados=_dados_conta_receber,
+        select_related=['cliente'],
+        prefetch_related=['parcelas'],
+    ),
+    TabelaRAG(
+        'parcelas', 'Parcela', Parcela,
+        texto=lambda p: f"parcela {p.numero_parcela} vencimento {p.data_vencimento} valor {p.valor} status {p.status} pagamento",
+        palavras_chave=lambda p: f"{p.status} {p.observacoes or ''}",
+        campos_busca=['status', 'observacoes'],
+        dados=lambda p: {
+            'id': p.id,
+            'numero_parcela': p.numero_parcela,
+            'valor': float(p.valor),
+            'valor_pago': float(p.valor_pago),
+            'data_vencimento': str(p.data_vencimento),
+            'data_pagamento': str(p.data_pagamento) if p.data_pagamento else None,
+            'status': p.status,
+        },
+        ordering=['-data_vencimento'],
+    ),
+    TabelaRAG(
+        'faturados', 'Faturado', Faturado,
+        texto=lambda f: f"faturado {f.nome_completo} {f.cpf} pessoa física",
+        palavras_chave=lambda f: f"{f.nome_completo} {f.cpf} {f.email or ''}",
+        campos_busca=['nome_completo', 'cpf', 'email'],
+        dados=lambda f: {
+            'id': f.id,
+            'nome_completo': f.nome_completo,
+            'cpf': f.cpf,
+        },
+    ),
+    TabelaRAG(
+        'tipos_despesa', 'Tipo de Despesa', TipoDespesa,
+        texto=lambda t: f"tipo despesa {t.nome} categoria {t.get_categoria_display()} classificação",
+        palavras_chave=lambda t: f"{t.nome} {t.descricao or ''} {t.codigo or ''} {t.categoria}",
+        campos_busca=['nome', 'descricao', 'codigo', 'categoria'],
+        dados=lambda t: {
+            'id': t.id,
+            'nome': t.nome,
+            'categoria': t.get_categoria_display(),
+        },
+    ),
+    TabelaRAG(
+        'tipos_receita', 'Tipo de Receita', TipoReceita,
+        texto=lambda t: f"tipo receita {t.nome} classificação",
+        palavras_chave=lambda t: f"{t.nome} {t.descricao or ''} {t.codigo or ''}",
+        campos_busca=['nome', 'descricao', 'codigo'],
+        dados=lambda t: {
+            'id': t.id,
+            'nome': t.nome,
+        },
+    ),
+    TabelaRAG(
+        'processamentos_pdf', 'Processamento PDF', ProcessamentoPDF,
+        texto=lambda p: f"pdf processado {p.nome_arquivo} status {p.get_status_processamento_display()} nota fiscal boleto",
+        palavras_chave=lambda p: f"{p.nome_arquivo} {p.status_processamento}",
+        campos_busca=['nome_arquivo', 'status_processamento'],
+        dados=lambda p: {
+            'id': p.id,
+            'nome_arquivo': p.nome_arquivo,
+            'status': p.get_status_processamento_display(),
+        },
+        ordering=['-criado_em'],
+    ),
+]
+
+TABELAS_POR_NOME = {tabela.nome: tabela for tabela in TABELAS_RAG}
+
+
+def get_tabela(nome: str) -> TabelaRAG:
+    """Retorna a definição de uma tabela RAG pelo nome"""
+    return TABELAS_POR_NOME[nome]
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Estatísticas gerais do banco de dados para o contexto do RAG
+
+Os totais das perguntas de quantidade ("quantos clientes", "total de PDFs")
+são contados em uma única consulta SQL (uma subconsulta COUNT por linha do
+bloco) e guardados em cache pela versão dos dados (ver versoes.py): enquanto
+nenhuma tabela RAG mudar, o bloco não vai ao banco de novo. O TTL limita o
+tempo em que alterações em massa, que não disparam signals, ficam sem aparecer.
+"""
+
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection
+
+from apps.clientes.models import Cliente
+from apps.fornecedores.models import Fornecedor
+from apps.contas_pagar.models import ContaPagar
+from apps.contas_receber.models import ContaReceber
+from apps.parcelas.models import Parcela
+from apps.tipos_despesa.models import TipoDespesa
+from apps.tipos_receita.models import TipoReceita
+from apps.faturados.models import Faturado
+from apps.pdf_processor.models import ProcessamentoPDF
+
+from .cache import CacheLRU
+from .versoes import hash_versoes
+
+
+# (tabela, rótulo, modelo, filtros além de ativo=True), na ordem do bloco de contexto
+ESTATISTICAS = [
+    ('clientes', 'Total de Clientes', Cliente, {}),
+    ('fornecedores', 'Total de Fornecedores', Fornecedor, {}),
+    ('faturados', 'Total de Faturados', Faturado, {}),
+    ('contas_pagar', 'Total de Contas a Pagar', ContaPagar, {}),
+    ('contas_receber', 'Total de Contas a Receber', ContaReceber, {}),
+    ('parcelas', 'Total de Parcelas', Parcela, {}),
+    ('tipos_despesa', 'Total de Tipos de Despesa', TipoDespesa, {}),
+    ('tipos_receita', 'Total de Tipos de Receita', TipoReceita, {}),
+    ('processamentos_pdf', 'Total de PDFs Processados', ProcessamentoPDF, {}),
+    ('processamentos_pdf', 'PDFs com Sucesso', ProcessamentoPDF, {'status_processamento': 'SUCESSO'}),
+    ('processamentos_pdf', 'PDFs com Erro', ProcessamentoPDF, {'status_processamento': 'ERRO'}),
+    ('processamentos_pdf', 'PDFs Pendentes', ProcessamentoPDF, {'status_processamento': 'PENDENTE'}),
+]
+
+
+class EstatisticasRAG:
+    """
+    Totais de registros ativos das tabelas RAG, em cache por versão dos dados
+    """
+
+    def __init__(self, ttl: int = 300):
+        self.cache = CacheLRU(capacidade=8, ttl=ttl or None)
+
+    def _sql(self) -> Tuple[str, list]:
+        """SELECT com uma subconsulta COUNT(*) por estatística"""
+        quote = connection.ops.quote_name
+        colunas = []
+        params = []
+        for _, _, model, filtros in ESTATISTICAS:
+            condicoes = [f"{quote(model._meta.get_field('ativo').column)} = %s"]
+            params.append(True)
+            for campo, valor in filtros.items():
+                condicoes.append(f"{quote(model._meta.get_field(campo).column)} = %s")
+                params.append(valor)
+            colunas.append(
+                f"(SELECT COUNT(*) FROM {quote(model._meta.db_table)} WHERE {' AND '.join(condicoes)})"
+            )
+        return "SELECT " + ", ".join(colunas), params
+
+    def calcular(self) -> List[Tuple[str, str, int]]:
+        """Conta todas as estatísticas no banco, em uma consulta: (tabela, rótulo, total)"""
+        sql, params = self._sql()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            totais = cursor.fetchone()
+        return [(tabela, rotulo, total) for (tabela, rotulo, _, _), total in zip(ESTATISTICAS, totais)]
+
+    def obter(self, tabelas: Optional[List[str]] = None) -> List[Tuple[str, int]]:
+        """Pares (rótulo, total) das tabelas informadas (padrão: todas), do cache se os dados não mudaram"""
+        versao = hash_versoes()
+        estatisticas = self.cache.obter(versao)
+        if estatisticas is None:
+            estatisticas = self.calcular()
+            self.cache.guardar(versao, estatisticas)
+        return [(rotulo, total) for tabela, rotulo, total in estatisticas if tabelas is None or tabela in tabelas]
+
+
+estatisticas_rag = EstatisticasRAG(ttl=getattr(settings, 'RAG_CACHE_ESTATISTICAS_TTL', 300))
@@ -0,0 +1,542 @@
+# -*- coding: utf-8 -*-
+"""
+Índice persistente de embeddings para o RAG com Embeddings
+
+Os vetores dos registros são gerados antecipadamente (manage.py rag_build_index)
+e gravados em EmbeddingRAG. Na consulta, apenas a pergunta é codificada.
+
+Cada gravação ou remoção de vetor também grava uma linha em AlteracaoEmbeddingRAG,
+na mesma transação. O motor de busca de cada processo guarda o id da última
+alteração lida e, no máximo a cada RAG_INDICE_SINCRONIZACAO segundos, lê em uma
+thread de fundo só as linhas novas (busca pela chave primária) e relê do banco os
+vetores dessas chaves; as consultas seguem usando o motor enquanto isso.
+Ids que faltam na sequência são de transações ainda abertas: são consultados de
+novo nas sincronizações seguintes, por até RAG_INDICE_ESPERA_TRANSACAO segundos.
+O rag_build_index apaga as alterações antigas e grava até onde apagou
+(PodaAlteracoesRAG): motores que ainda não as leram, e arquivos de índice
+anteriores à poda, são recarregados do banco.
+
+A carga inicial e as recargas completas rodam em uma thread de fundo e montam um
+motor novo, que só substitui o atual quando fica pronto; até lá as consultas usam
+o motor anterior (na primeira carga, vazio: o RAG com Embeddings usa o Simples).
+"""
+
+import hashlib
+import multiprocessing
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .arquivo_indice import BITS_ID, ArquivoIndice, escrever_arquivo_compostas
+from .backends_embeddings import codificar_em_processo, iniciar_processo_codificacao
+from .busca_vetorial import MotorBuscaVetorial
+from .documentos import TABELAS_RAG, get_tabela
+from .ivf import n_listas_sugerido
+from .models import AlteracaoEmbeddingRAG, EmbeddingRAG, PodaAlteracoesRAG
+
+
+# Alterações lidas por sincronização; se houver mais, o restante é lido em segundo plano
+LOTE_ALTERACOES = 2000
+# Registros lidos por vez do banco ao exportar o arquivo de índice
+LOTE_EXPORTACAO = 2000
+# Ids faltando na sequência acompanhados; acima disso o motor é recarregado por completo
+LIMITE_LACUNAS = 10000
+# Ids de lacunas consultados por vez (limite de parâmetros do SQLite)
+LOTE_LACUNAS = 500
+
+
+class EstadoMotor:
+    """Motor de busca de um modelo neste processo e a posição dele no registro de alterações"""
+
+    def __init__(self):
+        self.motor = MotorBuscaVetorial(
+            nprobe=getattr(settings, 'RAG_IVF_NPROBE', 8),
+            ivf_minimo=getattr(settings, 'RAG_IVF_MINIMO', 50000),
+        )
+        self.pronto = False
+        self.ultima_alteracao = 0
+        self.lacunas: Dict[int, float] = {}  # id faltando -> quando foi notado (time.monotonic)
+        self.sincronizado_em = 0.0
+        self.trava = threading.Lock()  # uma sincronização ou carga por vez
+        self.thread: Optional[threading.Thread] = None
+
+
+# Motores de busca carregados neste processo, por modelo de embeddings
+_estados: Dict[str, EstadoMotor] = {}
+_lock_estados = threading.Lock()
+
+
+def hash_documento(texto: str) -> str:
+    """Hash usado para detectar documentos que não mudaram desde a última indexação"""
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+class IndiceEmbeddings:
+    """
+    Índice de embeddings persistido no banco de dados
+    """
+
+    def __init__(self, modelo: str, codificar):
+        """
+        modelo: nome do modelo de embeddings (parte da chave do índice)
+        codificar: função que recebe uma lista de textos e retorna uma matriz (n, dim)
+        """
+        self.modelo = modelo
+        self.codificar = codificar
+
+    def _pendentes(self, tabela: str, objetos: Iterable) -> Tuple[List[int], List[str], List[str]]:
+        """
+        Documentos que precisam ser (re)codificados: os que não estão no índice
+        ou cujo texto mudou. Retorna ids, textos e hashes.
+        """
+        definicao = get_tabela(tabela)
+        documentos = {obj.pk: definicao.documento(obj) for obj in objetos}
+        if not documentos:
+            return [], [], []
+
+        hashes = {pk: hash_documento(texto) for pk, texto in documentos.items()}
+        existentes = dict(
+            EmbeddingRAG.objects.filter(
+                modelo=self.modelo, tabela=tabela, objeto_id__in=list(documentos)
+            ).values_list('objeto_id', 'texto_hash')
+        )
+        pendentes = [pk for pk in documentos if existentes.get(pk) != hashes[pk]]
+        return pendentes, [documentos[pk] for pk in pendentes], [hashes[pk] for pk in pendentes]
+
+    def _gravar(self, tabela: str, ids: List[int], hashes: List[str], vetores) -> int:
+        """Grava (insere ou atualiza) os vetores gerados"""
+        if vetores is None or not ids:
+            return 0
+        vetores = np.asarray(vetores, dtype=np.float32)
+        with transaction.atomic():
+            EmbeddingRAG.objects.bulk_create(
+                [
+                    EmbeddingRAG(
+                        modelo=self.modelo,
+                        tabela=tabela,
+                        objeto_id=pk,
+                        texto_hash=texto_hash,
+                        vetor=vetor.tobytes(),
+                    )
+                    for pk, texto_hash, vetor in zip(ids, hashes, vetores)
+                ],
+                update_conflicts=True,
+                unique_fields=['modelo', 'tabela', 'objeto_id'],
+                update_fields=['texto_hash', 'vetor', 'atualizado_em'],
+            )
+            self._registrar_alteracoes(tabela, ids)
+        return len(ids)
+
+    def _registrar_alteracoes(self, tabela: str, ids: List[int]):
+        """Registra as chaves alteradas para a sincronização dos motores dos outros processos"""
+        AlteracaoEmbeddingRAG.objects.bulk_create(
+            [AlteracaoEmbeddingRAG(modelo=self.modelo, tabela=tabela, objeto_id=pk) for pk in ids],
+            batch_size=1000,
+        )
+
+    def indexar_objetos(self, tabela: str, objetos: Iterable) -> int:
+        """
+        Gera e grava os vetores dos objetos informados.
+        Documentos cujo texto não mudou não são codificados novamente.
+        Retorna a quantidade de vetores gerados.
+        """
+        ids, textos, hashes = self._pendentes(tabela, objetos)
+        if not ids:
+            return 0
+        return self._gravar(tabela, ids, hashes, self.codificar(textos))
+
+    def remover(self, tabela: str, ids: Iterable[int]) -> int:
+        """Remove do índice os registros informados"""
+        ids = list(ids)
+        if not ids:
+            return 0
+        with transaction.atomic():
+            removidos, _ = EmbeddingRAG.objects.filter(
+                modelo=self.modelo, tabela=tabela, objeto_id__in=ids
+            ).delete()
+            if removidos:
+                self._registrar_alteracoes(tabela, ids)
+        return removidos
+
+    def remover_obsoletos(self, tabela: str) -> int:
+        """Remove do índice os registros que não estão mais ativos (subconsulta no banco)"""
+        ativos = get_tabela(tabela).get_queryset().values('pk')
+        obsoletos = EmbeddingRAG.objects.filter(
+            modelo=self.modelo, tabela=tabela
+        ).exclude(objeto_id__in=ativos).values_list('objeto_id', flat=True)
+        return self.remover(tabela, list(obsoletos))
+
+    def podar_alteracoes(self, dias: Optional[float] = None) -> int:
+        """
+        Apaga do registro as alterações com mais de `dias` (padrão: RAG_INDICE_RETENCAO_DIAS)
+        e grava o ponto da poda em PodaAlteracoesRAG, na mesma transação
+        """
+        dias = getattr(settings, 'RAG_INDICE_RETENCAO_DIAS', 7) if dias is None else dias
+        limite = timezone.now() - timedelta(days=dias)
+        with transaction.atomic():
+            antigas = AlteracaoEmbeddingRAG.objects.filter(criado_em__lt=limite)
+            ultima = antigas.aggregate(ultima=Max('id'))['ultima']
+            if ultima is None:
+                return 0
+            removidas, _ = antigas.filter(id__lte=ultima).delete()
+            poda, criada = PodaAlteracoesRAG.objects.get_or_create(
+                pk=1, defaults={'ultima_alteracao': ultima, 'podado_ate': limite}
+            )
+            if not criada:
+                poda.ultima_alteracao = max(poda.ultima_alteracao, ultima)
+                poda.podado_ate = max(poda.podado_ate, limite)
+                poda.save()
+        return removidas
+
+    def _poda(self):
+        """Maior id apagado do registro de alterações e até quando foi apagado (0, None: nunca)"""
+        poda = PodaAlteracoesRAG.objects.filter(pk=1).values_list('ultima_alteracao', 'podado_ate').first()
+        return poda or (0, None)
+
+    def construir(self, tabelas: Optional[List[str]] = None, tamanho_lote: int = 256,
+                  processos: int = 1, progresso=None) -> Dict[str, int]:
+        """
+        Indexa todos os registros ativos das tabelas RAG e remove do índice
+        os registros que não estão mais ativos.
+
+        Os registros são lidos em streaming e codificados em lotes; com processos > 1
+        os lotes são codificados em paralelo por um pool de processos, com no máximo
+        2 lotes por processo em andamento (memória limitada). Cada lote é gravado
+        assim que fica pronto, então uma construção interrompida pode ser retomada:
+        documentos já indexados com o mesmo texto são pulados.
+
+        progresso: função opcional chamada com (tabela, lidos, gerados) a cada lote.
+        Retorna a quantidade de vetores gerados por tabela.
+        """
+        pool = None
+        if processos > 1:
+            # spawn: processos novos, sem herdar conexões nem o estado do modelo deste processo
+            pool = ProcessPoolExecutor(
+                max_workers=processos,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=iniciar_processo_codificacao,
+            )
+        em_andamento = deque()
+        resumo = {}
+        lidos = {}
+
+        def concluir(limite: int):
+            while len(em_andamento) > limite:
+                tabela, ids, hashes, resultado = em_andamento.popleft()
+                vetores = resultado.result() if pool is not None else resultado
+                resumo[tabela] += self._gravar(tabela, ids, hashes, vetores)
+                if progresso:
+                    progresso(tabela, lidos[tabela], resumo[tabela])
+
+        def enviar(tabela: str, objetos: List):
+            ids, textos, hashes = self._pendentes(tabela, objetos)
+            if ids:
+                if pool is not None:
+                    resultado = pool.submit(codificar_em_processo, self.modelo, textos, tamanho_lote)
+                else:
+                    resultado = self.codificar(textos)
+                em_andamento.append((tabela, ids, hashes, resultado))
+            elif progresso:
+                progresso(tabela, lidos[tabela], resumo[tabela])
+            concluir(2 * processos if pool is not None else 0)
+
+        try:
+            for definicao in TABELAS_RAG:
+                if tabelas and definicao.nome not in tabelas:
+                    continue
+                resumo[definicao.nome] = 0
+                lidos[definicao.nome] = 0
+
+                lote = []
+                for obj in definicao.get_queryset().iterator(chunk_size=tamanho_lote):
+                    lote.append(obj)
+                    lidos[definicao.nome] += 1
+                    if len(lote) >= tamanho_lote:
+                        enviar(definicao.nome, lote)
+                        lote = []
+                if lote:
+                    enviar(definicao.nome, lote)
+                self.remover_obsoletos(definicao.nome)
+            concluir(0)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        return resumo
+
+    def carregar(self) -> Tuple[List[Tuple[str, int]], Optional[np.ndarray]]:
+        """
+        Carrega todos os vetores do modelo.
+        Retorna as chaves (tabela, id) e a matriz de vetores na mesma ordem.
+        """
+        registros = EmbeddingRAG.objects.filter(modelo=self.modelo)
+        total = registros.count()
+        if not total:
+            return [], None
+
+        # Matriz alocada uma única vez e preenchida em streaming
+        chaves = []
+        vetores = None
+        registros = registros.values_list('tabela', 'objeto_id', 'vetor')
+        for tabela, objeto_id, vetor in registros.iterator(chunk_size=2000):
+            vetor = np.frombuffer(bytes(vetor), dtype=np.float32)
+            if vetores is None:
+                vetores = np.empty((total, len(vetor)), dtype=np.float32)
+            if len(chaves) == total:
+                break
+            vetores[len(chaves)] = vetor
+            chaves.append((tabela, objeto_id))
+        return chaves, vetores[:len(chaves)]
+
+    def caminho_arquivo(self) -> str:
+        """Arquivo de índice mapeado em memória deste modelo"""
+        nome = re.sub(r'[^A-Za-z0-9_.-]+', '_', self.modelo)
+        return os.path.join(str(getattr(settings, 'RAG_INDICE_DIR', 'rag_indice')), f'{nome}.idx')
+
+    def exportar_arquivo(self, quantizacao: str = 'float32', n_listas: Optional[int] = None) -> int:
+        """
+        Grava todos os vetores do modelo no arquivo de índice (ver arquivo_indice.py).
+        Os vetores vêm do banco em streaming para uma matriz temporária em disco
+        (np.memmap), que é gravada em blocos: a matriz inteira nunca fica na memória.
+        n_listas: quantidade de listas invertidas (None = automático a partir de RAG_IVF_MINIMO vetores, 0 = sem IVF)
+        Retorna a quantidade de vetores gravados.
+        """
+        registros = EmbeddingRAG.objects.filter(modelo=self.modelo)
+        # Tudo que for alterado a partir deste instante é lido do banco pelos workers
+        atualizado_ate = registros.aggregate(ultimo=Max('atualizado_em'))['ultimo']
+        total = registros.count()
+        tabelas = sorted(set(registros.values_list('tabela', flat=True).distinct()))
+        codigos = {tabela: i for i, tabela in enumerate(tabelas)}
+        caminho = self.caminho_arquivo()
+        temporario = f"{caminho}.vetores.tmp{os.getpid()}"
+
+        compostas = np.empty(total, dtype=np.int64)
+        vetores = None
+        lidos = 0
+        try:
+            for tabela, objeto_id, vetor in registros.values_list('tabela', 'objeto_id', 'vetor').iterator(
+                chunk_size=LOTE_EXPORTACAO
+            ):
+                # Gravados depois da contagem: chegam aos workers pelo registro de alterações
+                if lidos == total:
+                    break
+                if tabela not in codigos:
+                    continue
+                vetor = np.frombuffer(bytes(vetor), dtype=np.float32)
+                if vetores is None:
+                    os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+                    vetores = np.memmap(temporario, dtype=np.float32, mode='w+', shape=(total, len(vetor)))
+                vetores[lidos] = vetor
+                compostas[lidos] = (codigos[tabela] << BITS_ID) | objeto_id
+                lidos += 1
+
+            if n_listas is None:
+                minimo = getattr(settings, 'RAG_IVF_MINIMO', 50000)
+                n_listas = n_listas_sugerido(lidos) if minimo is not None and lidos >= minimo else 0
+            escrever_arquivo_compostas(
+                caminho, self.modelo, tabelas, compostas[:lidos],
+                vetores[:lidos] if vetores is not None else np.zeros((0, 0), dtype=np.float32),
+                quantizacao=quantizacao, atualizado_ate=atualizado_ate, n_listas=n_listas,
+            )
+        finally:
+            del vetores
+            if os.path.exists(temporario):
+                os.remove(temporario)
+        return lidos
+
+    def _abrir_arquivo(self) -> Optional[ArquivoIndice]:
+        caminho = self.caminho_arquivo()
+        if not os.path.exists(caminho):
+            return None
+        try:
+            arquivo = ArquivoIndice(caminho)
+        except Exception as e:
+            print(f"Erro ao abrir arquivo de índice {caminho}: {str(e)}")
+            return None
+        if arquivo.modelo != self.modelo:
+            return None
+        return arquivo
+
+    def _estado(self) -> EstadoMotor:
+        with _lock_estados:
+            estado = _estados.get(self.modelo)
+            if estado is None:
+                estado = _estados[self.modelo] = EstadoMotor()
+            return estado
+
+    def motor(self) -> MotorBuscaVetorial:
+        """
+        Motor de busca do processo. Nunca espera por cargas nem por sincronizações:
+        elas rodam em segundo plano e, enquanto isso, o motor é devolvido como está
+        """
+        estado = self._estado()
+        agora = time.monotonic()
+        if not estado.pronto:
+            # Primeira carga, ou a sincronização pediu uma recarga completa
+            self._em_segundo_plano(estado, self._recarregar)
+        elif agora - estado.sincronizado_em >= getattr(settings, 'RAG_INDICE_SINCRONIZACAO', 1.0):
+            self._em_segundo_plano(estado, self._alcancar)
+        return estado.motor
+
+    def _em_segundo_plano(self, estado: EstadoMotor, funcao):
+        """Executa funcao(estado) em uma thread, se nenhuma carga ou sincronização estiver rodando"""
+        with _lock_estados:
+            if estado.thread is not None and estado.thread.is_alive():
+                return
+            estado.thread = threading.Thread(
+                target=self._executar, args=(estado, funcao), name='rag-indice', daemon=True
+            )
+            estado.thread.start()
+
+    def _executar(self, estado: EstadoMotor, funcao):
+        try:
+            with estado.trava:
+                funcao(estado)
+        except Exception as e:
+            print(f"Erro ao carregar índice de embeddings: {str(e)}")
+        finally:
+            connection.close()
+
+    def _alcancar(self, estado: EstadoMotor):
+        """Lê as alterações pendentes até chegar à última"""
+        while self._sincronizar(estado, estado.motor):
+            pass
+
+    def _alteracao_anterior(self, momento) -> int:
+        """
+        Id da última alteração gravada antes de `momento` menos RAG_INDICE_ESPERA_TRANSACAO:
+        as posteriores são relidas depois da carga (reler uma chave não muda o resultado)
+        """
+        if momento is None:
+            return 0
+        espera = getattr(settings, 'RAG_INDICE_ESPERA_TRANSACAO', 300)
+        ultima = AlteracaoEmbeddingRAG.objects.filter(
+            criado_em__lt=momento - timedelta(seconds=espera)
+        ).aggregate(ultima=Max('id'))['ultima']
+        return ultima or 0
+
+    def _recarregar(self, estado: EstadoMotor):
+        """Monta um motor novo (arquivo mapeado em memória ou banco) e troca o atual por ele"""
+        motor = MotorBuscaVetorial(
+            nprobe=getattr(settings, 'RAG_IVF_NPROBE', 8),
+            ivf_minimo=getattr(settings, 'RAG_IVF_MINIMO', 50000),
+        )
+        ultima_podada, podado_ate = self._poda()
+        arquivo = self._abrir_arquivo()
+        if arquivo is not None and podado_ate is not None:
+            espera = timedelta(seconds=getattr(settings, 'RAG_INDICE_ESPERA_TRANSACAO', 300))
+            if arquivo.atualizado_ate is None or arquivo.atualizado_ate - espera < podado_ate:
+                # Alterações posteriores ao arquivo já foram apagadas do registro
+                print(f"Arquivo de índice {self.caminho_arquivo()} anterior à poda das alterações, carregando do banco")
+                arquivo = None
+        if arquivo is not None:
+            # Arquivo + alterações posteriores à geração dele
+            motor.definir_base(arquivo)
+            inicio = self._alteracao_anterior(arquivo.atualizado_ate)
+        else:
+            inicio = self._alteracao_anterior(timezone.now())
+            chaves, vetores = self.carregar()
+            motor.carregar(chaves, vetores)
+
+        # As alterações apagadas já estão no arquivo ou no banco
+        estado.ultima_alteracao = max(inicio, ultima_podada)
+        estado.lacunas = {}
+        # A partir daqui, _sincronizar marca pronto = False se for preciso recarregar de novo
+        estado.pronto = True
+        try:
+            while self._sincronizar(estado, motor):
+                pass
+        except Exception:
+            estado.pronto = False
+            raise
+        estado.motor = motor
+
+    def _sincronizar(self, estado: EstadoMotor, motor: MotorBuscaVetorial) -> bool:
+        """
+        Aplica ao motor as alterações com id maior que a última lida e as de transações
+        que estavam abertas. Retorna True se ainda há alterações para ler
+        """
+        agora = time.monotonic()
+        espera = getattr(settings, 'RAG_INDICE_ESPERA_TRANSACAO', 300)
+        campos = ('id', 'modelo', 'tabela', 'objeto_id')
+
+        if self._poda()[0] > estado.ultima_alteracao:
+            print("Índice de embeddings: alterações não lidas já foram apagadas do registro, recarregando")
+            estado.sincronizado_em = agora
+            estado.pronto = False
+            return False
+
+        # Todos os modelos: ids de outro modelo não são lacunas
+        novas = list(
+            AlteracaoEmbeddingRAG.objects.filter(id__gt=estado.ultima_alteracao)
+            .order_by('id').values_list(*campos)[:LOTE_ALTERACOES]
+        )
+        estado.lacunas = {id_: desde for id_, desde in estado.lacunas.items() if agora - desde < espera}
+        atrasadas = []
+        pendentes = sorted(estado.lacunas)
+        for inicio in range(0, len(pendentes), LOTE_LACUNAS):
+            atrasadas.extend(
+                AlteracaoEmbeddingRAG.objects.filter(id__in=pendentes[inicio:inicio + LOTE_LACUNAS])
+                .values_list(*campos)
+            )
+        for id_, _, _, _ in atrasadas:
+            estado.lacunas.pop(id_, None)
+
+        if novas:
+            primeiro = estado.ultima_alteracao + 1
+            if novas[0][0] > primeiro:
+                # Ids abaixo da alteração mais antiga guardada foram podados, não são transações abertas
+                mais_antiga = AlteracaoEmbeddingRAG.objects.aggregate(menor=Min('id'))['menor']
+                primeiro = max(primeiro, mais_antiga or primeiro)
+            faltando = novas[-1][0] - primeiro + 1 - len(novas)
+            if len(estado.lacunas) + faltando > LIMITE_LACUNAS:
+                # Transação grande desfeita ou em andamento: mais simples recarregar tudo
+                print(f"Índice de embeddings: {len(estado.lacunas) + faltando} alterações em aberto, recarregando")
+                estado.sincronizado_em = agora
+                estado.pronto = False
+                return False
+            if faltando:
+                vistos = {id_ for id_, _, _, _ in novas}
+                for id_ in range(primeiro, novas[-1][0]):
+                    if id_ not in vistos:
+                        estado.lacunas[id_] = agora
+            estado.ultima_alteracao = novas[-1][0]
+
+        ids_por_tabela: Dict[str, set] = {}
+        for _, modelo, tabela, objeto_id in novas + atrasadas:
+            if modelo == self.modelo:
+                ids_por_tabela.setdefault(tabela, set()).add(objeto_id)
+        for tabela, ids in ids_por_tabela.items():
+            self._aplicar(motor, tabela, sorted(ids))
+
+        estado.sincronizado_em = agora
+        return len(novas) == LOTE_ALTERACOES
+
+    def _aplicar(self, motor: MotorBuscaVetorial, tabela: str, ids: List[int]):
+        """Relê do banco os vetores das chaves: os que existem são atualizados, os demais removidos"""
+        for inicio in range(0, len(ids), 1000):
+            lote = ids[inicio:inicio + 1000]
+            chaves, vetores = [], []
+            for objeto_id, vetor in EmbeddingRAG.objects.filter(
+                modelo=self.modelo, tabela=tabela, objeto_id__in=lote
+            ).values_list('objeto_id', 'vetor'):
+                chaves.append((tabela, objeto_id))
+                vetores.append(np.frombuffer(bytes(vetor), dtype=np.float32))
+            if chaves:
+                motor.atualizar(chaves, np.vstack(vetores))
+            presentes = set(chaves)
+            motor.remover([(tabela, objeto_id) for objeto_id in lote if (tabela, objeto_id) not in presentes])
+
+    def contar(self) -> int:
+        """Quantidade de vetores indexados para o modelo"""
+        return EmbeddingRAG.objects.filter(modelo=self.modelo).count()
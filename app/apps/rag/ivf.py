@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Índice aproximado de vizinhos mais próximos (IVF - listas invertidas)
+
+Os vetores são agrupados por k-means esférico em `n_listas` centroides.
+Na consulta, apenas as `nprobe` listas cujos centroides são mais próximos
+da pergunta são pontuadas, em vez da matriz inteira. Com ~sqrt(n) listas e
+nprobe=8, 1 milhão de vetores viram alguns milhares de produtos escalares.
+
+Os vetores indexados e as consultas devem estar normalizados (norma L2 = 1);
+o treino e a atribuição às listas aceitam vetores sem normalizar.
+"""
+
+import math
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+
+def n_listas_sugerido(n: int) -> int:
+    """Quantidade de listas para n vetores (~sqrt(n), entre 1 e 4096)"""
+    return int(min(4096, max(1, round(math.sqrt(n)))))
+
+
+def atribuir(vetores: np.ndarray, centroides: np.ndarray, bloco: int = 65536) -> np.ndarray:
+    """
+    Lista (centroide mais próximo) de cada vetor, calculada em blocos.
+    A norma do vetor não altera o resultado.
+    """
+    atribuicoes = np.empty(len(vetores), dtype=np.int32)
+    for inicio in range(0, len(vetores), bloco):
+        fim = min(inicio + bloco, len(vetores))
+        trecho = np.asarray(vetores[inicio:fim], dtype=np.float32)
+        atribuicoes[inicio:fim] = np.argmax(trecho @ centroides.T, axis=1)
+    return atribuicoes
+
+
+def treinar_centroides(vetores: np.ndarray, n_listas: int, iteracoes: int = 10,
+                       amostra_por_lista: int = 64, semente: int = 0) -> np.ndarray:
+    """
+    K-means esférico (similaridade de cosseno) sobre uma amostra dos vetores.
+    Retorna a matriz (n_listas, dim) de centroides normalizados.
+    """
+    gerador = np.random.default_rng(semente)
+    n = len(vetores)
+    n_listas = max(1, min(n_listas, n))
+    tamanho_amostra = min(n, n_listas * amostra_por_lista)
+    indices = np.sort(gerador.choice(n, size=tamanho_amostra, replace=False))
+    amostra = np.asarray(vetores[indices], dtype=np.float32)
+    normas = np.linalg.norm(amostra, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    amostra = amostra / normas
+    centroides = amostra[gerador.choice(len(amostra), size=n_listas, replace=False)].copy()
+
+    for _ in range(iteracoes):
+        atribuicoes = atribuir(amostra, centroides)
+        ordem = np.argsort(atribuicoes, kind='stable')
+        listas, inicios = np.unique(atribuicoes[ordem], return_index=True)
+        somas = np.add.reduceat(amostra[ordem], inicios, axis=0)
+
+        novos = np.empty_like(centroides)
+        novos[listas] = somas
+        vazias = np.setdiff1d(np.arange(n_listas), listas)
+        if len(vazias):
+            # Lista vazia: recomeça em um ponto qualquer da amostra
+            novos[vazias] = amostra[gerador.choice(len(amostra), size=len(vazias), replace=False)]
+        normas = np.linalg.norm(novos, axis=1, keepdims=True)
+        normas[normas == 0] = 1.0
+        centroides = (novos / normas).astype(np.float32)
+    return centroides
+
+
+def listas_proximas(centroides: np.ndarray, consulta: np.ndarray, nprobe: int) -> np.ndarray:
+    """As nprobe listas com centroides mais similares à consulta"""
+    similaridades = centroides @ consulta
+    nprobe = min(nprobe, len(centroides))
+    if nprobe >= len(centroides):
+        return np.arange(len(centroides))
+    return np.argpartition(-similaridades, nprobe - 1)[:nprobe]
+
+
+class ListasInvertidas:
+    """
+    Listas invertidas mutáveis sobre as posições de uma matriz de vetores.
+    Suporta inserções, remoções e a troca de posição usada pelo MotorBuscaVetorial.
+    """
+
+    def __init__(self, centroides: np.ndarray, nprobe: int = 8):
+        self.centroides = np.ascontiguousarray(centroides, dtype=np.float32)
+        self.nprobe = nprobe
+        self.n_listas = len(self.centroides)
+        self._listas: List[np.ndarray] = [np.empty(16, dtype=np.int64) for _ in range(self.n_listas)]
+        self._tamanhos = np.zeros(self.n_listas, dtype=np.int64)
+        # Para cada posição: lista em que está (-1 = nenhuma) e índice dentro da lista
+        self._lista_de = np.full(0, -1, dtype=np.int32)
+        self._indice_na_lista = np.zeros(0, dtype=np.int64)
+
+    def _garantir_posicoes(self, necessario: int):
+        atual = len(self._lista_de)
+        if necessario <= atual:
+            return
+        nova = max(necessario, atual * 2, 1024)
+        self._lista_de = np.concatenate([self._lista_de, np.full(nova - atual, -1, dtype=np.int32)])
+        self._indice_na_lista = np.concatenate([self._indice_na_lista, np.zeros(nova - atual, dtype=np.int64)])
+
+    def construir(self, vetores: np.ndarray):
+        """Distribui os vetores das posições 0..n-1 (substitui o conteúdo atual)"""
+        n = len(vetores)
+        atribuicoes = atribuir(vetores, self.centroides)
+        ordem = np.argsort(atribuicoes, kind='stable')
+        limites = np.searchsorted(atribuicoes[ordem], np.arange(self.n_listas + 1))
+
+        self._lista_de = np.full(n, -1, dtype=np.int32)
+        self._indice_na_lista = np.zeros(n, dtype=np.int64)
+        self._lista_de[ordem] = atribuicoes[ordem]
+        for lista in range(self.n_listas):
+            posicoes = ordem[limites[lista]:limites[lista + 1]]
+            self._listas[lista] = np.concatenate([posicoes, np.empty(16, dtype=np.int64)])
+            self._tamanhos[lista] = len(posicoes)
+            self._indice_na_lista[posicoes] = np.arange(len(posicoes))
+
+    def adicionar(self, posicoes: Iterable[int], vetores: np.ndarray):
+        """Insere (ou reposiciona) as posições informadas"""
+        posicoes = list(posicoes)
+        if not posicoes:
+            return
+        self._garantir_posicoes(max(posicoes) + 1)
+        for posicao, lista in zip(posicoes, atribuir(vetores, self.centroides)):
+            self.remover(posicao)
+            tamanho = self._tamanhos[lista]
+            if tamanho == len(self._listas[lista]):
+                self._listas[lista] = np.concatenate([self._listas[lista], np.empty(tamanho, dtype=np.int64)])
+            self._listas[lista][tamanho] = posicao
+            self._tamanhos[lista] = tamanho + 1
+            self._lista_de[posicao] = lista
+            self._indice_na_lista[posicao] = tamanho
+
+    def remover(self, posicao: int):
+        if posicao >= len(self._lista_de) or self._lista_de[posicao] < 0:
+            return
+        lista = self._lista_de[posicao]
+        indice = self._indice_na_lista[posicao]
+        ultimo = self._tamanhos[lista] - 1
+        if indice != ultimo:
+            movida = self._listas[lista][ultimo]
+            self._listas[lista][indice] = movida
+            self._indice_na_lista[movida] = indice
+        self._tamanhos[lista] = ultimo
+        self._lista_de[posicao] = -1
+
+    def mover(self, origem: int, destino: int):
+        """O vetor da posição origem passou para a posição destino"""
+        self.remover(destino)
+        if origem >= len(self._lista_de) or self._lista_de[origem] < 0:
+            return
+        self._garantir_posicoes(destino + 1)
+        lista = self._lista_de[origem]
+        indice = self._indice_na_lista[origem]
+        self._listas[lista][indice] = destino
+        self._lista_de[destino] = lista
+        self._indice_na_lista[destino] = indice
+        self._lista_de[origem] = -1
+
+    def candidatos(self, consulta: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """Posições (ordenadas) dos vetores nas listas mais próximas da consulta"""
+        listas = listas_proximas(self.centroides, consulta, nprobe or self.nprobe)
+        partes = [self._listas[lista][:self._tamanhos[lista]] for lista in listas]
+        return np.sort(np.concatenate(partes)) if partes else np.zeros(0, dtype=np.int64)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Compara a busca aproximada (IVF) com a busca exata: recall@k e latência
+"""
+
+import os
+import tempfile
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.rag.arquivo_indice import QUANTIZACOES, ArquivoIndice, escrever_arquivo
+from apps.rag.busca_vetorial import MotorBuscaVetorial, normalizar
+from apps.rag.services import RAGEmbeddingsService
+
+
+class Command(BaseCommand):
+    help = 'Mede recall@k e latência do índice IVF para vários nprobe, contra a busca exata'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--n', type=int, default=0,
+                            help='Gerar N vetores sintéticos em vez de usar o índice atual')
+        parser.add_argument('--dim', type=int, default=384, help='Dimensão dos vetores sintéticos (padrão: 384)')
+        parser.add_argument('--listas', type=int, default=0, help='Quantidade de listas (padrão: ~sqrt(n))')
+        parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+        parser.add_argument('--consultas', type=int, default=200, help='Quantidade de consultas (padrão: 200)')
+        parser.add_argument('--k', type=int, default=10, help='Tamanho do top-k (padrão: 10)')
+        parser.add_argument('--ruido', type=float, default=0.3,
+                            help='Distância das consultas aos documentos sorteados (padrão: 0.3)')
+        parser.add_argument('--quantizacao', choices=QUANTIZACOES,
+                            default=getattr(settings, 'RAG_INDICE_QUANTIZACAO', 'int8'))
+
+    def _vetores_sinteticos(self, n: int, dim: int, gerador) -> np.ndarray:
+        # Grupos gaussianos: embeddings reais são agrupados, não uniformes
+        centros = gerador.standard_normal((max(1, n // 500), dim)).astype(np.float32)
+        vetores = np.empty((n, dim), dtype=np.float32)
+        for inicio in range(0, n, 100000):
+            fim = min(inicio + 100000, n)
+            grupos = gerador.integers(0, len(centros), fim - inicio)
+            ruido = gerador.standard_normal((fim - inicio, dim)).astype(np.float32)
+            vetores[inicio:fim] = centros[grupos] + 0.8 * ruido
+        return normalizar(vetores)
+
+    def _latencias(self, motor, consultas, k, **kwargs):
+        resultados = []
+        tempos = []
+        for consulta in consultas:
+            inicio = time.perf_counter()
+            resultados.append({chave for _, chave in motor.buscar(consulta, k=k, **kwargs)})
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        return resultados, np.percentile(tempos, 50), np.percentile(tempos, 95)
+
+    def _comparar(self, titulo, motor, consultas, exatos, options):
+        self.stdout.write(titulo)
+        for nprobe in options['nprobe']:
+            aproximados, p50, p95 = self._latencias(motor, consultas, options['k'], nprobe=nprobe)
+            recall = np.mean([len(a & e) / max(1, len(e)) for a, e in zip(aproximados, exatos)])
+            self.stdout.write(f"{'nprobe=' + str(nprobe):<14}{recall:>10.4f}{p50:>12.2f}{p95:>12.2f}")
+
+    def handle(self, *args, **options):
+        gerador = np.random.default_rng(0)
+        k = options['k']
+        if options['n']:
+            vetores = self._vetores_sinteticos(options['n'], options['dim'], gerador)
+            chaves = [('sintetico', i) for i in range(len(vetores))]
+        else:
+            chaves, vetores = RAGEmbeddingsService().indice.carregar()
+            if vetores is None:
+                raise CommandError("Índice vazio - execute 'python manage.py rag_build_index' ou use --n")
+            vetores = normalizar(vetores)
+
+        n, dim = vetores.shape
+        # Consultas: documentos do índice com ruído (não idênticos a nenhum vetor)
+        amostra = gerador.choice(n, size=min(options['consultas'], n), replace=False)
+        ruido = gerador.standard_normal((len(amostra), dim)).astype(np.float32) / np.sqrt(dim)
+        consultas = normalizar(vetores[amostra] + options['ruido'] * ruido)
+
+        inicio = time.perf_counter()
+        motor = MotorBuscaVetorial(ivf_minimo=0, ivf_listas=options['listas'] or None)
+        motor.carregar(chaves, vetores)
+        self.stdout.write(f"{n} vetores de {dim} dimensões, {motor.listas_ivf} listas "
+                          f"(treino e atribuição em {time.perf_counter() - inicio:.1f}s)")
+
+        exatos, p50, p95 = self._latencias(motor, consultas, k, exata=True)
+        self.stdout.write(f"{'busca':<14}{'recall@' + str(k):>10}{'p50 (ms)':>12}{'p95 (ms)':>12}")
+        self.stdout.write(f"{'exata':<14}{1.0:>10.4f}{p50:>12.2f}{p95:>12.2f}")
+        self._comparar('Matriz em memória:', motor, consultas, exatos, options)
+
+        # Arquivo mapeado em memória: linhas agrupadas por lista, lidas de forma contígua
+        with tempfile.TemporaryDirectory() as diretorio:
+            caminho = os.path.join(diretorio, 'benchmark.idx')
+            escrever_arquivo(caminho, 'benchmark', chaves, vetores,
+                             quantizacao=options['quantizacao'], n_listas=motor.listas_ivf)
+            motor_arquivo = MotorBuscaVetorial()
+            motor_arquivo.definir_base(ArquivoIndice(caminho))
+            self._comparar(f"Arquivo ({options['quantizacao']}):", motor_arquivo, consultas, exatos, options)
+            del motor_arquivo
+
+        # Inserções incrementais (como as feitas pelos signals): cada vetor entra na lista
+        # do centroide mais próximo. A primeira inserção realoca a matriz e não é medida.
+        novos = min(1000, n)
+        motor.atualizar([('novo', -1)], vetores[:1])
+        inicio = time.perf_counter()
+        for i in range(novos):
+            motor.atualizar([('novo', i)], vetores[i:i + 1])
+        self.stdout.write(f"{novos} inserções incrementais: "
+                          f"{(time.perf_counter() - inicio) * 1000 / novos:.3f} ms por inserção")
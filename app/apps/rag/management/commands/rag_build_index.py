@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Constrói o índice de embeddings usado pelo RAG com Embeddings
+
+Os registros são lidos em streaming e gravados a cada lote: se o comando for
+interrompido, basta executá-lo de novo - os documentos já indexados com o
+mesmo texto são pulados. O arquivo de índice é gravado de forma atômica ao final.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.rag.arquivo_indice import QUANTIZACOES
+from apps.rag.backends_embeddings import get_backend
+from apps.rag.documentos import TABELAS_POR_NOME, TABELAS_RAG
+from apps.rag.services import RAGEmbeddingsService
+from apps.rag.versoes import incrementar_versao
+
+
+class Command(BaseCommand):
+    help = 'Gera os embeddings de todos os registros ativos das tabelas RAG'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tabelas',
+            nargs='+',
+            choices=list(TABELAS_POR_NOME),
+            help='Indexar apenas as tabelas informadas',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=256,
+            help='Quantidade de documentos codificados por lote (padrão: 256)',
+        )
+        parser.add_argument(
+            '--processos',
+            type=int,
+            default=1,
+            help='Processos para codificar os lotes em paralelo (padrão: 1; cada processo carrega o modelo)',
+        )
+        parser.add_argument(
+            '--ajustar-idf',
+            action='store_true',
+            help='Recalcular o IDF do backend hashing a partir dos documentos atuais antes de indexar',
+        )
+        parser.add_argument(
+            '--quantizacao',
+            choices=QUANTIZACOES,
+            default=getattr(settings, 'RAG_INDICE_QUANTIZACAO', 'int8'),
+            help='Tipo dos vetores no arquivo de índice mapeado em memória (padrão: RAG_INDICE_QUANTIZACAO)',
+        )
+        parser.add_argument(
+            '--ivf-listas',
+            type=int,
+            default=None,
+            help='Listas invertidas gravadas no arquivo (padrão: ~sqrt(n) a partir de RAG_IVF_MINIMO vetores; 0 = sem IVF)',
+        )
+        parser.add_argument(
+            '--sem-arquivo',
+            action='store_true',
+            help='Não gerar o arquivo de índice mapeado em memória',
+        )
+
+    def _progresso(self, inicio: float, intervalo: float = 2.0):
+        """Função de progresso do construir: imprime no máximo uma linha a cada `intervalo` segundos"""
+        gerados_por_tabela = {}
+        ultima = [0.0]
+
+        def progresso(tabela: str, lidos: int, gerados: int):
+            gerados_por_tabela[tabela] = gerados
+            agora = time.time()
+            if agora - ultima[0] < intervalo:
+                return
+            ultima[0] = agora
+            taxa = sum(gerados_por_tabela.values()) / max(agora - inicio, 1e-6)
+            self.stdout.write(f"  {tabela}: {lidos} lidos, {gerados} codificados ({taxa:.0f} docs/s)")
+
+        return progresso
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        if not backend.disponivel():
+            raise CommandError(
+                f"Backend de embeddings '{backend.nome}' indisponível "
+                "(sentence-transformers não instalado?). Veja RAG_EMBEDDINGS_BACKEND."
+            )
+
+        inicio = time.time()
+        if options['ajustar_idf']:
+            if not hasattr(backend, 'ajustar_idf'):
+                raise CommandError('--ajustar-idf só se aplica ao backend hashing.')
+            total = backend.ajustar_idf(
+                definicao.documento(obj)
+                for definicao in TABELAS_RAG
+                for obj in definicao.get_queryset().iterator(chunk_size=options['lote'])
+            )
+            self.stdout.write(f"IDF calculado com {total} documentos - índice '{backend.nome}'")
+
+        service = RAGEmbeddingsService()
+        inicio_construcao = time.time()
+        resumo = service.indice.construir(
+            tabelas=options['tabelas'],
+            tamanho_lote=options['lote'],
+            processos=max(1, options['processos']),
+            progresso=self._progresso(inicio_construcao),
+        )
+        duracao = max(time.time() - inicio_construcao, 1e-6)
+
+        for tabela, gerados in resumo.items():
+            self.stdout.write(f"{tabela}: {gerados} vetores gerados")
+            if gerados:
+                # Alterações em massa não disparam signals: invalidar respostas em cache
+                incrementar_versao(tabela)
+        gerados = sum(resumo.values())
+        self.stdout.write(f"{gerados} vetores gerados em {duracao:.1f}s ({gerados / duracao:.0f} docs/s)")
+
+        if not options['sem_arquivo']:
+            total = service.indice.exportar_arquivo(
+                quantizacao=options['quantizacao'], n_listas=options['ivf_listas']
+            )
+            self.stdout.write(
+                f"Arquivo {service.indice.caminho_arquivo()} gravado ({total} vetores, {options['quantizacao']})"
+            )
+            # Só com o arquivo novo gravado: um arquivo antigo ainda depende dessas alterações
+            podadas = service.indice.podar_alteracoes()
+            if podadas:
+                self.stdout.write(f"{podadas} alterações antigas removidas do registro de sincronização")
+        self.stdout.write(self.style.SUCCESS(
+            f"Índice construído em {time.time() - inicio:.1f}s - {service.indice.contar()} vetores no total"
+        ))
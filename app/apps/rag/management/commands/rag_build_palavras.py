@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Reconstrói o índice invertido de palavras-chave do RAG Simples e as estatísticas do BM25
+
+Execute na implantação (sem ele, cada tabela é construída em segundo plano na
+primeira busca) e depois de operações em massa (QuerySet.update, bulk_create,
+loaddata), que não disparam os signals que mantêm o índice atualizado.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.rag.documentos import TABELAS_POR_NOME
+from apps.rag.palavras_chave import IndicePalavrasChave
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o índice de palavras-chave das tabelas RAG'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tabelas',
+            nargs='+',
+            choices=list(TABELAS_POR_NOME),
+            help='Reconstruir apenas as tabelas informadas',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=1000,
+            help='Registros lidos e gravados por lote (padrão: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.time()
+        resumo = IndicePalavrasChave(tamanho_lote=options['lote']).construir(tabelas=options['tabelas'])
+        for tabela, termos in resumo.items():
+            self.stdout.write(f"{tabela}: {termos} termos")
+        self.stdout.write(self.style.SUCCESS(
+            f"Índice de palavras-chave construído em {time.time() - inicio:.1f}s - {sum(resumo.values())} termos"
+        ))
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Mede a perda de recall da quantização do índice de embeddings
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.rag.arquivo_indice import QUANTIZACOES, medir_recall, tamanho_estimado_mb
+from apps.rag.services import RAGEmbeddingsService
+
+
+class Command(BaseCommand):
+    help = 'Compara o recall@k da busca com vetores float16/int8 contra float32'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=10, help='Tamanho do top-k (padrão: 10)')
+        parser.add_argument('--amostras', type=int, default=200, help='Quantidade de consultas (padrão: 200)')
+
+    def handle(self, *args, **options):
+        service = RAGEmbeddingsService()
+        chaves, vetores = service.indice.carregar()
+        if vetores is None:
+            raise CommandError("Índice vazio - execute 'python manage.py rag_build_index'")
+
+        n, dim = vetores.shape
+        self.stdout.write(f"Índice '{service.indice.modelo}': {n} vetores de {dim} dimensões")
+        self.stdout.write(f"{'tipo':<10}{'recall@' + str(options['k']):>12}{'tamanho (MB)':>16}{'1M vetores (MB)':>18}")
+        for quantizacao in QUANTIZACOES:
+            recall = medir_recall(vetores, quantizacao, k=options['k'], amostras=options['amostras'])
+            self.stdout.write(
+                f"{quantizacao:<10}{recall:>12.4f}"
+                f"{tamanho_estimado_mb(n, dim, quantizacao):>16.2f}"
+                f"{tamanho_estimado_mb(1_000_000, dim, quantizacao):>18.0f}"
+            )
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Inicia o servidor local de embeddings compartilhado pelos workers web
+"""
+
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.rag.backends_embeddings import MODELO_PADRAO
+from apps.rag.modelo_embeddings import get_modelo
+
+
+def _encerrar(signum, frame):
+    raise KeyboardInterrupt
+
+
+class Command(BaseCommand):
+    help = 'Carrega o modelo de embeddings uma vez e atende os workers por socket Unix'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--socket',
+            default=getattr(settings, 'RAG_EMBEDDINGS_SOCKET', '') or '/tmp/rag_embeddings.sock',
+            help='Caminho do socket Unix (padrão: RAG_EMBEDDINGS_SOCKET)',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=256,
+            help='Tamanho máximo de cada micro-lote de codificação (padrão: 256)',
+        )
+        parser.add_argument(
+            '--espera',
+            type=float,
+            default=5.0,
+            help='Tempo máximo, em ms, aguardando outros pedidos para formar um lote (padrão: 5)',
+        )
+
+    def handle(self, *args, **options):
+        from apps.rag.servidor_embeddings import ServidorEmbeddings
+
+        holder = get_modelo(MODELO_PADRAO)
+        holder.aquecer()
+        modelo = holder.obter()
+        if modelo == 'simple':
+            raise CommandError('sentence-transformers não está instalado; não é possível gerar embeddings.')
+
+        servidor = ServidorEmbeddings(
+            options['socket'], modelo,
+            tamanho_lote=options['lote'],
+            espera_max=options['espera'] / 1000,
+        )
+        estatisticas = holder.estatisticas()
+        self.stdout.write(self.style.SUCCESS(
+            f"Servidor de embeddings em {options['socket']} "
+            f"(modelo carregado em {estatisticas['tempo_carga']:.2f}s, {estatisticas['memoria_processo_mb']:.0f} MB)"
+        ))
+        signal.signal(signal.SIGTERM, _encerrar)
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
+            self.stdout.write(
+                f"Servidor encerrado - {servidor.agrupador.textos} textos em {servidor.agrupador.lotes} lotes"
+            )
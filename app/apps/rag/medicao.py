@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Tempo de cada etapa de uma consulta RAG
+
+Cada serviço RAG tem uma MedicaoEtapas (service.medicao) que soma os segundos
+gastos em cada etapa da consulta:
+
+- roteamento: classificação da pergunta (tabelas que ela envolve)
+- embedding: codificação da pergunta
+- ranking: pontuação dos candidatos (BM25, similaridade, fusão RRF)
+- busca: leitura dos registros no banco (por tabela em tabelas); no RAG SQL,
+  geração e execução do SELECT
+- prompt: montagem do contexto e do prompt
+- primeiro_token: até o primeiro trecho do LLM (só no streaming)
+- llm: chamada ao LLM completa
+- gravacao: gravação da consulta no histórico e no cache semântico
+
+Os tempos e os tokens estimados do prompt e da resposta são gravados em
+ConsultaRAG; resumo_etapas calcula p50/p95 de cada etapa em um período.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from .contexto import estimar_tokens
+
+
+ETAPAS = ['roteamento', 'embedding', 'ranking', 'busca', 'prompt', 'primeiro_token', 'llm', 'gravacao']
+
+
+class MedicaoEtapas:
+    """
+    Segundos por etapa de uma consulta; as buscas das tabelas rodam em outras threads
+    """
+
+    def __init__(self):
+        self.tempos: Dict[str, float] = {}
+        self.tabelas: Dict[str, float] = {}
+        self.tokens_prompt: Optional[int] = None
+        self.tokens_resposta: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def adicionar(self, etapa: str, segundos: float):
+        with self._lock:
+            self.tempos[etapa] = self.tempos.get(etapa, 0.0) + segundos
+
+    @contextmanager
+    def etapa(self, nome: str):
+        """Soma à etapa o tempo do bloco with"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.adicionar(nome, time.perf_counter() - inicio)
+
+    @contextmanager
+    def tabela(self, nome: str):
+        """Soma à busca da tabela o tempo do bloco with"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.tabelas[nome] = self.tabelas.get(nome, 0.0) + time.perf_counter() - inicio
+
+    def medir_tabela(self, tabela: str, funcao, *args):
+        """Executa funcao(*args) somando o tempo à busca da tabela (para as buscas em outras threads)"""
+        with self.tabela(tabela):
+            return funcao(*args)
+
+    def contar_tokens(self, prompt: str, resposta: str):
+        """Tokens estimados do prompt e da resposta do LLM"""
+        self.tokens_prompt = estimar_tokens(prompt)
+        self.tokens_resposta = estimar_tokens(resposta)
+
+    def campos(self) -> Dict[str, Any]:
+        """Valores dos campos de ConsultaRAG (None nas etapas que a consulta não teve)"""
+        with self._lock:
+            campos = {f'tempo_{etapa}': self.tempos.get(etapa) for etapa in ETAPAS if etapa != 'gravacao'}
+            campos['tempos_tabelas'] = {tabela: round(segundos, 6) for tabela, segundos in self.tabelas.items()}
+        campos['tokens_prompt'] = self.tokens_prompt
+        campos['tokens_resposta'] = self.tokens_resposta
+        return campos
+
+
+def _percentis(valores) -> Dict[str, Any]:
+    valores = [valor for valor in valores if valor is not None]
+    if not valores:
+        return {'amostras': 0, 'p50': None, 'p95': None}
+    p50, p95 = np.percentile(valores, [50, 95])
+    return {'amostras': len(valores), 'p50': round(float(p50), 4), 'p95': round(float(p95), 4)}
+
+
+def resumo_etapas(consultas) -> Dict[str, Any]:
+    """
+    p50/p95 de cada etapa, de cada tabela, do tempo total e dos tokens das consultas
+    (queryset de ConsultaRAG). Etapas que a consulta não teve não entram na amostra
+    """
+    colunas = ['tempo_resposta', 'tokens_prompt', 'tokens_resposta', 'tempos_tabelas'] + [f'tempo_{etapa}' for etapa in ETAPAS]
+    linhas = list(consultas.values(*colunas))
+
+    por_tabela: Dict[str, list] = {}
+    for linha in linhas:
+        for tabela, segundos in (linha['tempos_tabelas'] or {}).items():
+            por_tabela.setdefault(tabela, []).append(segundos)
+
+    return {
+        'consultas': len(linhas),
+        'total': _percentis(linha['tempo_resposta'] for linha in linhas),
+        'etapas': {etapa: _percentis(linha[f'tempo_{etapa}'] for linha in linhas) for etapa in ETAPAS},
+        'tabelas': {tabela: _percentis(valores) for tabela, valores in sorted(por_tabela.items())},
+        'tokens_prompt': _percentis(linha['tokens_prompt'] for linha in linhas),
+        'tokens_resposta': _percentis(linha['tokens_resposta'] for linha in linhas),
+    }
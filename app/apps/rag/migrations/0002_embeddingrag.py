@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingRAG',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(help_text='Nome do modelo que gerou o vetor', max_length=100, verbose_name='Modelo de Embeddings')),
+                ('tabela', models.CharField(help_text='Tabela RAG de origem do registro', max_length=50, verbose_name='Tabela')),
+                ('objeto_id', models.PositiveBigIntegerField(help_text='Chave primária do registro indexado', verbose_name='ID do Registro')),
+                ('texto_hash', models.CharField(help_text='SHA-256 do documento usado para gerar o vetor', max_length=64, verbose_name='Hash do Texto')),
+                ('vetor', models.BinaryField(help_text='Embedding em float32', verbose_name='Vetor')),
+                ('atualizado_em', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+            ],
+            options={
+                'verbose_name': 'Embedding RAG',
+                'verbose_name_plural': 'Embeddings RAG',
+                'indexes': [models.Index(fields=['modelo', 'tabela'], name='rag_embeddi_modelo_bb0eaf_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='embeddingrag',
+            constraint=models.UniqueConstraint(fields=('modelo', 'tabela', 'objeto_id'), name='rag_embedding_unico'),
+        ),
+    ]
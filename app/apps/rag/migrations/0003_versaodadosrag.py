@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0002_embeddingrag'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersaoDadosRAG',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tabela', models.CharField(help_text='Tabela RAG', max_length=50, unique=True, verbose_name='Tabela')),
+                ('versao', models.PositiveBigIntegerField(default=0, help_text='Contador de alterações da tabela', verbose_name='Versão')),
+                ('atualizado_em', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+            ],
+            options={
+                'verbose_name': 'Versão dos Dados RAG',
+                'verbose_name_plural': 'Versões dos Dados RAG',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0003_versaodadosrag'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consultarag',
+            name='versao_dados',
+            field=models.CharField(blank=True, help_text='Hash das versões das tabelas RAG quando a resposta foi gerada', max_length=64, null=True, verbose_name='Versão dos Dados'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0004_consultarag_versao_dados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TermoRAG',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('termo', models.CharField(help_text='Palavra normalizada (minúsculas, sem acentos)', max_length=60, verbose_name='Termo')),
+                ('tabela', models.CharField(help_text='Tabela RAG de origem do registro', max_length=50, verbose_name='Tabela')),
+                ('objeto_id', models.PositiveBigIntegerField(help_text='Chave primária do registro que contém o termo', verbose_name='ID do Registro')),
+            ],
+            options={
+                'verbose_name': 'Termo RAG',
+                'verbose_name_plural': 'Termos RAG',
+                'indexes': [models.Index(fields=['tabela', 'objeto_id'], name='rag_termora_tabela_c927cb_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='termorag',
+            constraint=models.UniqueConstraint(fields=('termo', 'tabela', 'objeto_id'), name='rag_termo_unico'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0005_termorag'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstatisticaTabelaRAG',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tabela', models.CharField(help_text='Tabela RAG', max_length=50, unique=True, verbose_name='Tabela')),
+                ('documentos', models.PositiveBigIntegerField(default=0, help_text='Registros indexados', verbose_name='Documentos')),
+                ('termos', models.PositiveBigIntegerField(default=0, help_text='Soma dos tamanhos dos registros indexados', verbose_name='Termos')),
+            ],
+            options={
+                'verbose_name': 'Estatística de Tabela RAG',
+                'verbose_name_plural': 'Estatísticas de Tabelas RAG',
+            },
+        ),
+        migrations.CreateModel(
+            name='EstatisticaTermoRAG',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('termo', models.CharField(help_text='Palavra normalizada (minúsculas, sem acentos)', max_length=60, unique=True, verbose_name='Termo')),
+                ('documentos', models.PositiveBigIntegerField(default=0, help_text='Registros, de todas as tabelas RAG, que contêm o termo', verbose_name='Documentos')),
+            ],
+            options={
+                'verbose_name': 'Estatística de Termo RAG',
+                'verbose_name_plural': 'Estatísticas de Termos RAG',
+            },
+        ),
+        migrations.AddField(
+            model_name='termorag',
+            name='comprimento',
+            field=models.PositiveIntegerField(default=0, help_text='Total de termos do registro (normalização do BM25)', verbose_name='Tamanho do Documento'),
+        ),
+        migrations.AddField(
+            model_name='termorag',
+            name='frequencia',
+            field=models.PositiveIntegerField(default=1, help_text='Vezes que o termo aparece no registro', verbose_name='Frequência'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0006_bm25'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='consultarag',
+            name='tipo_rag',
+            field=models.CharField(choices=[('SIMPLES', 'RAG Simples'), ('EMBEDDINGS', 'RAG com Embeddings'), ('HIBRIDO', 'RAG Híbrido')], default='SIMPLES', help_text='Tipo de RAG utilizado', max_length=20, verbose_name='Tipo de RAG'),
+        ),
+    ]
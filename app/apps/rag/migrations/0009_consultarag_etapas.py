@@ -0,0 +1,68 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0008_consultarag_sql'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consultarag',
+            name='tempo_busca',
+            field=models.FloatField(blank=True, help_text='Leitura dos registros no banco (no RAG SQL, geração e execução do SELECT)', null=True, verbose_name='Tempo de Busca (segundos)'),
+        ),
+        migrations.AddField(
+            model_name='consultarag',
+            name='tempo_embedding',
+            field=models.FloatField(blank=True, help_text='Codificação da pergunta em embedding', null=True, verbose_name='Tempo de Embedding (segundos)'),
+        ),
+        migrations.AddField(
+            model_name='consultarag',
+            name='tempo_gravacao',
+            field=models.FloatField(blank=True, help_text='Gravação no histórico e no cache semântico', null=True, verbose_name='Tempo de Gravação (segundos)'),
+        ),
+        migrations.AddField(
+            model_name='consultarag',
+            name='tempo_llm',
+            field=models.FloatField(blank=True, help_text='Chamada ao LLM completa', null=True, verbose_name='Tempo do LLM (segundos)'),
+        ),
+        migrations.AddField(
+            model_name='consultarag',
+            name='tempo_primeiro_token',
+            field=models.FloatField(blank=True, help_text='Até o primeiro trecho da resposta do LLM (streaming)', null=True, verbose_name='Tempo até o Primeiro Token (segundos)'),
+        ),
+        migrations.AddField(
+            model_name='consultarag',
+            name='tempo_prompt',
+            field=models.FloatField(blank=True, help_text='Montagem do contexto e do prompt', null=True, verbose_name='Tempo de Montagem do Prompt (segundos)'),
+        ),
+        migrations.AddField(
+            model_name='consultarag',
+            name='tempo_ranking',
+            field=models.FloatField(blank=True, help_text='Pontuação dos candidatos (BM25, similaridade, fusão)', null=True, verbose_name='Tempo de Ranking (segundos)'),
+        ),
+        migrations.AddField(
+            model_name='consultarag',
+            name='tempo_roteamento',
+            field=models.FloatField(blank=True, help_text='Classificação da pergunta (tabelas envolvidas)', null=True, verbose_name='Tempo de Roteamento (segundos)'),
+        ),
+        migrations.AddField(
+            model_name='consultarag',
+            name='tempos_tabelas',
+            field=models.JSONField(blank=True, default=dict, help_text='Segundos da busca de cada tabela', verbose_name='Tempos de Busca por Tabela'),
+        ),
+        migrations.AddField(
+            model_name='consultarag',
+            name='tokens_prompt',
+            field=models.PositiveIntegerField(blank=True, help_text='Tokens estimados do prompt enviado ao LLM', null=True, verbose_name='Tokens do Prompt'),
+        ),
+        migrations.AddField(
+            model_name='consultarag',
+            name='tokens_resposta',
+            field=models.PositiveIntegerField(blank=True, help_text='Tokens estimados da resposta do LLM', null=True, verbose_name='Tokens da Resposta'),
+        ),
+    ]
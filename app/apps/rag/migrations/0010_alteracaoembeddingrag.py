@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0009_consultarag_etapas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlteracaoEmbeddingRAG',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(help_text='Nome do modelo do vetor alterado', max_length=100, verbose_name='Modelo de Embeddings')),
+                ('tabela', models.CharField(help_text='Tabela RAG de origem do registro', max_length=50, verbose_name='Tabela')),
+                ('objeto_id', models.PositiveBigIntegerField(help_text='Chave primária do registro cujo vetor mudou', verbose_name='ID do Registro')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+            ],
+            options={
+                'verbose_name': 'Alteração de Embedding RAG',
+                'verbose_name_plural': 'Alterações de Embeddings RAG',
+                'indexes': [models.Index(fields=['criado_em'], name='rag_alterac_criado__d11410_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0010_alteracaoembeddingrag'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PodaAlteracoesRAG',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ultima_alteracao', models.PositiveBigIntegerField(default=0, help_text='Maior id apagado do registro de alterações', verbose_name='Última Alteração Apagada')),
+                ('podado_ate', models.DateTimeField(help_text='Alterações criadas antes deste momento foram apagadas', verbose_name='Apagadas Até')),
+                ('atualizado_em', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+            ],
+            options={
+                'verbose_name': 'Poda de Alterações RAG',
+                'verbose_name_plural': 'Podas de Alterações RAG',
+            },
+        ),
+    ]
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Modelo de embeddings compartilhado pelo processo
+
+O SentenceTransformer é carregado uma única vez por processo (worker) e
+reutilizado por todas as requisições e threads.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def memoria_rss_mb() -> float:
+    """Memória residente atual do processo em MB"""
+    try:
+        with open('/proc/self/statm') as statm:
+            paginas = int(statm.read().split()[1])
+        return paginas * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        if resource is None:
+            return 0.0
+        # Fora do Linux: pico de memória do processo
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class ModeloEmbeddings:
+    """
+    Carregamento preguiçoso e thread-safe de um SentenceTransformer
+    """
+
+    def __init__(self, nome: str):
+        self.nome = nome
+        self._modelo = None
+        self._lock = threading.Lock()
+        self.tempo_carga: Optional[float] = None
+        self.memoria_mb: Optional[float] = None
+
+    def obter(self):
+        """
+        Retorna o modelo carregado, ou 'simple' se sentence-transformers não estiver disponível
+        """
+        if self._modelo is None:
+            with self._lock:
+                if self._modelo is None:
+                    self._modelo = self._carregar()
+        return self._modelo
+
+    def _carregar(self):
+        inicio = time.time()
+        memoria_inicial = memoria_rss_mb()
+        try:
+            from sentence_transformers import SentenceTransformer
+            modelo = SentenceTransformer(self.nome)
+        except ImportError:
+            # Se não tiver sentence-transformers, usar busca simples
+            return 'simple'
+        except Exception as e:
+            print(f"Erro ao carregar modelo de embeddings '{self.nome}': {str(e)}")
+            return 'simple'
+
+        self.tempo_carga = time.time() - inicio
+        self.memoria_mb = memoria_rss_mb() - memoria_inicial
+        print(f"Modelo de embeddings '{self.nome}' carregado em {self.tempo_carga:.2f}s "
+              f"(+{self.memoria_mb:.0f} MB, pid {os.getpid()})")
+        return modelo
+
+    def aquecer(self):
+        """Carrega o modelo e executa uma codificação inicial"""
+        modelo = self.obter()
+        if modelo != 'simple':
+            modelo.encode(['aquecimento'], convert_to_numpy=True)
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Tempo de carga e memória ocupada pelo modelo neste processo"""
+        return {
+            'modelo': self.nome,
+            'carregado': self._modelo is not None and self._modelo != 'simple',
+            'tempo_carga': self.tempo_carga,
+            'memoria_mb': self.memoria_mb,
+            'memoria_processo_mb': memoria_rss_mb(),
+            'pid': os.getpid(),
+        }
+
+
+_modelos: Dict[str, ModeloEmbeddings] = {}
+_lock_modelos = threading.Lock()
+
+
+def get_modelo(nome: str) -> ModeloEmbeddings:
+    """Retorna o holder do modelo informado (um por processo)"""
+    with _lock_modelos:
+        if nome not in _modelos:
+            _modelos[nome] = ModeloEmbeddings(nome)
+        return _modelos[nome]
+
+
+def estatisticas_modelos() -> List[Dict[str, Any]]:
+    """Tempo de carga e memória dos modelos de embeddings usados neste processo (/rag/metricas/)"""
+    with _lock_modelos:
+        modelos = list(_modelos.values())
+    return [modelo.estatisticas() for modelo in modelos]
@@ -14,10 +14,14 @@ class ConsultaRAG(BaseModel):
     
     TIPO_RAG_SIMPLES = 'SIMPLES'
     TIPO_RAG_EMBEDDINGS = 'EMBEDDINGS'
+    TIPO_RAG_HIBRIDO = 'HIBRIDO'
+    TIPO_RAG_SQL = 'SQL'
     
     TIPO_CHOICES = [
         (TIPO_RAG_SIMPLES, 'RAG Simples'),
         (TIPO_RAG_EMBEDDINGS, 'RAG com Embeddings'),
+        (TIPO_RAG_HIBRIDO, 'RAG Híbrido'),
+        (TIPO_RAG_SQL, 'RAG SQL'),
     ]
     
     pergunta = models.TextField(
@@ -54,6 +58,91 @@ class ConsultaRAG(BaseModel):
         help_text='Tempo de processamento em segundos'
     )
     
+    tempo_roteamento = models.FloatField(
+        'Tempo de Roteamento (segundos)',
+        null=True,
+        blank=True,
+        help_text='Classificação da pergunta (tabelas envolvidas)'
+    )
+    
+    tempo_embedding = models.FloatField(
+        'Tempo de Embedding (segundos)',
+        null=True,
+        blank=True,
+        help_text='Codificação da pergunta em embedding'
+    )
+    
+    tempo_ranking = models.FloatField(
+        'Tempo de Ranking (segundos)',
+        null=True,
+        blank=True,
+        help_text='Pontuação dos candidatos (BM25, similaridade, fusão)'
+    )
+    
+    tempo_busca = models.FloatField(
+        'Tempo de Busca (segundos)',
+        null=True,
+        blank=True,
+        help_text='Leitura dos registros no banco (no RAG SQL, geração e execução do SELECT)'
+    )
+    
+    tempo_prompt = models.FloatField(
+        'Tempo de Montagem do Prompt (segundos)',
+        null=True,
+        blank=True,
+        help_text='Montagem do contexto e do prompt'
+    )
+    
+    tempo_primeiro_token = models.FloatField(
+        'Tempo até o Primeiro Token (segundos)',
+        null=True,
+        blank=True,
+        help_text='Até o primeiro trecho da resposta do LLM (streaming)'
+    )
+    
+    tempo_llm = models.FloatField(
+        'Tempo do LLM (segundos)',
+        null=True,
+        blank=True,
+        help_text='Chamada ao LLM completa'
+    )
+    
+    tempo_gravacao = models.FloatField(
+        'Tempo de Gravação (segundos)',
+        null=True,
+        blank=True,
+        help_text='Gravação no histórico e no cache semântico'
+    )
+    
+    tempos_tabelas = models.JSONField(
+        'Tempos de Busca por Tabela',
+        default=dict,
+        blank=True,
+        help_text='Segundos da busca de cada tabela'
+    )
+    
+    tokens_prompt = models.PositiveIntegerField(
+        'Tokens do Prompt',
+        null=True,
+        blank=True,
+        help_text='Tokens estimados do prompt enviado ao LLM'
+    )
+    
+    tokens_resposta = models.PositiveIntegerField(
+        'Tokens da Resposta',
+        null=True,
+        blank=True,
+        help_text='Tokens estimados da resposta do LLM'
+    )
+    
+    versao_dados = models.CharField(
+        'Versão dos Dados',
+        max_length=64,
+        blank=True,
+        null=True,
+        help_text='Hash das versões das tabelas RAG quando a resposta foi gerada'
+    )
+    
     class Meta:
         verbose_name = 'Consulta RAG'
         verbose_name_plural = 'Consultas RAG'
@@ -66,3 +155,253 @@ class ConsultaRAG(BaseModel):
     def __str__(self):
         return f"Consulta RAG - {self.pergunta[:50]}..."
 
+
+
+class EmbeddingRAG(models.Model):
+    """
+    Índice persistente de embeddings: um vetor por (modelo, tabela, registro)
+    """
+    
+    modelo = models.CharField(
+        'Modelo de Embeddings',
+        max_length=100,
+        help_text='Nome do modelo que gerou o vetor'
+    )
+    
+    tabela = models.CharField(
+        'Tabela',
+        max_length=50,
+        help_text='Tabela RAG de origem do registro'
+    )
+    
+    objeto_id = models.PositiveBigIntegerField(
+        'ID do Registro',
+        help_text='Chave primária do registro indexado'
+    )
+    
+    texto_hash = models.CharField(
+        'Hash do Texto',
+        max_length=64,
+        help_text='SHA-256 do documento usado para gerar o vetor'
+    )
+    
+    vetor = models.BinaryField(
+        'Vetor',
+        help_text='Embedding em float32'
+    )
+    
+    atualizado_em = models.DateTimeField('Atualizado em', auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Embedding RAG'
+        verbose_name_plural = 'Embeddings RAG'
+        constraints = [
+            models.UniqueConstraint(fields=['modelo', 'tabela', 'objeto_id'], name='rag_embedding_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['modelo', 'tabela']),
+        ]
+
+    def __str__(self):
+        return f"Embedding {self.modelo} - {self.tabela} #{self.objeto_id}"
+
+
+class AlteracaoEmbeddingRAG(models.Model):
+    """
+    Registro das alterações do índice de embeddings: uma linha por vetor gravado
+    ou removido, gravada na mesma transação. Cada processo lê só as linhas com id
+    maior que o da última sincronização para atualizar o motor de busca em memória
+    """
+    
+    modelo = models.CharField(
+        'Modelo de Embeddings',
+        max_length=100,
+        help_text='Nome do modelo do vetor alterado'
+    )
+    
+    tabela = models.CharField(
+        'Tabela',
+        max_length=50,
+        help_text='Tabela RAG de origem do registro'
+    )
+    
+    objeto_id = models.PositiveBigIntegerField(
+        'ID do Registro',
+        help_text='Chave primária do registro cujo vetor mudou'
+    )
+    
+    criado_em = models.DateTimeField('Criado em', auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Alteração de Embedding RAG'
+        verbose_name_plural = 'Alterações de Embeddings RAG'
+        indexes = [
+            models.Index(fields=['criado_em']),
+        ]
+
+    def __str__(self):
+        return f"Alteração {self.id}: {self.modelo} - {self.tabela} #{self.objeto_id}"
+
+
+class PodaAlteracoesRAG(models.Model):
+    """
+    Ponto até onde o registro de alterações já foi apagado (linha única).
+    Motores e arquivos de índice que dependem de alterações anteriores a ele
+    são recarregados do banco
+    """
+
+    ultima_alteracao = models.PositiveBigIntegerField(
+        'Última Alteração Apagada',
+        default=0,
+        help_text='Maior id apagado do registro de alterações'
+    )
+
+    podado_ate = models.DateTimeField(
+        'Apagadas Até',
+        help_text='Alterações criadas antes deste momento foram apagadas'
+    )
+
+    atualizado_em = models.DateTimeField('Atualizado em', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Poda de Alterações RAG'
+        verbose_name_plural = 'Podas de Alterações RAG'
+
+    def __str__(self):
+        return f"Alterações apagadas até #{self.ultima_alteracao} ({self.podado_ate})"
+
+
+class VersaoDadosRAG(models.Model):
+    """
+    Versão dos dados de cada tabela RAG: incrementada a cada gravação ou exclusão.
+    O vetor de versões faz parte da chave do cache de respostas.
+    """
+    
+    tabela = models.CharField(
+        'Tabela',
+        max_length=50,
+        unique=True,
+        help_text='Tabela RAG'
+    )
+    
+    versao = models.PositiveBigIntegerField(
+        'Versão',
+        default=0,
+        help_text='Contador de alterações da tabela'
+    )
+    
+    atualizado_em = models.DateTimeField('Atualizado em', auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Versão dos Dados RAG'
+        verbose_name_plural = 'Versões dos Dados RAG'
+
+    def __str__(self):
+        return f"{self.tabela} v{self.versao}"
+
+
+class TermoRAG(models.Model):
+    """
+    Índice invertido de palavras-chave do RAG Simples: uma linha por
+    (termo, tabela, registro). Termos sem acentos e em minúsculas.
+    """
+    
+    termo = models.CharField(
+        'Termo',
+        max_length=60,
+        help_text='Palavra normalizada (minúsculas, sem acentos)'
+    )
+    
+    tabela = models.CharField(
+        'Tabela',
+        max_length=50,
+        help_text='Tabela RAG de origem do registro'
+    )
+    
+    objeto_id = models.PositiveBigIntegerField(
+        'ID do Registro',
+        help_text='Chave primária do registro que contém o termo'
+    )
+    
+    frequencia = models.PositiveIntegerField(
+        'Frequência',
+        default=1,
+        help_text='Vezes que o termo aparece no registro'
+    )
+    
+    comprimento = models.PositiveIntegerField(
+        'Tamanho do Documento',
+        default=0,
+        help_text='Total de termos do registro (normalização do BM25)'
+    )
+    
+    class Meta:
+        verbose_name = 'Termo RAG'
+        verbose_name_plural = 'Termos RAG'
+        constraints = [
+            models.UniqueConstraint(fields=['termo', 'tabela', 'objeto_id'], name='rag_termo_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['tabela', 'objeto_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.termo} - {self.tabela} #{self.objeto_id}"
+
+
+class EstatisticaTermoRAG(models.Model):
+    """
+    Quantidade de registros que contêm cada termo (IDF do BM25)
+    """
+    
+    termo = models.CharField(
+        'Termo',
+        max_length=60,
+        unique=True,
+        help_text='Palavra normalizada (minúsculas, sem acentos)'
+    )
+    
+    documentos = models.PositiveBigIntegerField(
+        'Documentos',
+        default=0,
+        help_text='Registros, de todas as tabelas RAG, que contêm o termo'
+    )
+    
+    class Meta:
+        verbose_name = 'Estatística de Termo RAG'
+        verbose_name_plural = 'Estatísticas de Termos RAG'
+
+    def __str__(self):
+        return f"{self.termo}: {self.documentos}"
+
+
+class EstatisticaTabelaRAG(models.Model):
+    """
+    Registros e total de termos indexados por tabela (N e tamanho médio do BM25)
+    """
+    
+    tabela = models.CharField(
+        'Tabela',
+        max_length=50,
+        unique=True,
+        help_text='Tabela RAG'
+    )
+    
+    documentos = models.PositiveBigIntegerField(
+        'Documentos',
+        default=0,
+        help_text='Registros indexados'
+    )
+    
+    termos = models.PositiveBigIntegerField(
+        'Termos',
+        default=0,
+        help_text='Soma dos tamanhos dos registros indexados'
+    )
+    
+    class Meta:
+        verbose_name = 'Estatística de Tabela RAG'
+        verbose_name_plural = 'Estatísticas de Tabelas RAG'
+
+    def __str__(self):
+        return f"{self.tabela}: {self.documentos} documentos"
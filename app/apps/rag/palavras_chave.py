@@ -0,0 +1,520 @@
+# -*- coding: utf-8 -*-
+"""
+Índice invertido de palavras-chave do RAG Simples, com ranking BM25
+
+Cada registro ativo das tabelas RAG é quebrado em termos (minúsculas, sem
+acentos - ver documentos.TabelaRAG.palavras_chave) gravados em TermoRAG:
+termo -> (tabela, id, frequência no registro, tamanho do registro). Na
+consulta, os termos da pergunta são procurados no índice (igualdade ou
+prefixo, pelo índice B-tree que começa em `termo`), as listas são combinadas
+em memória e só os registros encontrados são lidos, pela chave primária.
+Substitui os filtros `icontains` (LIKE '%palavra%'), que varriam as tabelas
+inteiras a cada pergunta.
+
+Os registros encontrados são ordenados por BM25. As estatísticas usadas no
+cálculo ficam pré-computadas: registros por termo (IDF) em
+EstatisticaTermoRAG e registros/tamanho total por tabela em
+EstatisticaTabelaRAG. Todas as tabelas formam um só corpus, então as
+pontuações de tabelas diferentes são comparáveis.
+
+O índice é atualizado a cada gravação/exclusão: os signals (ver signals.py)
+enfileiram o registro depois do commit em fila_palavras, que reindexa em lotes
+em uma thread de fundo (como a reindexação de embeddings, ver reindexacao.py),
+fora da transação de quem grava. O índice é construído por 'python manage.py rag_build_palavras' (também depois de
+operações em massa). Uma busca em tabela ainda não indexada não espera a
+construção: ela é iniciada em segundo plano e, até terminar, a tabela é
+consultada com os filtros `icontains` antigos (campos_busca de TabelaRAG).
+"""
+
+import atexit
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q, Sum
+
+from .documentos import TABELAS_RAG, get_tabela
+from .models import EstatisticaTabelaRAG, EstatisticaTermoRAG, TermoRAG
+from .reindexacao import FilaReindexacao, expandir_dependentes
+
+
+# Palavras com menos letras são ignoradas (como nos filtros antigos)
+TAMANHO_MINIMO = 3
+# Termos da pergunta com ao menos estas letras também casam como prefixo ("fornecedor" -> "fornecedores")
+TAMANHO_MINIMO_PREFIXO = 4
+TAMANHO_MAXIMO = 60
+
+# Parâmetros do BM25: saturação da frequência do termo e normalização pelo tamanho do registro
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Peso de um termo que só casa como prefixo ("sobrenome12" em "sobrenome123"): a palavra exata vem antes
+PESO_PREFIXO = 0.5
+
+
+def dobrar(texto: str) -> str:
+    """Minúsculas e sem acentos ("Câmbio" -> "cambio")"""
+    texto = unicodedata.normalize('NFKD', (texto or '').lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+def contar_termos(texto: str) -> Counter:
+    """
+    Termos de um texto com suas frequências. Números com pontuação (CPF, CNPJ,
+    nota fiscal) geram também o termo só com os dígitos:
+    "123.456.789-00" -> 123, 456, 789, 12345678900
+    """
+    termos = Counter()
+    for trecho in dobrar(texto).split():
+        partes = re.findall(r'[0-9a-z]+', trecho)
+        termos.update(parte[:TAMANHO_MAXIMO] for parte in partes if len(parte) >= TAMANHO_MINIMO)
+        digitos = ''.join(partes)
+        if len(partes) > 1 and digitos.isdigit() and len(digitos) >= TAMANHO_MINIMO:
+            termos[digitos[:TAMANHO_MAXIMO]] += 1
+    return termos
+
+
+def tokenizar(texto: str) -> Set[str]:
+    """Termos distintos de um texto (ver contar_termos)"""
+    return set(contar_termos(texto))
+
+
+def grupos_pergunta(texto: str) -> List[Set[str]]:
+    """
+    Termos da pergunta agrupados por palavra. Uma palavra com pontuação só
+    casa com um registro que tenha todos os seus termos ("joao@email.com"
+    exige joao, email e com); números com pontuação viram só os dígitos.
+    """
+    grupos = []
+    for trecho in dobrar(texto).split():
+        partes = re.findall(r'[0-9a-z]+', trecho)
+        digitos = ''.join(partes)
+        if len(partes) > 1 and digitos.isdigit():
+            grupo = {digitos} if len(digitos) >= TAMANHO_MINIMO else set()
+        else:
+            grupo = {parte for parte in partes if len(parte) >= TAMANHO_MINIMO}
+        grupo = {termo[:TAMANHO_MAXIMO] for termo in grupo}
+        if grupo and grupo not in grupos:
+            grupos.append(grupo)
+    return grupos
+
+
+def bm25_idf(documentos_com_termo: int, total_documentos: int) -> float:
+    """IDF do BM25 (sempre positivo)"""
+    return math.log(1 + (total_documentos - documentos_com_termo + 0.5) / (documentos_com_termo + 0.5))
+
+
+def ordenar_por_pontuacao(pontos: Dict[int, float]) -> List[int]:
+    """IDs da maior para a menor pontuação; empates: registros mais recentes primeiro"""
+    return sorted(pontos, key=lambda pk: (-pontos[pk], -pk))
+
+
+def _somar(model, chave: Dict, **variacoes):
+    """Soma as variações aos contadores da linha `chave`, criando-a se preciso"""
+    atualizacao = {campo: F(campo) + variacao for campo, variacao in variacoes.items()}
+    if model.objects.filter(**chave).update(**atualizacao):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**chave, **{campo: max(variacao, 0) for campo, variacao in variacoes.items()})
+    except IntegrityError:
+        # Criada por outro processo ao mesmo tempo
+        model.objects.filter(**chave).update(**atualizacao)
+
+
+def _somar_termos(variacoes: Dict[str, int]):
+    """
+    Soma as variações à quantidade de registros de cada termo: um UPDATE por valor
+    de variação (quase sempre +1 ou -1) e um bulk_create dos termos novos. Um termo
+    novo criado ao mesmo tempo por outro processo perde a variação deste lote
+    (o rag_build_palavras recalcula as frequências)
+    """
+    variacoes = {termo: variacao for termo, variacao in variacoes.items() if variacao}
+    termos = list(variacoes)
+    existentes = set()
+    for inicio in range(0, len(termos), 500):
+        existentes.update(EstatisticaTermoRAG.objects.filter(
+            termo__in=termos[inicio:inicio + 500]
+        ).values_list('termo', flat=True))
+
+    por_variacao = defaultdict(list)
+    for termo in existentes:
+        por_variacao[variacoes[termo]].append(termo)
+    for variacao, termos_variacao in por_variacao.items():
+        for inicio in range(0, len(termos_variacao), 500):
+            EstatisticaTermoRAG.objects.filter(termo__in=termos_variacao[inicio:inicio + 500]).update(
+                documentos=F('documentos') + variacao
+            )
+    EstatisticaTermoRAG.objects.bulk_create(
+        [EstatisticaTermoRAG(termo=termo, documentos=variacao)
+         for termo, variacao in variacoes.items() if termo not in existentes and variacao > 0],
+        batch_size=500, ignore_conflicts=True,
+    )
+
+
+class IndicePalavrasChave:
+    """
+    Índice invertido persistido em TermoRAG, com as estatísticas do BM25
+    """
+
+    def __init__(self, tamanho_lote: int = 1000, max_ocorrencias: int = 500, construcao_automatica: bool = True):
+        self.tamanho_lote = tamanho_lote
+        self.max_ocorrencias = max_ocorrencias
+        self.construcao_automatica = construcao_automatica
+        self._tabelas_prontas: Set[str] = set()
+        self._lock = threading.Lock()
+        self._construcao: Optional[threading.Thread] = None
+
+    def _documentos(self, tabela: str, objetos: Iterable) -> List[Tuple[int, Counter]]:
+        """(id, frequência de cada termo) dos registros"""
+        definicao = get_tabela(tabela)
+        documentos = ((obj.pk, contar_termos(definicao.texto_palavras_chave(obj))) for obj in objetos)
+        return [(objeto_id, contagem) for objeto_id, contagem in documentos if contagem]
+
+    def indexar(self, tabela: str, ids: Iterable[int]) -> int:
+        """
+        (Re)indexa os registros informados e ajusta as estatísticas do BM25;
+        os inativos ou excluídos saem do índice. Tabelas ainda não indexadas são
+        ignoradas (serão construídas inteiras no primeiro uso). Retorna a
+        quantidade de termos gravados.
+        """
+        if not EstatisticaTabelaRAG.objects.filter(tabela=tabela).exists():
+            return 0
+        ids = sorted(set(ids))
+        definicao = get_tabela(tabela)
+        gravados = 0
+        for inicio in range(0, len(ids), self.tamanho_lote):
+            lote = ids[inicio:inicio + self.tamanho_lote]
+            with transaction.atomic():
+                variacao_termos = Counter()
+                comprimentos_antigos = {}
+                for objeto_id, termo, comprimento in TermoRAG.objects.filter(
+                    tabela=tabela, objeto_id__in=lote
+                ).values_list('objeto_id', 'termo', 'comprimento'):
+                    variacao_termos[termo] -= 1
+                    comprimentos_antigos[objeto_id] = comprimento
+                TermoRAG.objects.filter(tabela=tabela, objeto_id__in=lote).delete()
+
+                documentos = self._documentos(tabela, definicao.get_queryset().filter(pk__in=lote))
+                termos = []
+                for objeto_id, contagem in documentos:
+                    comprimento = sum(contagem.values())
+                    variacao_termos.update(contagem.keys())
+                    termos.extend(
+                        TermoRAG(termo=termo, tabela=tabela, objeto_id=objeto_id,
+                                 frequencia=frequencia, comprimento=comprimento)
+                        for termo, frequencia in contagem.items()
+                    )
+                TermoRAG.objects.bulk_create(termos, batch_size=self.tamanho_lote, ignore_conflicts=True)
+
+                _somar_termos(variacao_termos)
+                _somar(
+                    EstatisticaTabelaRAG, {'tabela': tabela},
+                    documentos=len(documentos) - len(comprimentos_antigos),
+                    termos=sum(sum(contagem.values()) for _, contagem in documentos) - sum(comprimentos_antigos.values()),
+                )
+            gravados += len(termos)
+        return gravados
+
+    def construir(self, tabelas: Optional[List[str]] = None) -> Dict[str, int]:
+        """
+        Reconstrói o índice das tabelas (padrão: todas), lendo os registros em
+        streaming, e recalcula as estatísticas do BM25. Cada tabela é trocada
+        em uma transação. Retorna a quantidade de termos gravados por tabela.
+        """
+        resumo = {}
+        for definicao in TABELAS_RAG:
+            if tabelas and definicao.nome not in tabelas:
+                continue
+            totais = Counter()
+            with transaction.atomic():
+                TermoRAG.objects.filter(tabela=definicao.nome).delete()
+                lote = []
+                for obj in definicao.get_queryset().iterator(chunk_size=self.tamanho_lote):
+                    lote.append(obj)
+                    if len(lote) >= self.tamanho_lote:
+                        totais.update(self._gravar_lote(definicao.nome, lote))
+                        lote = []
+                totais.update(self._gravar_lote(definicao.nome, lote))
+                EstatisticaTabelaRAG.objects.update_or_create(
+                    tabela=definicao.nome,
+                    defaults={'documentos': totais['documentos'], 'termos': totais['termos']},
+                )
+            resumo[definicao.nome] = totais['linhas']
+            self._tabelas_prontas.add(definicao.nome)
+        self._recalcular_frequencias()
+        return resumo
+
+    def _gravar_lote(self, tabela: str, objetos: List) -> Dict[str, int]:
+        """
+        Insere os termos de registros que ainda não estão no índice (sem o ORM:
+        reconstruções grandes). Retorna linhas gravadas, registros e total de termos.
+        """
+        documentos = self._documentos(tabela, objetos)
+        linhas = []
+        termos = 0
+        for objeto_id, contagem in documentos:
+            comprimento = sum(contagem.values())
+            termos += comprimento
+            linhas.extend((termo, tabela, objeto_id, frequencia, comprimento) for termo, frequencia in contagem.items())
+        if linhas:
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"INSERT INTO {TermoRAG._meta.db_table} (termo, tabela, objeto_id, frequencia, comprimento) "
+                    "VALUES (%s, %s, %s, %s, %s)",
+                    linhas,
+                )
+        return {'linhas': len(linhas), 'documentos': len(documentos), 'termos': termos}
+
+    def _recalcular_frequencias(self):
+        """Registros por termo, de todas as tabelas, a partir do índice"""
+        with transaction.atomic():
+            EstatisticaTermoRAG.objects.all().delete()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {EstatisticaTermoRAG._meta.db_table} (termo, documentos) "
+                    f"SELECT termo, COUNT(*) FROM {TermoRAG._meta.db_table} GROUP BY termo"
+                )
+
+    def _garantir_indexadas(self, tabelas: List[str]) -> List[str]:
+        """
+        Tabelas já indexadas. As que ainda não foram são construídas em segundo
+        plano; até lá, a busca nelas usa os filtros icontains (_pontuar_sem_indice)
+        """
+        pendentes = [tabela for tabela in tabelas if tabela not in self._tabelas_prontas]
+        if pendentes:
+            self._tabelas_prontas.update(
+                EstatisticaTabelaRAG.objects.filter(tabela__in=pendentes).values_list('tabela', flat=True)
+            )
+            faltando = [tabela for tabela in pendentes if tabela not in self._tabelas_prontas]
+            if faltando and self.construcao_automatica:
+                self._construir_em_segundo_plano(faltando)
+        return [tabela for tabela in tabelas if tabela in self._tabelas_prontas]
+
+    def _construir_em_segundo_plano(self, tabelas: List[str]):
+        """Constrói as tabelas em uma thread, se nenhuma construção estiver rodando neste processo"""
+        with self._lock:
+            if self._construcao is not None and self._construcao.is_alive():
+                return
+            self._construcao = threading.Thread(
+                target=self._construir_pendentes, args=(tabelas,), name='rag-palavras', daemon=True
+            )
+            self._construcao.start()
+
+    def _construir_pendentes(self, tabelas: List[str]):
+        try:
+            # Outro processo pode ter construído alguma enquanto isso
+            prontas = set(EstatisticaTabelaRAG.objects.filter(tabela__in=tabelas).values_list('tabela', flat=True))
+            faltando = [tabela for tabela in tabelas if tabela not in prontas]
+            if faltando:
+                self.construir(faltando)
+        except Exception as e:
+            print(f"Erro ao construir o índice de palavras-chave: {str(e)}")
+        finally:
+            connection.close()
+
+    def _pontuar_sem_indice(self, query: str, tabela: str) -> Dict[int, float]:
+        """
+        Busca de uma tabela ainda não indexada, como antes do índice: registros
+        com alguma palavra da pergunta (3+ letras) em algum dos campos_busca
+        (icontains), pontuados pela quantidade de palavras encontradas
+        """
+        definicao = get_tabela(tabela)
+        palavras = list(dict.fromkeys(
+            palavra.strip('.-/') for palavra in re.split(r'[^\w@.\-/]+', query.lower())
+        ))
+        palavras = [palavra for palavra in palavras if len(palavra) >= TAMANHO_MINIMO]
+        if not palavras or not definicao.campos_busca:
+            return {}
+        condicao = Q()
+        for palavra in palavras:
+            for campo in definicao.campos_busca:
+                condicao |= Q(**{f'{campo}__icontains': palavra})
+        linhas = definicao.model.objects.filter(condicao, ativo=True).order_by('-pk').values_list(
+            'pk', *definicao.campos_busca
+        )[:self.max_ocorrencias]
+        pontos = {}
+        for objeto_id, *valores in linhas:
+            texto = dobrar(' '.join(str(valor) for valor in valores if valor))
+            pontos[objeto_id] = float(max(sum(1 for palavra in palavras if dobrar(palavra) in texto), 1))
+        return pontos
+
+    def _condicao(self, termo: str) -> Q:
+        """Igualdade, ou prefixo para termos longos - ambos percorrem só um trecho do índice"""
+        if len(termo) >= TAMANHO_MINIMO_PREFIXO:
+            return Q(termo__gte=termo, termo__lt=termo + '\uffff')
+        return Q(termo=termo)
+
+    def pontuar(self, query: str, tabelas: Optional[List[str]] = None) -> Dict[str, Dict[int, float]]:
+        """
+        Pontuação BM25 dos registros que contêm palavras da pergunta, por tabela.
+
+        Termos raros têm todas as ocorrências lidas. Termos frequentes (mais de
+        `max_ocorrencias`) contribuem, em cada tabela, com as ocorrências mais
+        recentes da palavra exata e são conferidos nos registros encontrados
+        (interseção): o custo da busca não cresce com o tamanho das tabelas.
+        """
+        grupos = grupos_pergunta(query)
+        if not grupos:
+            return {}
+        termos_pergunta = sorted(set().union(*grupos))
+        tabelas = tabelas or [definicao.nome for definicao in TABELAS_RAG]
+        prontas = self._garantir_indexadas(tabelas)
+        pontuacoes: Dict[str, Dict[int, float]] = {}
+        for tabela in tabelas:
+            if tabela not in prontas:
+                pontos = self._pontuar_sem_indice(query, tabela)
+                if pontos:
+                    pontuacoes[tabela] = pontos
+        if not prontas:
+            return pontuacoes
+        tabelas = prontas
+        selecionadas = set(tabelas)
+
+        # Termos da pergunta (bits) que cada termo do índice satisfaz
+        casamentos: Dict[str, int] = {}
+        # (tabela, id) -> [tamanho do registro, {termo: frequência}]
+        encontrados: Dict[Tuple[str, int], list] = {}
+        colunas = ('termo', 'tabela', 'objeto_id', 'frequencia', 'comprimento')
+
+        def acumular(postings):
+            for termo, tabela, objeto_id, frequencia, comprimento in postings:
+                if tabela not in selecionadas:
+                    continue
+                if termo not in casamentos:
+                    casamentos[termo] = sum(
+                        1 << posicao
+                        for posicao, termo_pergunta in enumerate(termos_pergunta)
+                        if termo == termo_pergunta or (
+                            len(termo_pergunta) >= TAMANHO_MINIMO_PREFIXO and termo.startswith(termo_pergunta)
+                        )
+                    )
+                encontrados.setdefault((tabela, objeto_id), [comprimento, {}])[1][termo] = frequencia
+
+        # Sem filtro de tabela no SQL: o banco percorre só o trecho dos termos no índice
+        raros, frequentes = Q(), {}
+        for termo in termos_pergunta:
+            condicao = self._condicao(termo)
+            if TermoRAG.objects.filter(condicao)[:self.max_ocorrencias + 1].count() > self.max_ocorrencias:
+                frequentes[termo] = condicao
+            else:
+                raros |= condicao
+        if raros:
+            acumular(TermoRAG.objects.filter(raros).values_list(*colunas))
+
+        if frequentes:
+            # Palavra exata e tabela fixas: o banco lê o índice de trás para frente, sem ordenar
+            for termo in frequentes:
+                for tabela in tabelas:
+                    acumular(TermoRAG.objects.filter(termo=termo, tabela=tabela).order_by('-objeto_id').values_list(
+                        *colunas
+                    )[:self.max_ocorrencias])
+
+            # Interseção: quais termos frequentes cada registro encontrado também contém
+            filtro_frequentes = Q()
+            for condicao in frequentes.values():
+                filtro_frequentes |= condicao
+            ids_por_tabela: Dict[str, List[int]] = {}
+            for tabela, objeto_id in encontrados:
+                ids_por_tabela.setdefault(tabela, []).append(objeto_id)
+            for tabela, ids in ids_por_tabela.items():
+                ids.sort()
+                for inicio in range(0, len(ids), 500):
+                    acumular(TermoRAG.objects.filter(
+                        filtro_frequentes, tabela=tabela, objeto_id__in=ids[inicio:inicio + 500]
+                    ).values_list(*colunas))
+
+        pontuacoes.update(self._bm25(grupos, termos_pergunta, casamentos, encontrados))
+        return pontuacoes
+
+    def _bm25(self, grupos: List[Set[str]], termos_pergunta: List[str], casamentos: Dict[str, int],
+              encontrados: Dict[Tuple[str, int], list]) -> Dict[str, Dict[int, float]]:
+        if not encontrados:
+            return {}
+        corpus = EstatisticaTabelaRAG.objects.aggregate(documentos=Sum('documentos'), termos=Sum('termos'))
+        total_documentos = max(corpus['documentos'] or 0, 1)
+        tamanho_medio = max((corpus['termos'] or 0) / total_documentos, 1.0)
+        termos_indice = list(casamentos)
+        frequencias_documento = {}
+        for inicio in range(0, len(termos_indice), 500):
+            frequencias_documento.update(EstatisticaTermoRAG.objects.filter(
+                termo__in=termos_indice[inicio:inicio + 500]
+            ).values_list('termo', 'documentos'))
+        idf = {
+            termo: bm25_idf(max(frequencias_documento.get(termo, 1), 1), total_documentos)
+            for termo in termos_indice
+        }
+        mascaras = [sum(1 << termos_pergunta.index(termo) for termo in grupo) for grupo in grupos]
+
+        pontuacoes: Dict[str, Dict[int, float]] = {}
+        for (tabela, objeto_id), (comprimento, termos) in encontrados.items():
+            normalizacao = BM25_K1 * (1 - BM25_B + BM25_B * comprimento / tamanho_medio)
+            # Melhor termo do registro para cada termo da pergunta (prefixos podem casar com vários)
+            melhores = [0.0] * len(termos_pergunta)
+            bits = 0
+            for termo, frequencia in termos.items():
+                casados = casamentos[termo]
+                if not casados:
+                    continue
+                bits |= casados
+                peso = idf[termo] * frequencia * (BM25_K1 + 1) / (frequencia + normalizacao)
+                for posicao, termo_pergunta in enumerate(termos_pergunta):
+                    if casados >> posicao & 1:
+                        peso_termo = peso if termo == termo_pergunta else peso * PESO_PREFIXO
+                        melhores[posicao] = max(melhores[posicao], peso_termo)
+            # Só contam as palavras da pergunta com todos os seus termos no registro
+            pontos = 0.0
+            for mascara in mascaras:
+                if bits & mascara == mascara:
+                    pontos += sum(melhores[posicao] for posicao in range(len(termos_pergunta)) if mascara >> posicao & 1)
+            if pontos:
+                pontuacoes.setdefault(tabela, {})[objeto_id] = pontos
+        return pontuacoes
+
+    def buscar(self, query: str, tabelas: Optional[List[str]] = None) -> Dict[str, List[int]]:
+        """
+        IDs dos registros que contêm palavras da pergunta, por tabela, do mais
+        relevante (BM25) para o menos
+        """
+        return {tabela: ordenar_por_pontuacao(pontos) for tabela, pontos in self.pontuar(query, tabelas).items()}
+
+
+indice_palavras = IndicePalavrasChave(
+    max_ocorrencias=getattr(settings, 'RAG_PALAVRAS_MAX_OCORRENCIAS', 500),
+    construcao_automatica=getattr(settings, 'RAG_PALAVRAS_CONSTRUCAO_AUTOMATICA', True),
+)
+
+
+class FilaPalavras(FilaReindexacao):
+    """
+    Fila de registros pendentes de reindexação no índice de palavras-chave: as
+    alterações são agrupadas e gravadas em lotes, fora da transação de quem grava,
+    e os documentos dependentes (contas do fornecedor/cliente) também vão para a fila
+    """
+
+    NOME_THREAD = 'rag-palavras'
+
+    def _preparar(self):
+        pass
+
+    def _processar(self, pendentes: Dict[str, Set[int]]):
+        try:
+            expandir_dependentes(pendentes)
+            for tabela, ids in pendentes.items():
+                indice_palavras.indexar(tabela, ids)
+        except Exception as e:
+            print(f"Erro ao indexar palavras-chave: {str(e)}")
+        finally:
+            connection.close()
+
+
+fila_palavras = FilaPalavras(
+    atraso=getattr(settings, 'RAG_REINDEXACAO_ATRASO', 2.0),
+    tamanho_lote=getattr(settings, 'RAG_REINDEXACAO_LOTE', 1000),
+)
+
+atexit.register(fila_palavras.esvaziar)
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Reindexação incremental do índice de embeddings
+
+Os signals (ver signals.py) enfileiram (tabela, id) dos registros alterados
+depois que a transação é confirmada. Uma thread de fundo agrupa os pedidos
+durante uma pequena janela de tempo e reindexa em lotes: várias alterações
+do mesmo registro viram uma só, e uma importação em massa gera poucos lotes
+grandes de codificação em vez de uma chamada por registro.
+
+O que estiver pendente ao encerrar o processo é processado no atexit; por isso o
+serviço de embeddings é carregado no primeiro pedido, antes do encerramento.
+"""
+
+import atexit
+import threading
+from typing import Dict, Iterable, Set
+
+from django.conf import settings
+from django.db import connection
+
+from .documentos import get_tabela
+
+
+# Documentos que incluem dados de outra tabela: (tabela dependente, campo da chave estrangeira)
+DEPENDENTES = {
+    'fornecedores': [('contas_pagar', 'fornecedor')],
+    'clientes': [('contas_receber', 'cliente')],
+}
+
+
+def expandir_dependentes(pendentes: Dict[str, Set[int]]):
+    """Inclui nos pendentes os documentos que têm dados dos registros alterados (ex.: contas a pagar do fornecedor)"""
+    for tabela, ids in list(pendentes.items()):
+        for tabela_dependente, campo in DEPENDENTES.get(tabela, []):
+            relacionados = get_tabela(tabela_dependente).model.objects.filter(
+                **{f'{campo}_id__in': list(ids)}
+            ).values_list('pk', flat=True)
+            pendentes.setdefault(tabela_dependente, set()).update(relacionados)
+
+
+class FilaReindexacao:
+    """
+    Fila de registros pendentes de reindexação, agrupados por tabela
+    """
+
+    NOME_THREAD = 'rag-reindexacao'
+
+    def __init__(self, atraso: float = 2.0, tamanho_lote: int = 1000):
+        self.atraso = atraso
+        self.tamanho_lote = tamanho_lote
+        self._pendentes: Dict[str, Set[int]] = {}
+        self._condicao = threading.Condition()
+        self._thread = None
+        self._service = None
+
+    def enfileirar(self, tabela: str, ids: Iterable[int]):
+        """Agenda a reindexação dos registros informados"""
+        with self._condicao:
+            self._pendentes.setdefault(tabela, set()).update(ids)
+            self._iniciar_thread()
+            if self._total_pendente() >= self.tamanho_lote:
+                self._condicao.notify()
+
+    def _total_pendente(self) -> int:
+        return sum(len(ids) for ids in self._pendentes.values())
+
+    def _iniciar_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._preparar()
+            self._thread = threading.Thread(target=self._executar, name=self.NOME_THREAD, daemon=True)
+            self._thread.start()
+
+    def _executar(self):
+        while True:
+            with self._condicao:
+                while not self._pendentes:
+                    self._condicao.wait()
+                # Janela de agrupamento: espera mais alterações, a menos que o lote já esteja cheio
+                if self._total_pendente() < self.tamanho_lote:
+                    self._condicao.wait(self.atraso)
+                pendentes, self._pendentes = self._pendentes, {}
+            self._processar(pendentes)
+
+    def esvaziar(self):
+        """Processa imediatamente tudo que está pendente (usado ao encerrar o processo)"""
+        with self._condicao:
+            pendentes, self._pendentes = self._pendentes, {}
+        if pendentes:
+            self._processar(pendentes)
+
+    def _preparar(self):
+        """
+        Carrega já o serviço (e o que ele importa, como concurrent.futures.process):
+        no atexit não é mais possível importá-lo e a reindexação pendente seria perdida
+        """
+        try:
+            self._get_service()
+        except Exception as e:
+            print(f"Erro ao carregar o serviço de embeddings: {str(e)}")
+
+    def _get_service(self):
+        if self._service is None:
+            from .services import RAGEmbeddingsService
+            self._service = RAGEmbeddingsService()
+        return self._service
+
+    def _processar(self, pendentes: Dict[str, Set[int]]):
+        try:
+            service = self._get_service()
+            if not service.backend.disponivel():
+                return
+
+            expandir_dependentes(pendentes)
+
+            for tabela, ids in pendentes.items():
+                ids = sorted(ids)
+                definicao = get_tabela(tabela)
+                for inicio in range(0, len(ids), self.tamanho_lote):
+                    lote = ids[inicio:inicio + self.tamanho_lote]
+                    objetos = list(definicao.get_queryset().filter(pk__in=lote))
+                    service.indice.indexar_objetos(tabela, objetos)
+                    # Registros inativados ou excluídos saem do índice
+                    encontrados = {obj.pk for obj in objetos}
+                    service.indice.remover(tabela, [pk for pk in lote if pk not in encontrados])
+        except Exception as e:
+            print(f"Erro ao reindexar embeddings: {str(e)}")
+        finally:
+            connection.close()
+
+
+fila_reindexacao = FilaReindexacao(
+    atraso=getattr(settings, 'RAG_REINDEXACAO_ATRASO', 2.0),
+    tamanho_lote=getattr(settings, 'RAG_REINDEXACAO_LOTE', 1000),
+)
+
+atexit.register(fila_reindexacao.esvaziar)
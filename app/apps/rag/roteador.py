@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Roteador de intenção do RAG Simples
+
+Escolhe, por regras e palavras com peso, quais tabelas uma pergunta envolve
+("fornecedores de insumos" -> fornecedores, tipos de despesa) e se o bloco de
+estatísticas entra no contexto. A busca só consulta as tabelas escolhidas.
+
+Cada tabela soma os pesos das palavras da pergunta que começam por um de seus
+termos ("fornecedores" casa com "fornecedor"). Entram as tabelas com pelo
+menos LIMIAR_RELATIVO da maior pontuação; sem nenhum termo reconhecido
+("quem é João da Silva?") a pergunta vai para todas as tabelas, como antes.
+A rota de cada pergunta é registrada no log (logger apps.rag.roteador).
+"""
+
+import logging
+import re
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+from .documentos import TABELAS_RAG
+from .palavras_chave import dobrar
+
+
+logger = logging.getLogger(__name__)
+
+
+# Termos já usados pelas buscas das tabelas (e pelo bloco de estatísticas)
+TERMOS_QUANTIDADE = ['quantos', 'quantas', 'quantidade', 'total', 'qtd', 'contar', 'contagem']
+TERMOS_CONTAS_PAGAR = ['pagar', 'pagamento', 'conta', 'nota', 'fiscal', 'fornecedor', 'despesa', 'parcela', 'parcelas', 'vencimento', 'vencida']
+TERMOS_CONTAS_RECEBER = ['receber', 'recebimento', 'conta', 'cliente', 'receita', 'parcela', 'parcelas', 'vencimento', 'vencida']
+TERMOS_PARCELAS = ['parcela', 'parcelas', 'vencimento', 'vencida', 'pagar', 'pagamento', 'pendente']
+
+
+def _pesos(termos: List[str], **fortes) -> Dict[str, int]:
+    """Peso 1 para cada termo da lista; os termos nomeados recebem o peso informado"""
+    pesos = {termo: 1 for termo in termos}
+    pesos.update(fortes)
+    return pesos
+
+
+# Pesos por tabela: 3 = nome da entidade, 2 = atributo típico, 1 = termo relacionado
+PESOS_TABELAS = {
+    'clientes': _pesos(['cpf', 'nascimento', 'aniversario'], cliente=3, comprador=2),
+    'fornecedores': _pesos(['empresa', 'razao'], fornecedor=3, cnpj=2, fantasia=2),
+    'faturados': _pesos(['cpf', 'emitid'], faturado=3),
+    'contas_pagar': _pesos(TERMOS_CONTAS_PAGAR, pagar=3, despesa=2, nota=2, fiscal=2),
+    'contas_receber': _pesos(TERMOS_CONTAS_RECEBER, receber=3, recebimento=3, receita=2),
+    'parcelas': _pesos(TERMOS_PARCELAS, parcela=3, vencimento=2, vencida=2),
+    'tipos_despesa': _pesos(
+        ['tipo', 'insumo', 'semente', 'fertilizante', 'defensivo', 'combustive', 'manutencao',
+         'frete', 'energia', 'arrendamento', 'seguro', 'imposto', 'honorario', 'investimento'],
+        categoria=3, classificacao=2, despesa=2,
+    ),
+    'tipos_receita': _pesos(['tipo', 'classificacao'], receita=2),
+    'processamentos_pdf': _pesos(
+        ['documento', 'boleto'], pdf=3, arquivo=2, processamento=2, processad=2, extracao=2, extraid=2, upload=2,
+    ),
+}
+
+
+class Rota:
+    """
+    Tabelas que uma pergunta envolve e se ela pede o bloco de estatísticas
+    """
+
+    def __init__(self, tabelas: List[str], estatisticas: bool, pontuacoes: Dict[str, int]):
+        self.tabelas = tabelas
+        self.estatisticas = estatisticas
+        self.pontuacoes = pontuacoes
+
+    @property
+    def todas(self) -> bool:
+        return len(self.tabelas) == len(TABELAS_RAG)
+
+    def __repr__(self) -> str:
+        return f"Rota(tabelas={self.tabelas}, estatisticas={self.estatisticas})"
+
+
+class RoteadorIntencao:
+    """
+    Classificador de intenção por palavras com peso
+    """
+
+    LIMIAR_RELATIVO = 0.5
+
+    def __init__(self, ativo: bool = True, pesos: Optional[Dict[str, Dict[str, int]]] = None):
+        self.ativo = ativo
+        self.pesos = pesos or PESOS_TABELAS
+
+    def pontuar(self, pergunta: str) -> Dict[str, int]:
+        """Pontuação de cada tabela com pelo menos um termo na pergunta"""
+        palavras = re.findall(r'\w+', dobrar(pergunta))
+        pontuacoes = {}
+        for tabela, pesos in self.pesos.items():
+            pontos = sum(
+                max((peso for termo, peso in pesos.items() if palavra.startswith(termo)), default=0)
+                for palavra in palavras
+            )
+            if pontos:
+                pontuacoes[tabela] = pontos
+        return pontuacoes
+
+    def classificar(self, pergunta: str) -> Rota:
+        """Rota da pergunta; tabelas na ordem de TABELAS_RAG"""
+        estatisticas = any(termo in pergunta.lower() for termo in TERMOS_QUANTIDADE)
+        pontuacoes = self.pontuar(pergunta) if self.ativo else {}
+
+        if pontuacoes:
+            minimo = max(pontuacoes.values()) * self.LIMIAR_RELATIVO
+            tabelas = [d.nome for d in TABELAS_RAG if pontuacoes.get(d.nome, 0) >= minimo]
+        else:
+            tabelas = [d.nome for d in TABELAS_RAG]
+
+        rota = Rota(tabelas, estatisticas, pontuacoes)
+        logger.info(
+            "Rota RAG: tabelas=%s estatisticas=%s pontuacoes=%s pergunta=%r",
+            'todas' if rota.todas else ','.join(tabelas), estatisticas, pontuacoes, pergunta[:200],
+        )
+        return rota
+
+
+roteador = RoteadorIntencao(ativo=getattr(settings, 'RAG_ROTEADOR_ATIVO', True))
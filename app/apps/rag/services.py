@@ -5,11 +5,15 @@ Serviços RAG - Retrieval-Augmented Generation
 
 import json
 import time
-import requests
-from typing import Dict, Any, List, Optional
-from django.db.models import Q
-from django.db import models
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Dict, Any, Hashable, Iterator, List, Optional, Tuple
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, connection, models
+from django.utils import timezone
 
+from apps.core.cliente_http import cliente_http
 # Importar modelos do banco de dados
 from apps.clientes.models import Cliente
 from apps.fornecedores.models import Fornecedor
@@ -21,6 +25,81 @@ from apps.tipos_receita.models import TipoReceita
 from apps.faturados.models import Faturado
 from apps.pdf_processor.models import ProcessamentoPDF
 
+from .documentos import TABELAS_RAG, get_tabela
+from .indice import IndiceEmbeddings
+from .backends_embeddings import MODELO_PADRAO, get_backend
+from .cache import cache_embeddings_perguntas, normalizar_pergunta
+from .consulta_sql import SQLInvalido, descrever_esquema, executar_somente_leitura, extrair_sql, formatar_resultado, limites
+from .contexto import ConstrutorContexto, estimar_tokens
+from .estatisticas import estatisticas_rag
+from .medicao import MedicaoEtapas
+from .palavras_chave import indice_palavras, ordenar_por_pontuacao, tokenizar
+from .roteador import TERMOS_CONTAS_PAGAR, TERMOS_CONTAS_RECEBER, TERMOS_PARCELAS, roteador
+
+
+# Threads para as buscas que rodam em paralelo (tabelas do RAG Simples, palavras-chave do
+# RAG Híbrido); o limite vale para o processo todo, não por requisição
+_executor_buscas = ThreadPoolExecutor(max_workers=getattr(settings, 'RAG_BUSCA_THREADS', 8), thread_name_prefix='rag-busca')
+
+
+def _em_thread(funcao, *args):
+    """Executa funcao no executor, liberando a conexão com o banco aberta pela thread"""
+    try:
+        return funcao(*args)
+    finally:
+        close_old_connections()
+
+
+@contextmanager
+def _limite_tempo_banco(limite: Optional[float]):
+    """
+    Interrompe as consultas da conexão desta thread depois do instante `limite`
+    (time.monotonic): progress handler no SQLite, statement_timeout no PostgreSQL.
+    Uma thread do executor não pode ser cancelada; sem o limite no banco, uma
+    busca lenta a ocuparia até o fim, mesmo depois de a requisição desistir dela
+    """
+    if limite is None:
+        yield
+        return
+    connection.ensure_connection()
+    if connection.vendor == 'sqlite':
+        conexao = connection.connection
+        conexao.set_progress_handler(lambda: 1 if time.monotonic() > limite else 0, 10000)
+        try:
+            yield
+        finally:
+            conexao.set_progress_handler(None, 0)
+    elif connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SET statement_timeout = %s", [max(int((limite - time.monotonic()) * 1000), 1)])
+        try:
+            yield
+        finally:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("RESET statement_timeout")
+            except Exception:
+                # Sem conseguir desfazer o limite, a conexão não volta a ser usada
+                connection.close()
+    else:
+        yield
+
+
+def _em_thread_limitado(limite: Optional[float], funcao, *args):
+    """_em_thread com as consultas ao banco interrompidas em `limite`; se ele já passou, nem começa"""
+    def executar():
+        if limite is not None and time.monotonic() >= limite:
+            raise TimeoutError("tempo esgotado antes de começar")
+        with _limite_tempo_banco(limite):
+            return funcao(*args)
+    return _em_thread(executar)
+
+
+def _limite_busca() -> Optional[float]:
+    """Instante (time.monotonic) em que as buscas iniciadas agora são interrompidas (RAG_BUSCA_TIMEOUT)"""
+    timeout = getattr(settings, 'RAG_BUSCA_TIMEOUT', 5.0)
+    return time.monotonic() + timeout if timeout else None
+
 
 class GeminiService:
     """
@@ -33,6 +112,7 @@ class GeminiService:
         from decouple import config
         self.api_key = config('GEMINI_API_KEY', default=os.environ.get('GEMINI_API_KEY', ''))
         self.base_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+        self.stream_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:streamGenerateContent"
     
     def generate_response(self, prompt: str) -> str:
         """
@@ -53,7 +133,7 @@ class GeminiService:
             
             url = f"{self.base_url}?key={self.api_key}"
             
-            response = requests.post(url, json=data, headers=headers, timeout=60)
+            response = cliente_http.post(url, json=data, headers=headers, timeout_leitura=60)
             
             if response.status_code == 200:
                 result = response.json()
@@ -69,35 +149,79 @@ class GeminiService:
                 
         except Exception as e:
             raise Exception(f"Erro ao gerar resposta: {str(e)}")
+    
+    def generate_response_stream(self, prompt: str) -> Iterator[str]:
+        """
+        Gera resposta usando Gemini AI, devolvendo os trechos do texto à medida
+        que o modelo os produz (streamGenerateContent com alt=sse)
+        """
+        try:
+            data = {
+                "contents": [{
+                    "parts": [{
+                        "text": prompt
+                    }]
+                }]
+            }
+            
+            headers = {
+                "Content-Type": "application/json"
+            }
+            
+            url = f"{self.stream_url}?alt=sse&key={self.api_key}"
+            
+            with cliente_http.post(url, json=data, headers=headers, timeout_leitura=60, stream=True) as response:
+                if response.status_code != 200:
+                    raise Exception(f"Erro na API do Gemini: {response.status_code} - {response.text}")
+                
+                # Cada evento é uma linha "data: {...}" com um GenerateContentResponse parcial
+                for linha in response.iter_lines(chunk_size=None):
+                    if not linha.startswith(b'data:'):
+                        continue
+                    result = json.loads(linha[5:].decode('utf-8'))
+                    for candidate in result.get('candidates', [])[:1]:
+                        for part in candidate.get('content', {}).get('parts', []):
+                            if part.get('text'):
+                                yield part['text']
+                
+        except Exception as e:
+            raise Exception(f"Erro ao gerar resposta: {str(e)}")
 
 
 class RAGSimpleService:
     """
     Serviço RAG Simples - Busca por palavras-chave no banco de dados
+    (índice invertido - ver palavras_chave.py)
     """
     
-    def __init__(self):
+    def __init__(self, medicao: Optional[MedicaoEtapas] = None):
         self.gemini_service = GeminiService()
+        self.medicao = medicao or MedicaoEtapas()
     
-    def _buscar_clientes(self, query: str) -> List[Dict]:
+    def _registros_encontrados(self, tabela: str, query: str, encontrados: Optional[List[int]],
+                               limite: int, queryset=None) -> List:
+        """
+        Registros da tabela que contêm palavras da pergunta, do mais relevante para o menos.
+        encontrados: IDs já buscados no índice (None = buscar agora)
+        """
+        if encontrados is None:
+            encontrados = indice_palavras.buscar(query, [tabela]).get(tabela, [])
+        ids = encontrados[:limite]
+        if not ids:
+            return []
+        if queryset is None:
+            queryset = get_tabela(tabela).model.objects.all()
+        por_id = queryset.filter(ativo=True).in_bulk(ids)
+        return [por_id[pk] for pk in ids if pk in por_id]
+    
+    def _buscar_clientes(self, query: str, encontrados: Optional[List[int]] = None) -> List[Dict]:
         """Busca clientes por palavras-chave"""
         try:
-            palavras = query.lower().split()
-            q_objects = Q()
-            
-            # Termos relacionados a clientes
-            termos_clientes = ['cliente', 'clientes', 'pessoa', 'cpf']
-            tem_termo_relacionado = any(termo in query.lower() for termo in termos_clientes)
-            
-            for palavra in palavras:
-                if len(palavra) > 2:  # Ignorar palavras muito curtas
-                    q_objects |= Q(nome__icontains=palavra) | Q(cpf__icontains=palavra) | Q(email__icontains=palavra)
-            
-            # Se tiver termo relacionado mas não encontrou nada, buscar alguns clientes
-            if tem_termo_relacionado and not q_objects:
+            # Sem palavras para buscar, trazer alguns clientes
+            if not tokenizar(query):
                 clientes = Cliente.objects.filter(ativo=True)[:10]
             else:
-                clientes = Cliente.objects.filter(q_objects, ativo=True)[:10]
+                clientes = self._registros_encontrados('clientes', query, encontrados, 10)
             
             resultados = []
             for cliente in clientes:
@@ -116,25 +240,14 @@ class RAGSimpleService:
             print(f"Erro ao buscar clientes: {str(e)}")
             return []
     
-    def _buscar_fornecedores(self, query: str) -> List[Dict]:
+    def _buscar_fornecedores(self, query: str, encontrados: Optional[List[int]] = None) -> List[Dict]:
         """Busca fornecedores por palavras-chave"""
         try:
-            palavras = query.lower().split()
-            q_objects = Q()
-            
-            # Termos relacionados a fornecedores
-            termos_fornecedores = ['fornecedor', 'fornecedores', 'empresa', 'cnpj', 'fornecedor']
-            tem_termo_relacionado = any(termo in query.lower() for termo in termos_fornecedores)
-            
-            for palavra in palavras:
-                if len(palavra) > 2:  # Ignorar palavras muito curtas
-                    q_objects |= Q(razao_social__icontains=palavra) | Q(fantasia__icontains=palavra) | Q(cnpj__icontains=palavra)
-            
-            # Se tiver termo relacionado mas não encontrou nada, buscar alguns fornecedores
-            if tem_termo_relacionado and not q_objects:
+            # Sem palavras para buscar, trazer alguns fornecedores
+            if not tokenizar(query):
                 fornecedores = Fornecedor.objects.filter(ativo=True)[:10]
             else:
-                fornecedores = Fornecedor.objects.filter(q_objects, ativo=True)[:10]
+                fornecedores = self._registros_encontrados('fornecedores', query, encontrados, 10)
             
             resultados = []
             for fornecedor in fornecedores:
@@ -153,25 +266,21 @@ class RAGSimpleService:
             print(f"Erro ao buscar fornecedores: {str(e)}")
             return []
     
-    def _buscar_contas_pagar(self, query: str) -> List[Dict]:
+    def _buscar_contas_pagar(self, query: str, encontrados: Optional[List[int]] = None) -> List[Dict]:
         """Busca contas a pagar por palavras-chave"""
         try:
-            palavras = query.lower().split()
-            q_objects = Q()
-            
             # Termos relacionados a contas a pagar (incluindo parcelas)
-            termos_contas = ['pagar', 'pagamento', 'conta', 'nota', 'fiscal', 'fornecedor', 'despesa', 'parcela', 'parcelas', 'vencimento', 'vencida']
-            tem_termo_relacionado = any(termo in query.lower() for termo in termos_contas)
+            tem_termo_relacionado = any(termo in query.lower() for termo in TERMOS_CONTAS_PAGAR)
             
-            # Se tiver termo relacionado a parcelas/pagamentos, buscar todas as contas
-            if tem_termo_relacionado:
-                contas = ContaPagar.objects.filter(ativo=True).select_related('fornecedor', 'faturado').prefetch_related('parcelas')[:20]
+            queryset = ContaPagar.objects.filter(ativo=True).select_related('fornecedor', 'faturado').prefetch_related('parcelas')
+            
+            if not tokenizar(query):
+                contas = queryset[:20]
             else:
-                for palavra in palavras:
-                    if len(palavra) > 2:  # Ignorar palavras muito curtas
-                        q_objects |= Q(numero_nota_fiscal__icontains=palavra) | Q(descricao_produtos__icontains=palavra) | Q(fornecedor__razao_social__icontains=palavra)
-                
-                contas = ContaPagar.objects.filter(q_objects, ativo=True).select_related('fornecedor', 'faturado').prefetch_related('parcelas')[:20]
+                contas = self._registros_encontrados('contas_pagar', query, encontrados, 20, queryset)
+                # Se tiver termo relacionado a parcelas/pagamentos, completar com as demais contas
+                if tem_termo_relacionado and len(contas) < 20:
+                    contas += list(queryset.exclude(pk__in=[conta.pk for conta in contas])[:20 - len(contas)])
             
             resultados = []
             for conta in contas:
@@ -208,25 +317,21 @@ class RAGSimpleService:
             print(f"Erro ao buscar contas a pagar: {str(e)}")
             return []
     
-    def _buscar_contas_receber(self, query: str) -> List[Dict]:
+    def _buscar_contas_receber(self, query: str, encontrados: Optional[List[int]] = None) -> List[Dict]:
         """Busca contas a receber por palavras-chave"""
         try:
-            palavras = query.lower().split()
-            q_objects = Q()
-            
             # Termos relacionados a contas a receber (incluindo parcelas)
-            termos_contas = ['receber', 'recebimento', 'conta', 'cliente', 'receita', 'parcela', 'parcelas', 'vencimento', 'vencida']
-            tem_termo_relacionado = any(termo in query.lower() for termo in termos_contas)
+            tem_termo_relacionado = any(termo in query.lower() for termo in TERMOS_CONTAS_RECEBER)
             
-            # Se tiver termo relacionado, buscar todas as contas
-            if tem_termo_relacionado:
-                contas = ContaReceber.objects.filter(ativo=True).select_related('cliente').prefetch_related('parcelas')[:20]
+            queryset = ContaReceber.objects.filter(ativo=True).select_related('cliente').prefetch_related('parcelas')
+            
+            if not tokenizar(query):
+                contas = queryset[:20]
             else:
-                for palavra in palavras:
-                    if len(palavra) > 2:  # Ignorar palavras muito curtas
-                        q_objects |= Q(numero_documento__icontains=palavra) | Q(descricao__icontains=palavra) | Q(cliente__nome__icontains=palavra)
-                
-                contas = ContaReceber.objects.filter(q_objects, ativo=True).select_related('cliente').prefetch_related('parcelas')[:20]
+                contas = self._registros_encontrados('contas_receber', query, encontrados, 20, queryset)
+                # Se tiver termo relacionado, completar com as demais contas
+                if tem_termo_relacionado and len(contas) < 20:
+                    contas += list(queryset.exclude(pk__in=[conta.pk for conta in contas])[:20 - len(contas)])
             
             resultados = []
             for conta in contas:
@@ -264,24 +369,13 @@ class RAGSimpleService:
             print(f"Erro ao buscar contas a receber: {str(e)}")
             return []
     
-    def _buscar_faturados(self, query: str) -> List[Dict]:
+    def _buscar_faturados(self, query: str, encontrados: Optional[List[int]] = None) -> List[Dict]:
         """Busca faturados por palavras-chave"""
         try:
-            palavras = query.lower().split()
-            q_objects = Q()
-            
-            # Termos relacionados a faturados
-            termos_faturados = ['faturado', 'faturados', 'cpf', 'pessoa']
-            tem_termo_relacionado = any(termo in query.lower() for termo in termos_faturados)
-            
-            for palavra in palavras:
-                if len(palavra) > 2:
-                    q_objects |= Q(nome_completo__icontains=palavra) | Q(cpf__icontains=palavra) | Q(email__icontains=palavra)
-            
-            if tem_termo_relacionado and not q_objects:
+            if not tokenizar(query):
                 faturados = Faturado.objects.filter(ativo=True)[:10]
             else:
-                faturados = Faturado.objects.filter(q_objects, ativo=True)[:10]
+                faturados = self._registros_encontrados('faturados', query, encontrados, 10)
             
             resultados = []
             for faturado in faturados:
@@ -300,24 +394,13 @@ class RAGSimpleService:
             print(f"Erro ao buscar faturados: {str(e)}")
             return []
     
-    def _buscar_tipos_despesa(self, query: str) -> List[Dict]:
+    def _buscar_tipos_despesa(self, query: str, encontrados: Optional[List[int]] = None) -> List[Dict]:
         """Busca tipos de despesa por palavras-chave"""
         try:
-            palavras = query.lower().split()
-            q_objects = Q()
-            
-            # Termos relacionados a tipos de despesa
-            termos_despesa = ['despesa', 'despesas', 'categoria', 'classificação', 'classificacao', 'tipo']
-            tem_termo_relacionado = any(termo in query.lower() for termo in termos_despesa)
-            
-            for palavra in palavras:
-                if len(palavra) > 2:
-                    q_objects |= Q(nome__icontains=palavra) | Q(descricao__icontains=palavra) | Q(codigo__icontains=palavra) | Q(categoria__icontains=palavra)
-            
-            if tem_termo_relacionado and not q_objects:
+            if not tokenizar(query):
                 tipos = TipoDespesa.objects.filter(ativo=True)[:20]
             else:
-                tipos = TipoDespesa.objects.filter(q_objects, ativo=True)[:20]
+                tipos = self._registros_encontrados('tipos_despesa', query, encontrados, 20)
             
             resultados = []
             for tipo in tipos:
@@ -335,24 +418,13 @@ class RAGSimpleService:
             print(f"Erro ao buscar tipos de despesa: {str(e)}")
             return []
     
-    def _buscar_tipos_receita(self, query: str) -> List[Dict]:
+    def _buscar_tipos_receita(self, query: str, encontrados: Optional[List[int]] = None) -> List[Dict]:
         """Busca tipos de receita por palavras-chave"""
         try:
-            palavras = query.lower().split()
-            q_objects = Q()
-            
-            # Termos relacionados a tipos de receita
-            termos_receita = ['receita', 'receitas', 'categoria', 'classificação', 'classificacao', 'tipo']
-            tem_termo_relacionado = any(termo in query.lower() for termo in termos_receita)
-            
-            for palavra in palavras:
-                if len(palavra) > 2:
-                    q_objects |= Q(nome__icontains=palavra) | Q(descricao__icontains=palavra) | Q(codigo__icontains=palavra)
-            
-            if tem_termo_relacionado and not q_objects:
+            if not tokenizar(query):
                 tipos = TipoReceita.objects.filter(ativo=True)[:20]
             else:
-                tipos = TipoReceita.objects.filter(q_objects, ativo=True)[:20]
+                tipos = self._registros_encontrados('tipos_receita', query, encontrados, 20)
             
             resultados = []
             for tipo in tipos:
@@ -369,27 +441,14 @@ class RAGSimpleService:
             print(f"Erro ao buscar tipos de receita: {str(e)}")
             return []
     
-    def _buscar_processamentos_pdf(self, query: str) -> List[Dict]:
+    def _buscar_processamentos_pdf(self, query: str, encontrados: Optional[List[int]] = None) -> List[Dict]:
         """Busca processamentos de PDF por palavras-chave"""
         try:
-            palavras = query.lower().split()
-            q_objects = Q()
-            
-            # Termos relacionados a PDFs
-            termos_pdf = ['pdf', 'pdfs', 'processado', 'processados', 'processamento', 'nota', 'fiscal', 'boleto', 'boletos']
-            tem_termo_relacionado = any(termo in query.lower() for termo in termos_pdf)
-            
-            for palavra in palavras:
-                if len(palavra) > 2:
-                    q_objects |= Q(nome_arquivo__icontains=palavra) | Q(status_processamento__icontains=palavra)
-            
-            if tem_termo_relacionado:
-                if q_objects:
-                    processamentos = ProcessamentoPDF.objects.filter(q_objects, ativo=True).order_by('-criado_em')[:20]
-                else:
-                    processamentos = ProcessamentoPDF.objects.filter(ativo=True).order_by('-criado_em')[:20]
+            # Sem palavras para buscar, trazer os mais recentes
+            if not tokenizar(query):
+                processamentos = ProcessamentoPDF.objects.filter(ativo=True).order_by('-criado_em')[:20]
             else:
-                processamentos = ProcessamentoPDF.objects.filter(q_objects, ativo=True).order_by('-criado_em')[:20]
+                processamentos = self._registros_encontrados('processamentos_pdf', query, encontrados, 20)
             
             resultados = []
             for proc in processamentos:
@@ -418,24 +477,16 @@ class RAGSimpleService:
             print(f"Erro ao buscar processamentos PDF: {str(e)}")
             return []
     
-    def _buscar_parcelas(self, query: str) -> List[Dict]:
+    def _buscar_parcelas(self, query: str, encontrados: Optional[List[int]] = None) -> List[Dict]:
         """Busca parcelas por palavras-chave"""
         try:
-            palavras = query.lower().split()
-            q_objects = Q()
-            
             # Termos relacionados a parcelas
-            termos_parcelas = ['parcela', 'parcelas', 'vencimento', 'vencida', 'pagar', 'pagamento', 'pendente']
-            tem_termo_relacionado = any(termo in query.lower() for termo in termos_parcelas)
+            tem_termo_relacionado = any(termo in query.lower() for termo in TERMOS_PARCELAS)
             
             # Se tiver termo relacionado a parcelas, buscar todas ou filtrar
             if tem_termo_relacionado:
-                for palavra in palavras:
-                    if len(palavra) > 2:
-                        q_objects |= Q(status__icontains=palavra) | Q(observacoes__icontains=palavra)
-                
-                if q_objects:
-                    parcelas = Parcela.objects.filter(q_objects, ativo=True).order_by('-data_vencimento')[:20]
+                if tokenizar(query):
+                    parcelas = self._registros_encontrados('parcelas', query, encontrados, 20)
                 else:
                     # Se não houver filtro específico mas tiver termo relacionado, buscar todas
                     parcelas = Parcela.objects.filter(ativo=True).order_by('-data_vencimento')[:20]
@@ -461,177 +512,106 @@ class RAGSimpleService:
             print(f"Erro ao buscar parcelas: {str(e)}")
             return []
     
-    def _get_contexto_sistema(self) -> str:
+    def _buscar_tabelas(self, query: str, encontrados: Dict[str, List[int]],
+                        tabelas: Optional[List[str]] = None) -> List[Dict]:
         """
-        Retorna contexto explicativo sobre o sistema
+        Executa as buscas das tabelas (padrão: todas) ao mesmo tempo, cada uma em uma thread com sua
+        própria conexão. Tabelas que não respondem em RAG_BUSCA_TIMEOUT segundos ficam
+        fora do contexto, e suas consultas são interrompidas no banco, liberando a thread.
+        Resultados na ordem das tabelas, como na busca sequencial
         """
-        return """=== CONTEXTO DO SISTEMA ADMINISTRATIVO-FINANCEIRO ===
-
-Este é um sistema administrativo-financeiro para gestão de despesas e receitas, especialmente focado em operações agrícolas.
-
-FUNCIONALIDADES PRINCIPAIS:
-
-1. PROCESSAMENTO DE PDFs:
-   - O sistema processa PDFs de notas fiscais e boletos usando Inteligência Artificial (Google Gemini)
-   - Os PDFs são extraídos, analisados e classificados automaticamente
-   - Os dados extraídos são armazenados em ProcessamentoPDF
-
-2. CLASSIFICAÇÕES E ENTIDADES DO SISTEMA:
-
-   a) FORNECEDORES:
-      - Empresas que fornecem produtos/serviços
-      - Campos: Razão Social, Nome Fantasia, CNPJ, Email, Telefone, Endereço
-      - Relacionado com: Contas a Pagar
-
-   b) CLIENTES:
-      - Pessoas físicas que compram produtos/serviços
-      - Campos: Nome, CPF, Email, Telefone, Endereço, Data de Nascimento
-      - Relacionado com: Contas a Receber
-
-   c) FATURADOS:
-      - Pessoas físicas para quem as notas fiscais são emitidas
-      - Campos: Nome Completo, CPF, Email, Telefone, Endereço
-      - Relacionado com: Contas a Pagar
-
-   d) TIPOS DE DESPESA:
-      - Classificação das despesas em categorias:
-        * INSUMOS_AGRICOLAS: Sementes, Fertilizantes, Defensivos, Corretivos
-        * MANUTENCAO_OPERACAO: Combustíveis, Peças, Manutenção, Ferramentas
-        * RECURSOS_HUMANOS: Mão de Obra, Salários, Encargos
-        * SERVICOS_OPERACIONAIS: Frete, Colheita, Secagem, Pulverização
-        * INFRAESTRUTURA_UTILIDADES: Energia, Arrendamento, Construções
-        * ADMINISTRATIVAS: Honorários, Despesas Bancárias
-        * SEGUROS_PROTECAO: Seguro Agrícola, Seguro de Ativos
-        * IMPOSTOS_TAXAS: ITR, IPTU, IPVA, INCRA-CCIR
-        * INVESTIMENTOS: Máquinas, Veículos, Imóveis, Infraestrutura
-        * OUTROS: Outras despesas não categorizadas
-      - Relacionado com: Contas a Pagar
-
-   e) TIPOS DE RECEITA:
-      - Classificação das receitas
-      - Campos: Nome, Descrição, Código
-      - Relacionado com: Contas a Receber
-
-   f) CONTAS A PAGAR:
-      - Notas fiscais e faturas que a empresa deve pagar
-      - Campos: Fornecedor, Faturado, Número da Nota Fiscal, Data de Emissão, 
-                Descrição dos Produtos, Valor Total, Quantidade de Parcelas, Status
-      - Status: PENDENTE, PAGA, VENCIDA, CANCELADA
-      - Relacionado com: Fornecedor, Faturado, Parcelas, Tipos de Despesa
-
-   g) CONTAS A RECEBER:
-      - Documentos e faturas que a empresa deve receber
-      - Campos: Cliente, Número do Documento, Data de Emissão, Descrição,
-                Valor Total, Quantidade de Parcelas, Status
-      - Status: PENDENTE, PAGA, VENCIDA, CANCELADA
-      - Relacionado com: Cliente, Parcelas, Tipos de Receita
-
-   h) PARCELAS:
-      - Divisão de contas em múltiplas parcelas com datas de vencimento distintas
-      - Campos: Número da Parcela, Data de Vencimento, Valor, Status,
-                Data de Pagamento, Valor Pago
-      - Status: PENDENTE, PAGA, VENCIDA, CANCELADA
-      - Relacionado com: Contas a Pagar, Contas a Receber
-
-   i) PROCESSAMENTO DE PDF:
-      - Registro de todos os PDFs processados pelo sistema
-      - Campos: Nome do Arquivo, Tamanho, Status do Processamento,
-                Dados Extraídos (JSON), Erro (se houver), Data de Processamento
-      - Status: PENDENTE, PROCESSANDO, SUCESSO, ERRO, DUPLICADO
-      - Os dados extraídos incluem: Fornecedor, Cliente, Nota Fiscal, Itens, Parcelas, Classificação
-
-3. FLUXO DE TRABALHO:
-   - PDF de nota fiscal/boleto é enviado ao sistema
-   - IA extrai dados do PDF (fornecedor, valores, produtos, parcelas)
-   - Sistema classifica automaticamente a despesa
-   - Dados são armazenados em Contas a Pagar com Parcelas associadas
-   - Sistema permite consulta e gestão de todas as informações
-
-4. CONSULTAS DISPONÍVEIS:
-   - Quantidade de registros em cada tabela
-   - Valores totais a pagar/receber
-   - Parcelas pendentes/vencidas
-   - Status de processamento de PDFs
-   - Classificações de despesas/receitas
-   - Informações de fornecedores/clientes/faturados
-
-===========================================
-"""
+        buscas = [
+            ('clientes', self._buscar_clientes),
+            ('fornecedores', self._buscar_fornecedores),
+            ('contas_pagar', self._buscar_contas_pagar),
+            ('contas_receber', self._buscar_contas_receber),
+            ('parcelas', self._buscar_parcelas),
+            ('faturados', self._buscar_faturados),
+            ('tipos_despesa', self._buscar_tipos_despesa),
+            ('tipos_receita', self._buscar_tipos_receita),
+            ('processamentos_pdf', self._buscar_processamentos_pdf),
+        ]
+        if tabelas is not None:
+            buscas = [(tabela, buscar) for tabela, buscar in buscas if tabela in tabelas]
+        timeout = getattr(settings, 'RAG_BUSCA_TIMEOUT', 5.0)
+        limite = _limite_busca()
+        futuros = [
+            (tabela, _executor_buscas.submit(
+                _em_thread_limitado, limite, self.medicao.medir_tabela, tabela, buscar, query, encontrados.get(tabela, [])
+            ))
+            for tabela, buscar in buscas
+        ]
+        _, pendentes = wait([futuro for _, futuro in futuros], timeout=timeout or None)
+        
+        resultados = []
+        for tabela, futuro in futuros:
+            if futuro in pendentes:
+                futuro.cancel()
+                print(f"Erro ao buscar {tabela}: sem resposta em {timeout}s")
+                continue
+            try:
+                resultados.extend(futuro.result())
+            except Exception as e:
+                print(f"Erro ao buscar {tabela}: {str(e)}")
+        return resultados
     
     def buscar_contexto(self, query: str) -> str:
         """
         Busca contexto no banco de dados usando palavras-chave
         """
-        # Contexto inicial do sistema
-        contexto = self._get_contexto_sistema() + "\n"
+        construtor = ConstrutorContexto()
         
         resultados = []
         
-        # Buscar em todas as tabelas
-        resultados.extend(self._buscar_clientes(query))
-        resultados.extend(self._buscar_fornecedores(query))
-        resultados.extend(self._buscar_contas_pagar(query))
-        resultados.extend(self._buscar_contas_receber(query))
-        resultados.extend(self._buscar_parcelas(query))
-        resultados.extend(self._buscar_faturados(query))
-        resultados.extend(self._buscar_tipos_despesa(query))
-        resultados.extend(self._buscar_tipos_receita(query))
-        resultados.extend(self._buscar_processamentos_pdf(query))
+        # Só as tabelas (e o bloco de estatísticas) que a pergunta envolve
+        with self.medicao.etapa('roteamento'):
+            rota = roteador.classificar(query)
         
-        # Adicionar estatísticas gerais se a pergunta for sobre quantidade
-        termos_quantidade = ['quantos', 'quantas', 'quantidade', 'total', 'qtd', 'contar', 'contagem']
-        if any(termo in query.lower() for termo in termos_quantidade):
+        # Registros com palavras da pergunta, das tabelas da rota, pontuados por BM25
+        with self.medicao.etapa('ranking'):
             try:
-                contexto += "=== ESTATÍSTICAS GERAIS DO BANCO DE DADOS ===\n\n"
-                contexto += f"- Total de Clientes: {Cliente.objects.filter(ativo=True).count()}\n"
-                contexto += f"- Total de Fornecedores: {Fornecedor.objects.filter(ativo=True).count()}\n"
-                contexto += f"- Total de Faturados: {Faturado.objects.filter(ativo=True).count()}\n"
-                contexto += f"- Total de Contas a Pagar: {ContaPagar.objects.filter(ativo=True).count()}\n"
-                contexto += f"- Total de Contas a Receber: {ContaReceber.objects.filter(ativo=True).count()}\n"
-                contexto += f"- Total de Parcelas: {Parcela.objects.filter(ativo=True).count()}\n"
-                contexto += f"- Total de Tipos de Despesa: {TipoDespesa.objects.filter(ativo=True).count()}\n"
-                contexto += f"- Total de Tipos de Receita: {TipoReceita.objects.filter(ativo=True).count()}\n"
-                contexto += f"- Total de PDFs Processados: {ProcessamentoPDF.objects.filter(ativo=True).count()}\n"
-                contexto += f"- PDFs com Sucesso: {ProcessamentoPDF.objects.filter(ativo=True, status_processamento='SUCESSO').count()}\n"
-                contexto += f"- PDFs com Erro: {ProcessamentoPDF.objects.filter(ativo=True, status_processamento='ERRO').count()}\n"
-                contexto += f"- PDFs Pendentes: {ProcessamentoPDF.objects.filter(ativo=True, status_processamento='PENDENTE').count()}\n"
-                contexto += "\n"
+                pontuacoes = indice_palavras.pontuar(query, rota.tabelas)
             except Exception as e:
-                print(f"Erro ao calcular estatísticas: {str(e)}")
+                print(f"Erro ao buscar no índice de palavras-chave: {str(e)}")
+                pontuacoes = {}
+            encontrados = {tabela: ordenar_por_pontuacao(pontos) for tabela, pontos in pontuacoes.items()}
+        
+        with self.medicao.etapa('busca'):
+            # Buscar em todas as tabelas
+            resultados.extend(self._buscar_tabelas(query, encontrados, rota.tabelas))
+            
+            # Adicionar estatísticas gerais se a pergunta for sobre quantidade
+            if rota.estatisticas:
+                try:
+                    construtor.adicionar_secao(
+                        "ESTATÍSTICAS GERAIS DO BANCO DE DADOS",
+                        [f"- {rotulo}: {total}" for rotulo, total in estatisticas_rag.obter(rota.tabelas)],
+                    )
+                except Exception as e:
+                    print(f"Erro ao calcular estatísticas: {str(e)}")
+        
+        # Mais relevantes primeiro, de todas as tabelas: o corte em 30 mantém os melhores, e o
+        # construtor tira os de menor pontuação se o contexto passar do orçamento de tokens.
+        # Registros trazidos sem palavras da pergunta (pontuação 0) ficam no fim, na ordem original
+        tabela_por_tipo = {definicao.tipo: definicao.nome for definicao in TABELAS_RAG}
         
-        # Adicionar dados encontrados
-        if resultados:
-            contexto += "=== DADOS ENCONTRADOS NO BANCO DE DADOS ===\n\n"
-            for i, resultado in enumerate(resultados[:30], 1):  # Limitar a 30 resultados
-                contexto += f"{i}. {resultado['tipo']}:\n"
-                for chave, valor in resultado.items():
-                    if chave != 'tipo':
-                        if isinstance(valor, list):
-                            contexto += f"   - {chave}:\n"
-                            for item in valor:
-                                if isinstance(item, dict):
-                                    contexto += f"     * {item}\n"
-                                else:
-                                    contexto += f"     * {item}\n"
-                        else:
-                            contexto += f"   - {chave}: {valor}\n"
-                contexto += "\n"
-        else:
-            contexto += "Nenhum resultado específico encontrado no banco de dados para a consulta.\n"
+        def pontuacao(resultado: Dict) -> float:
+            return pontuacoes.get(tabela_por_tipo.get(resultado['tipo']), {}).get(resultado['id'], 0.0)
         
-        return contexto
+        with self.medicao.etapa('ranking'):
+            resultados.sort(key=lambda r: -pontuacao(r))
+        for resultado in resultados[:30]:  # Limitar a 30 resultados
+            construtor.adicionar_registro(resultado['tipo'], resultado, pontuacao=pontuacao(resultado))
+        
+        with self.medicao.etapa('prompt'):
+            return construtor.construir()
     
-    def processar_consulta(self, pergunta: str) -> Dict[str, Any]:
+    def montar_prompt(self, pergunta: str) -> Tuple[str, str]:
         """
-        Processa uma consulta usando RAG simples
+        Busca o contexto no banco de dados e monta o prompt para o LLM: (contexto, prompt)
         """
-        inicio = time.time()
-        
-        try:
-            # 1. Buscar contexto no banco de dados
-            contexto = self.buscar_contexto(pergunta)
-            
-            # 2. Criar prompt para o LLM
+        contexto = self.buscar_contexto(pergunta)
+        with self.medicao.etapa('prompt'):
             prompt = f"""Você é um assistente especializado em análise de dados financeiros e administrativos de um sistema agrícola.
 
 {contexto}
@@ -649,9 +629,22 @@ INSTRUÇÕES PARA RESPOSTA:
 8. Seja claro, detalhado e útil na resposta
 
 Resposta:"""
+        return contexto, prompt
+    
+    def processar_consulta(self, pergunta: str) -> Dict[str, Any]:
+        """
+        Processa uma consulta usando RAG simples
+        """
+        inicio = time.time()
+        
+        try:
+            # 1. Buscar contexto no banco de dados e criar prompt para o LLM
+            contexto, prompt = self.montar_prompt(pergunta)
             
-            # 3. Gerar resposta com LLM
-            resposta = self.gemini_service.generate_response(prompt)
+            # 2. Gerar resposta com LLM
+            with self.medicao.etapa('llm'):
+                resposta = self.gemini_service.generate_response(prompt)
+            self.medicao.contar_tokens(prompt, resposta)
             
             tempo_resposta = time.time() - inicio
             
@@ -659,6 +652,7 @@ Resposta:"""
                 'success': True,
                 'resposta': resposta,
                 'contexto': contexto,
+                'tokens_prompt': estimar_tokens(prompt),
                 'tempo_resposta': tempo_resposta,
                 'tipo_rag': 'SIMPLES'
             }
@@ -677,317 +671,133 @@ class RAGEmbeddingsService:
     Serviço RAG com Embeddings - Busca semântica usando embeddings
     """
     
+    MODELO_EMBEDDINGS = MODELO_PADRAO
+    TIPO_RAG = 'EMBEDDINGS'
+    ORDENACAO = 'relevância semântica'
+    
     def __init__(self):
         self.gemini_service = GeminiService()
-        self._model = None
+        self.medicao = MedicaoEtapas()
+        self.backend = get_backend()
+        self.indice = IndiceEmbeddings(self.backend.nome, self._gerar_embeddings)
     
-    def _get_embedding_model(self):
+    def _gerar_embedding(self, texto: str) -> List[float]:
         """
-        Obtém o modelo de embeddings
-        Usa sentence-transformers se disponível, senão usa busca simples
+        Gera embedding para um texto
         """
-        try:
-            if self._model is None:
-                try:
-                    from sentence_transformers import SentenceTransformer
-                    # Usar modelo multilíngue para português
-                    self._model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-                except ImportError:
-                    # Se não tiver sentence-transformers, usar busca simples
-                    self._model = 'simple'
-            return self._model
-        except Exception:
-            return 'simple'
+        embeddings = self._gerar_embeddings([texto])
+        if embeddings is None:
+            return None
+        return embeddings[0].tolist()
     
-    def _gerar_embedding(self, texto: str) -> List[float]:
+    def _gerar_embeddings(self, textos: List[str], batch_size: int = 64):
         """
-        Gera embedding para um texto
+        Gera embeddings para uma lista de textos em lotes
+        Retorna uma matriz (n, dim) ou None se o backend não estiver disponível
         """
-        model = self._get_embedding_model()
-        
-        if model == 'simple':
+        if not self.backend.disponivel():
             # Fallback: retornar None para usar busca simples
             return None
         
         try:
-            embedding = model.encode(texto, convert_to_numpy=True)
-            return embedding.tolist()
-        except Exception:
+            return self.backend.codificar(textos, batch_size=batch_size)
+        except Exception as e:
+            print(f"Erro ao gerar embeddings: {str(e)}")
             return None
     
-    def _calcular_similaridade(self, embedding1: List[float], embedding2: List[float]) -> float:
+    def embedding_pergunta(self, pergunta: str):
         """
-        Calcula similaridade de cosseno entre dois embeddings
+        Embedding da pergunta, reaproveitado do cache quando a mesma pergunta
+        (ignorando maiúsculas, acentos e espaços) já foi codificada
         """
-        try:
-            import numpy as np
-            
-            vec1 = np.array(embedding1)
-            vec2 = np.array(embedding2)
-            
-            dot_product = np.dot(vec1, vec2)
-            norm1 = np.linalg.norm(vec1)
-            norm2 = np.linalg.norm(vec2)
+        with self.medicao.etapa('embedding'):
+            chave = (self.backend.nome, normalizar_pergunta(pergunta))
+            embedding = cache_embeddings_perguntas.obter(chave)
+            if embedding is not None:
+                return embedding
             
-            if norm1 == 0 or norm2 == 0:
-                return 0.0
-            
-            return float(dot_product / (norm1 * norm2))
-        except Exception:
-            return 0.0
+            embeddings = self._gerar_embeddings([pergunta])
+            if embeddings is None:
+                return None
+            embedding = np.array(embeddings[0], dtype=np.float32)
+            embedding.setflags(write=False)
+            cache_embeddings_perguntas.guardar(chave, embedding)
+            return embedding
+    
+    def _carregar_dados(self, chaves: List[tuple]) -> Dict[tuple, Dict]:
+        """
+        Busca no banco, por chave primária, os dados de contexto dos registros
+        """
+        ids_por_tabela = {}
+        for tabela, objeto_id in chaves:
+            ids_por_tabela.setdefault(tabela, []).append(objeto_id)
+        
+        dados = {}
+        for tabela, ids in ids_por_tabela.items():
+            try:
+                with self.medicao.tabela(tabela):
+                    definicao = get_tabela(tabela)
+                    for obj in definicao.get_queryset().filter(pk__in=ids):
+                        dados[(tabela, obj.pk)] = {
+                            'tipo': definicao.tipo,
+                            'dados': definicao.contexto(obj),
+                        }
+            except Exception as e:
+                print(f"Erro ao buscar {tabela} (embeddings): {str(e)}")
+        return dados
     
     def _buscar_semanticamente(self, query: str, limite: int = 10) -> List[Dict]:
         """
-        Busca semântica no banco de dados usando embeddings
+        Busca semântica no banco de dados usando o índice de embeddings
         """
-        # Gerar embedding da query
-        query_embedding = self._gerar_embedding(query)
+        # Gerar embedding da query (única codificação feita na consulta)
+        query_embedding = self.embedding_pergunta(query)
         
         if query_embedding is None:
             # Fallback para busca simples
-            rag_simple = RAGSimpleService()
+            rag_simple = RAGSimpleService(self.medicao)
             contexto = rag_simple.buscar_contexto(query)
             return contexto
         
-        resultados_com_similaridade = []
-        
-        # Buscar clientes
-        try:
-            clientes = Cliente.objects.filter(ativo=True)[:50]
-            for cliente in clientes:
-                texto = f"{cliente.nome} {cliente.cpf} {cliente.email or ''} {cliente.endereco or ''}"
-                texto_embedding = self._gerar_embedding(texto)
-                if texto_embedding:
-                    similaridade = self._calcular_similaridade(query_embedding, texto_embedding)
-                    resultados_com_similaridade.append({
-                        'similaridade': similaridade,
-                        'tipo': 'Cliente',
-                        'dados': {
-                            'id': cliente.id,
-                            'nome': cliente.nome,
-                            'cpf': cliente.cpf,
-                            'email': cliente.email,
-                            'telefone': cliente.telefone,
-                        }
-                    })
-        except Exception as e:
-            print(f"Erro ao buscar clientes (embeddings): {str(e)}")
-        
-        # Buscar fornecedores
-        try:
-            fornecedores = Fornecedor.objects.filter(ativo=True)[:50]
-            for fornecedor in fornecedores:
-                texto = f"{fornecedor.razao_social} {fornecedor.fantasia or ''} {fornecedor.cnpj}"
-                texto_embedding = self._gerar_embedding(texto)
-                if texto_embedding:
-                    similaridade = self._calcular_similaridade(query_embedding, texto_embedding)
-                    resultados_com_similaridade.append({
-                        'similaridade': similaridade,
-                        'tipo': 'Fornecedor',
-                        'dados': {
-                            'id': fornecedor.id,
-                            'razao_social': fornecedor.razao_social,
-                            'fantasia': fornecedor.fantasia,
-                            'cnpj': fornecedor.cnpj,
-                        }
-                    })
-        except Exception as e:
-            print(f"Erro ao buscar fornecedores (embeddings): {str(e)}")
-        
-        # Buscar contas a pagar
-        try:
-            contas_pagar = ContaPagar.objects.filter(ativo=True).select_related('fornecedor').prefetch_related('parcelas')[:50]
-            for conta in contas_pagar:
-                texto = f"{conta.numero_nota_fiscal} {conta.descricao_produtos} {conta.fornecedor.razao_social} conta pagar pagamento despesa"
-                texto_embedding = self._gerar_embedding(texto)
-                if texto_embedding:
-                    similaridade = self._calcular_similaridade(query_embedding, texto_embedding)
-                    parcelas_info = [{'numero': p.numero_parcela, 'valor': float(p.valor), 'vencimento': str(p.data_vencimento), 'status': p.status} for p in conta.parcelas.all()[:3]]
-                    dados = {
-                        'id': conta.id,
-                        'numero_nota_fiscal': conta.numero_nota_fiscal,
-                        'fornecedor': conta.fornecedor.razao_social,
-                        'valor_total': float(conta.valor_total),
-                        'status': conta.status,
-                        'quantidade_parcelas': conta.quantidade_parcelas,
-                    }
-                    if parcelas_info:
-                        dados['parcelas'] = parcelas_info
-                    resultados_com_similaridade.append({
-                        'similaridade': similaridade,
-                        'tipo': 'Conta a Pagar',
-                        'dados': dados
-                    })
-        except Exception as e:
-            print(f"Erro ao buscar contas a pagar (embeddings): {str(e)}")
-        
-        # Buscar contas a receber
-        try:
-            contas_receber = ContaReceber.objects.filter(ativo=True).select_related('cliente').prefetch_related('parcelas')[:50]
-            for conta in contas_receber:
-                texto = f"{conta.numero_documento} {conta.descricao} {conta.cliente.nome} conta receber recebimento"
-                texto_embedding = self._gerar_embedding(texto)
-                if texto_embedding:
-                    similaridade = self._calcular_similaridade(query_embedding, texto_embedding)
-                    parcelas_info = [{'numero': p.numero_parcela, 'valor': float(p.valor), 'vencimento': str(p.data_vencimento), 'status': p.status} for p in conta.parcelas.all()[:3]]
-                    dados = {
-                        'id': conta.id,
-                        'numero_documento': conta.numero_documento,
-                        'cliente': conta.cliente.nome,
-                        'valor_total': float(conta.valor_total),
-                        'status': conta.status,
-                        'quantidade_parcelas': conta.quantidade_parcelas,
-                    }
-                    if parcelas_info:
-                        dados['parcelas'] = parcelas_info
-                    resultados_com_similaridade.append({
-                        'similaridade': similaridade,
-                        'tipo': 'Conta a Receber',
-                        'dados': dados
-                    })
-        except Exception as e:
-            print(f"Erro ao buscar contas a receber (embeddings): {str(e)}")
-        
-        # Buscar parcelas diretamente
-        try:
-            parcelas = Parcela.objects.filter(ativo=True).order_by('-data_vencimento')[:50]
-            for parcela in parcelas:
-                texto = f"parcela {parcela.numero_parcela} vencimento {parcela.data_vencimento} valor {parcela.valor} status {parcela.status} pagamento"
-                texto_embedding = self._gerar_embedding(texto)
-                if texto_embedding:
-                    similaridade = self._calcular_similaridade(query_embedding, texto_embedding)
-                    resultados_com_similaridade.append({
-                        'similaridade': similaridade,
-                        'tipo': 'Parcela',
-                        'dados': {
-                            'id': parcela.id,
-                            'numero_parcela': parcela.numero_parcela,
-                            'valor': float(parcela.valor),
-                            'valor_pago': float(parcela.valor_pago),
-                            'data_vencimento': str(parcela.data_vencimento),
-                            'data_pagamento': str(parcela.data_pagamento) if parcela.data_pagamento else None,
-                            'status': parcela.status,
-                        }
-                    })
-        except Exception as e:
-            print(f"Erro ao buscar parcelas (embeddings): {str(e)}")
-        
-        # Buscar faturados
-        try:
-            faturados = Faturado.objects.filter(ativo=True)[:50]
-            for faturado in faturados:
-                texto = f"faturado {faturado.nome_completo} {faturado.cpf} pessoa física"
-                texto_embedding = self._gerar_embedding(texto)
-                if texto_embedding:
-                    similaridade = self._calcular_similaridade(query_embedding, texto_embedding)
-                    resultados_com_similaridade.append({
-                        'similaridade': similaridade,
-                        'tipo': 'Faturado',
-                        'dados': {
-                            'id': faturado.id,
-                            'nome_completo': faturado.nome_completo,
-                            'cpf': faturado.cpf,
-                        }
-                    })
-        except Exception as e:
-            print(f"Erro ao buscar faturados (embeddings): {str(e)}")
-        
-        # Buscar tipos de despesa
-        try:
-            tipos_despesa = TipoDespesa.objects.filter(ativo=True)[:50]
-            for tipo in tipos_despesa:
-                texto = f"tipo despesa {tipo.nome} categoria {tipo.get_categoria_display()} classificação"
-                texto_embedding = self._gerar_embedding(texto)
-                if texto_embedding:
-                    similaridade = self._calcular_similaridade(query_embedding, texto_embedding)
-                    resultados_com_similaridade.append({
-                        'similaridade': similaridade,
-                        'tipo': 'Tipo de Despesa',
-                        'dados': {
-                            'id': tipo.id,
-                            'nome': tipo.nome,
-                            'categoria': tipo.get_categoria_display(),
-                        }
-                    })
-        except Exception as e:
-            print(f"Erro ao buscar tipos de despesa (embeddings): {str(e)}")
-        
-        # Buscar tipos de receita
-        try:
-            tipos_receita = TipoReceita.objects.filter(ativo=True)[:50]
-            for tipo in tipos_receita:
-                texto = f"tipo receita {tipo.nome} classificação"
-                texto_embedding = self._gerar_embedding(texto)
-                if texto_embedding:
-                    similaridade = self._calcular_similaridade(query_embedding, texto_embedding)
-                    resultados_com_similaridade.append({
-                        'similaridade': similaridade,
-                        'tipo': 'Tipo de Receita',
-                        'dados': {
-                            'id': tipo.id,
-                            'nome': tipo.nome,
-                        }
-                    })
-        except Exception as e:
-            print(f"Erro ao buscar tipos de receita (embeddings): {str(e)}")
-        
-        # Buscar processamentos PDF
-        try:
-            processamentos = ProcessamentoPDF.objects.filter(ativo=True).order_by('-criado_em')[:50]
-            for proc in processamentos:
-                texto = f"pdf processado {proc.nome_arquivo} status {proc.get_status_processamento_display()} nota fiscal boleto"
-                texto_embedding = self._gerar_embedding(texto)
-                if texto_embedding:
-                    similaridade = self._calcular_similaridade(query_embedding, texto_embedding)
-                    resultados_com_similaridade.append({
-                        'similaridade': similaridade,
-                        'tipo': 'Processamento PDF',
-                        'dados': {
-                            'id': proc.id,
-                            'nome_arquivo': proc.nome_arquivo,
-                            'status': proc.get_status_processamento_display(),
-                        }
-                    })
-        except Exception as e:
-            print(f"Erro ao buscar processamentos PDF (embeddings): {str(e)}")
+        motor = self.indice.motor()
         
-        # Ordenar por similaridade e retornar os melhores
-        resultados_com_similaridade.sort(key=lambda x: x['similaridade'], reverse=True)
+        if len(motor) == 0:
+            print("Índice de embeddings vazio ou ainda carregando - se persistir, execute 'python manage.py rag_build_index'")
+            rag_simple = RAGSimpleService(self.medicao)
+            return rag_simple.buscar_contexto(query)
         
-        # Obter contexto do sistema
-        contexto_sistema = RAGSimpleService()._get_contexto_sistema()
+        # Similaridade com todos os registros em um único produto matriz-vetor
+        with self.medicao.etapa('ranking'):
+            melhores = motor.buscar(query_embedding, k=limite, limiar=0.3)
+        with self.medicao.etapa('busca'):
+            dados = self._carregar_dados([chave for _, chave in melhores])
         
-        # Formatar contexto
-        contexto = contexto_sistema + "\n=== DADOS ENCONTRADOS NO BANCO DE DADOS (ordenados por relevância semântica) ===\n\n"
-        resultados_relevantes = [r for r in resultados_com_similaridade if r['similaridade'] > 0.3]
+        construtor = ConstrutorContexto(
+            titulo="DADOS ENCONTRADOS NO BANCO DE DADOS (ordenados por relevância semântica)",
+            mensagem_vazia="Nenhum resultado relevante encontrado no banco de dados para a consulta.",
+        )
+        for similaridade, chave in melhores:
+            if chave in dados:
+                construtor.adicionar_registro(
+                    dados[chave]['tipo'], dados[chave]['dados'],
+                    pontuacao=similaridade, relevancia=f"{similaridade:.2f}",
+                )
         
-        if resultados_relevantes:
-            for i, item in enumerate(resultados_relevantes[:limite], 1):
-                contexto += f"{i}. {item['tipo']} (similaridade: {item['similaridade']:.2f}):\n"
-                for chave, valor in item['dados'].items():
-                    if isinstance(valor, list):
-                        contexto += f"   - {chave}:\n"
-                        for subitem in valor:
-                            contexto += f"     * {subitem}\n"
-                    else:
-                        contexto += f"   - {chave}: {valor}\n"
-                contexto += "\n"
-        else:
-            contexto += "Nenhum resultado relevante encontrado no banco de dados para a consulta.\n"
-        
-        return contexto
+        with self.medicao.etapa('prompt'):
+            return construtor.construir()
     
-    def processar_consulta(self, pergunta: str) -> Dict[str, Any]:
+    def buscar_contexto(self, query: str) -> str:
         """
-        Processa uma consulta usando RAG com embeddings
+        Contexto da pergunta para o prompt
         """
-        inicio = time.time()
-        
-        try:
-            # 1. Buscar contexto usando embeddings
-            contexto = self._buscar_semanticamente(pergunta)
-            
-            # 2. Criar prompt para o LLM
+        return self._buscar_semanticamente(query)
+    
+    def montar_prompt(self, pergunta: str) -> Tuple[str, str]:
+        """
+        Busca o contexto usando embeddings e monta o prompt para o LLM: (contexto, prompt)
+        """
+        contexto = self.buscar_contexto(pergunta)
+        with self.medicao.etapa('prompt'):
             prompt = f"""Você é um assistente especializado em análise de dados financeiros e administrativos de um sistema agrícola.
 
 {contexto}
@@ -996,7 +806,7 @@ Pergunta do usuário: {pergunta}
 
 INSTRUÇÕES PARA RESPOSTA:
 1. Use o contexto do sistema fornecido acima para entender a estrutura e funcionamento
-2. Analise os dados encontrados no banco de dados (ordenados por relevância semântica)
+2. Analise os dados encontrados no banco de dados (ordenados por {self.ORDENACAO})
 3. Se a pergunta for sobre quantidade, calcule e apresente números exatos
 4. Se a pergunta for sobre valores, apresente totais e detalhes quando relevante
 5. Se a pergunta for sobre status ou classificações, explique claramente
@@ -1005,9 +815,22 @@ INSTRUÇÕES PARA RESPOSTA:
 8. Seja claro, detalhado e útil na resposta
 
 Resposta:"""
+        return contexto, prompt
+    
+    def processar_consulta(self, pergunta: str) -> Dict[str, Any]:
+        """
+        Processa uma consulta usando RAG com embeddings
+        """
+        inicio = time.time()
+        
+        try:
+            # 1. Buscar contexto usando embeddings e criar prompt para o LLM
+            contexto, prompt = self.montar_prompt(pergunta)
             
-            # 3. Gerar resposta com LLM
-            resposta = self.gemini_service.generate_response(prompt)
+            # 2. Gerar resposta com LLM
+            with self.medicao.etapa('llm'):
+                resposta = self.gemini_service.generate_response(prompt)
+            self.medicao.contar_tokens(prompt, resposta)
             
             tempo_resposta = time.time() - inicio
             
@@ -1015,8 +838,9 @@ Resposta:"""
                 'success': True,
                 'resposta': resposta,
                 'contexto': contexto,
+                'tokens_prompt': estimar_tokens(prompt),
                 'tempo_resposta': tempo_resposta,
-                'tipo_rag': 'EMBEDDINGS'
+                'tipo_rag': self.TIPO_RAG
             }
             
         except Exception as e:
@@ -1024,6 +848,216 @@ Resposta:"""
                 'success': False,
                 'error': str(e),
                 'tempo_resposta': time.time() - inicio,
-                'tipo_rag': 'EMBEDDINGS'
+                'tipo_rag': self.TIPO_RAG
             }
 
+
+
+def fusao_rrf(rankings: List[List[Hashable]], k: int = 60) -> List[Tuple[float, Hashable]]:
+    """
+    Reciprocal rank fusion: cada ranking soma 1 / (k + posição) às chaves que contém.
+    Chaves presentes em mais de um ranking aparecem uma única vez, com as contribuições somadas.
+    Retorna pares (pontuação, chave) da maior pontuação para a menor
+    """
+    pontos = {}
+    for ranking in rankings:
+        vistas = set()
+        for chave in ranking:
+            if chave in vistas:
+                continue
+            vistas.add(chave)
+            pontos[chave] = pontos.get(chave, 0.0) + 1.0 / (k + len(vistas))
+    return sorted(((pontuacao, chave) for chave, pontuacao in pontos.items()), key=lambda par: -par[0])
+
+
+class RAGHibridoService(RAGEmbeddingsService):
+    """
+    Serviço RAG Híbrido - busca por palavras-chave (BM25) e busca semântica
+    executadas ao mesmo tempo, com os rankings combinados por reciprocal rank fusion
+    """
+    
+    TIPO_RAG = 'HIBRIDO'
+    ORDENACAO = 'relevância combinada de palavras-chave e semântica'
+    
+    def __init__(self):
+        super().__init__()
+        self.rrf_k = getattr(settings, 'RAG_HIBRIDO_RRF_K', 60)
+        self.candidatos = getattr(settings, 'RAG_HIBRIDO_CANDIDATOS', 20)
+    
+    def _ranking_palavras(self, query: str) -> List[tuple]:
+        """Chaves (tabela, id) com palavras da pergunta, da maior pontuação BM25 para a menor"""
+        try:
+            pontuacoes = indice_palavras.pontuar(query)
+        except Exception as e:
+            print(f"Erro ao buscar no índice de palavras-chave: {str(e)}")
+            return []
+        pares = [
+            (pontuacao, (tabela, objeto_id))
+            for tabela, pontos in pontuacoes.items()
+            for objeto_id, pontuacao in pontos.items()
+        ]
+        pares.sort(key=lambda par: (-par[0], -par[1][1]))
+        return [chave for _, chave in pares[:self.candidatos]]
+    
+    def _ranking_semantico(self, query: str) -> List[tuple]:
+        """Chaves (tabela, id) mais próximas da pergunta no índice de embeddings"""
+        try:
+            query_embedding = self.embedding_pergunta(query)
+            if query_embedding is None:
+                return []
+            motor = self.indice.motor()
+            if len(motor) == 0:
+                print("Índice de embeddings vazio ou ainda carregando - se persistir, execute 'python manage.py rag_build_index'")
+                return []
+            with self.medicao.etapa('ranking'):
+                return [chave for _, chave in motor.buscar(query_embedding, k=self.candidatos, limiar=0.3)]
+        except Exception as e:
+            print(f"Erro na busca semântica: {str(e)}")
+            return []
+    
+    def buscar_contexto(self, query: str, limite: int = 15) -> str:
+        """
+        Busca as duas listas em paralelo (a de palavras-chave em outra thread):
+        o tempo de busca é o da mais lenta, não a soma das duas
+        """
+        futuro = _executor_buscas.submit(_em_thread_limitado, _limite_busca(), self._ranking_palavras, query)
+        ranking_semantico = self._ranking_semantico(query)
+        
+        # Ranking: o da busca semântica (acima) + a espera pelas palavras-chave + a fusão
+        with self.medicao.etapa('ranking'):
+            try:
+                ranking_palavras = futuro.result()
+            except Exception as e:
+                print(f"Erro ao buscar no índice de palavras-chave: {str(e)}")
+                ranking_palavras = []
+            fundidos = fusao_rrf([ranking_palavras, ranking_semantico], k=self.rrf_k)[:limite]
+        with self.medicao.etapa('busca'):
+            dados = self._carregar_dados([chave for _, chave in fundidos])
+        posicao_palavras = {chave: i for i, chave in enumerate(ranking_palavras, 1)}
+        posicao_semantica = {chave: i for i, chave in enumerate(ranking_semantico, 1)}
+        
+        construtor = ConstrutorContexto(
+            titulo="DADOS ENCONTRADOS NO BANCO DE DADOS (ordenados por relevância combinada)",
+            mensagem_vazia="Nenhum resultado relevante encontrado no banco de dados para a consulta.",
+        )
+        for pontuacao, chave in fundidos:
+            if chave not in dados:
+                continue
+            origens = []
+            if chave in posicao_palavras:
+                origens.append(f"palavras-chave #{posicao_palavras[chave]}")
+            if chave in posicao_semantica:
+                origens.append(f"semântica #{posicao_semantica[chave]}")
+            construtor.adicionar_registro(
+                dados[chave]['tipo'], dados[chave]['dados'],
+                pontuacao=pontuacao, relevancia=f"{pontuacao:.4f} {' + '.join(origens)}",
+            )
+        
+        with self.medicao.etapa('prompt'):
+            return construtor.construir()
+
+
+class RAGSQLService:
+    """
+    Serviço RAG SQL - o LLM escreve um SELECT a partir do esquema das tabelas,
+    o sistema valida e executa em modo somente leitura e o LLM redige a resposta
+    a partir do resultado (poucas linhas em vez dos registros completos)
+    """
+    
+    TIPO_RAG = 'SQL'
+    
+    def __init__(self):
+        self.gemini_service = GeminiService()
+        self.medicao = MedicaoEtapas()
+        self.limite_linhas, self.timeout = limites()
+    
+    def _dialeto(self) -> str:
+        """Dicas de sintaxe para o banco em uso"""
+        if connection.vendor == 'sqlite':
+            return "SQLite: datas em texto 'AAAA-MM-DD', use strftime('%Y-%m', coluna) e date('now'); booleanos são 0/1."
+        return "PostgreSQL: use date_trunc, extract e current_date; booleanos são true/false."
+    
+    def gerar_sql(self, pergunta: str) -> str:
+        """Pede o SELECT ao LLM e extrai o SQL da resposta"""
+        prompt = f"""Escreva uma única consulta SQL SELECT que responda à pergunta, usando apenas estas tabelas:
+
+{descrever_esquema()}
+
+Regras:
+- {self._dialeto()}
+- Considere apenas registros com ativo verdadeiro, salvo se a pergunta pedir o contrário.
+- Tabelas *_parcelas ligam contas às parcelas (muitos para muitos).
+- Textos entre aspas simples; não use aspas duplas nem ponto e vírgula.
+- Retorne colunas com nomes claros e no máximo {self.limite_linhas} linhas (agregue quando possível).
+- Data de hoje: {timezone.localdate().isoformat()}.
+
+Pergunta: {pergunta}
+
+Responda apenas com o SQL."""
+        return extrair_sql(self.gemini_service.generate_response(prompt))
+    
+    def montar_prompt(self, pergunta: str) -> Tuple[str, str]:
+        """
+        Gera e executa o SELECT e monta o prompt de redação com o resultado: (contexto, prompt).
+        Se o LLM não gerar o SQL, ou se ele for recusado ou falhar, usa o contexto
+        e o prompt do RAG Simples
+        """
+        sql = None
+        try:
+            with self.medicao.etapa('busca'):
+                sql = self.gerar_sql(pergunta)
+                resultado = executar_somente_leitura(sql, self.limite_linhas, self.timeout)
+        except Exception as e:
+            print(f"Erro no modo SQL, usando RAG Simples: {str(e)}")
+            contexto, prompt = RAGSimpleService(self.medicao).montar_prompt(pergunta)
+            if sql is None:
+                return f"SQL não gerado ({str(e)})\n\n{contexto}", prompt
+            motivo = 'recusado' if isinstance(e, SQLInvalido) else 'falhou'
+            return f"SQL gerado ({motivo}: {str(e)}):\n{sql}\n\n{contexto}", prompt
+        
+        with self.medicao.etapa('prompt'):
+            contexto = f"SQL executado:\n{resultado['sql']}\n\nResultado:\n{formatar_resultado(resultado)}"
+            prompt = f"""Você é um assistente especializado em análise de dados financeiros e administrativos de um sistema agrícola.
+
+A pergunta do usuário foi respondida com a consulta abaixo no banco de dados do sistema.
+
+{contexto}
+
+Pergunta do usuário: {pergunta}
+
+Responda em português, de forma clara e direta, usando apenas o resultado acima. Valores monetários em reais (R$). Se o resultado estiver vazio, diga que não há registros que atendam à pergunta.
+
+Resposta:"""
+        return contexto, prompt
+    
+    def processar_consulta(self, pergunta: str) -> Dict[str, Any]:
+        """
+        Processa uma consulta gerando e executando SQL
+        """
+        inicio = time.time()
+        
+        try:
+            # 1. Gerar e executar o SELECT e criar o prompt com o resultado
+            contexto, prompt = self.montar_prompt(pergunta)
+            
+            # 2. Redigir a resposta
+            with self.medicao.etapa('llm'):
+                resposta = self.gemini_service.generate_response(prompt)
+            self.medicao.contar_tokens(prompt, resposta)
+            
+            return {
+                'success': True,
+                'resposta': resposta,
+                'contexto': contexto,
+                'tokens_prompt': estimar_tokens(prompt),
+                'tempo_resposta': time.time() - inicio,
+                'tipo_rag': self.TIPO_RAG
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'tempo_resposta': time.time() - inicio,
+                'tipo_rag': self.TIPO_RAG
+            }
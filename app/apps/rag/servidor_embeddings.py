@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Servidor local de embeddings compartilhado pelos workers web
+
+Um único processo (manage.py rag_embedding_server) carrega o modelo e atende
+os workers por um socket Unix. Pedidos concorrentes são agrupados em
+micro-lotes antes de chamar encode, de modo que N workers pagam a memória
+do modelo uma única vez.
+
+Protocolo (por mensagem): 4 bytes big-endian com o tamanho + corpo.
+- Pedido: JSON {"textos": [...]}
+- Resposta: JSON {"ok": true, "n": N, "dim": D} seguido de uma mensagem
+  com N*D float32, ou JSON {"ok": false, "erro": "..."}
+"""
+
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+
+
+def _enviar(conexao: socket.socket, corpo: bytes):
+    conexao.sendall(struct.pack('>I', len(corpo)) + corpo)
+
+
+def _receber_exato(conexao: socket.socket, tamanho: int) -> bytes:
+    partes = []
+    while tamanho:
+        parte = conexao.recv(min(tamanho, 1 << 20))
+        if not parte:
+            raise ConnectionError('Conexão encerrada pelo outro lado')
+        partes.append(parte)
+        tamanho -= len(parte)
+    return b''.join(partes)
+
+
+def _receber(conexao: socket.socket) -> bytes:
+    (tamanho,) = struct.unpack('>I', _receber_exato(conexao, 4))
+    return _receber_exato(conexao, tamanho)
+
+
+class _Pedido:
+    def __init__(self, textos: List[str]):
+        self.textos = textos
+        self.vetores = None
+        self.erro = None
+        self.pronto = threading.Event()
+
+
+class AgrupadorMicroLotes:
+    """
+    Junta pedidos concorrentes em um único encode
+    """
+
+    def __init__(self, modelo, tamanho_lote: int = 256, espera_max: float = 0.005):
+        self.modelo = modelo
+        self.tamanho_lote = tamanho_lote
+        self.espera_max = espera_max
+        self._fila: 'queue.Queue[_Pedido]' = queue.Queue()
+        self.lotes = 0
+        self.textos = 0
+        threading.Thread(target=self._executar, name='rag-microlotes', daemon=True).start()
+
+    def codificar(self, textos: List[str]) -> np.ndarray:
+        pedido = _Pedido(textos)
+        self._fila.put(pedido)
+        pedido.pronto.wait()
+        if pedido.erro:
+            raise pedido.erro
+        return pedido.vetores
+
+    def _executar(self):
+        while True:
+            pedidos = [self._fila.get()]
+            total = len(pedidos[0].textos)
+            limite = time.monotonic() + self.espera_max
+            while total < self.tamanho_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    pedido = self._fila.get(timeout=restante)
+                except queue.Empty:
+                    break
+                pedidos.append(pedido)
+                total += len(pedido.textos)
+            self._processar(pedidos)
+
+    def _processar(self, pedidos: List[_Pedido]):
+        textos = [texto for pedido in pedidos for texto in pedido.textos]
+        try:
+            vetores = np.asarray(
+                self.modelo.encode(textos, batch_size=self.tamanho_lote, convert_to_numpy=True),
+                dtype=np.float32,
+            )
+            self.lotes += 1
+            self.textos += len(textos)
+            inicio = 0
+            for pedido in pedidos:
+                pedido.vetores = vetores[inicio:inicio + len(pedido.textos)]
+                inicio += len(pedido.textos)
+        except Exception as e:
+            for pedido in pedidos:
+                pedido.erro = e
+        finally:
+            for pedido in pedidos:
+                pedido.pronto.set()
+
+
+class _TratadorConexao(socketserver.BaseRequestHandler):
+    def handle(self):
+        agrupador = self.server.agrupador
+        while True:
+            try:
+                pedido = json.loads(_receber(self.request))
+            except (ConnectionError, struct.error):
+                return
+            try:
+                vetores = agrupador.codificar(list(pedido['textos']))
+                cabecalho = {'ok': True, 'n': int(vetores.shape[0]), 'dim': int(vetores.shape[1])}
+                _enviar(self.request, json.dumps(cabecalho).encode('utf-8'))
+                _enviar(self.request, np.ascontiguousarray(vetores, dtype=np.float32).tobytes())
+            except Exception as e:
+                _enviar(self.request, json.dumps({'ok': False, 'erro': str(e)}).encode('utf-8'))
+
+
+class ServidorEmbeddings(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Servidor de embeddings em socket Unix
+    """
+
+    daemon_threads = True
+
+    def __init__(self, caminho_socket: str, modelo, tamanho_lote: int = 256, espera_max: float = 0.005):
+        if os.path.exists(caminho_socket):
+            os.unlink(caminho_socket)
+        self.caminho_socket = caminho_socket
+        self.agrupador = AgrupadorMicroLotes(modelo, tamanho_lote=tamanho_lote, espera_max=espera_max)
+        super().__init__(caminho_socket, _TratadorConexao)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.caminho_socket):
+            os.unlink(self.caminho_socket)
+
+
+class ClienteEmbeddings:
+    """
+    Cliente do servidor de embeddings, com a mesma interface de encode do SentenceTransformer.
+    Cada thread mantém sua própria conexão.
+    """
+
+    def __init__(self, caminho_socket: str, timeout: float = 30.0):
+        self.caminho_socket = caminho_socket
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _conexao(self) -> socket.socket:
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None:
+            conexao = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conexao.settimeout(self.timeout)
+            conexao.connect(self.caminho_socket)
+            self._local.conexao = conexao
+        return conexao
+
+    def _fechar(self):
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is not None:
+            conexao.close()
+            self._local.conexao = None
+
+    def encode(self, textos, batch_size: int = 64, convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        unico = isinstance(textos, str)
+        if unico:
+            textos = [textos]
+        corpo = json.dumps({'textos': list(textos)}).encode('utf-8')
+
+        # Uma nova tentativa caso a conexão guardada tenha caído (ex.: servidor reiniciado)
+        for tentativa in range(2):
+            try:
+                conexao = self._conexao()
+                _enviar(conexao, corpo)
+                cabecalho = json.loads(_receber(conexao))
+                if not cabecalho.get('ok'):
+                    raise RuntimeError(f"Erro no servidor de embeddings: {cabecalho.get('erro')}")
+                dados = _receber(conexao)
+                break
+            except (ConnectionError, OSError):
+                self._fechar()
+                if tentativa:
+                    raise
+
+        vetores = np.frombuffer(dados, dtype=np.float32).reshape(cabecalho['n'], cabecalho['dim'])
+        return vetores[0] if unico else vetores
+
+
+_clientes: Dict[str, ClienteEmbeddings] = {}
+_lock_clientes = threading.Lock()
+
+
+def get_cliente(caminho_socket: str) -> ClienteEmbeddings:
+    """Retorna o cliente do servidor de embeddings (um por processo)"""
+    with _lock_clientes:
+        if caminho_socket not in _clientes:
+            _clientes[caminho_socket] = ClienteEmbeddings(caminho_socket)
+        return _clientes[caminho_socket]
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Signals do app RAG - mantém os índices (embeddings e palavras-chave) e as versões dos dados atualizados
+"""
+
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from .documentos import TABELAS_RAG
+from .palavras_chave import fila_palavras
+from .reindexacao import fila_reindexacao
+from .versoes import incrementar_versao
+
+
+def _agendar(tabela: str, pk: int):
+    transaction.on_commit(lambda: fila_reindexacao.enfileirar(tabela, [pk]))
+
+
+def registro_salvo(tabela: str, sender, instance, raw=False, **kwargs):
+    """Criação, atualização ou inativação (inativar() também chama save())"""
+    if raw:
+        return
+    _agendar(tabela, instance.pk)
+
+
+def registro_excluido(tabela: str, sender, instance, **kwargs):
+    _agendar(tabela, instance.pk)
+
+
+def dados_alterados(tabela: str, sender, **kwargs):
+    """
+    Incrementa a versão da tabela depois que a transação da alteração é
+    confirmada (se ela for desfeita, a versão não muda). Fora da transação,
+    o UPDATE na linha compartilhada de VersaoDadosRAG não segura os outros
+    escritores até o commit ("database is locked" no SQLite)
+    """
+    transaction.on_commit(partial(incrementar_versao, tabela), robust=True)
+
+
+def palavras_alteradas(tabela: str, sender, instance, raw=False, **kwargs):
+    """
+    Agenda a reindexação das palavras-chave do registro para depois do commit: as
+    estatísticas do BM25 são linhas compartilhadas, que ficariam travadas até o commit
+    """
+    if raw:
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: fila_palavras.enfileirar(tabela, [pk]))
+
+
+def conectar_signals():
+    """
+    Conecta os signals de versão dos dados, de palavras-chave e de reindexação
+    às tabelas RAG. Operações em massa (QuerySet.update, bulk_create) não
+    disparam signals; nesses casos execute 'python manage.py rag_build_index'
+    e 'python manage.py rag_build_palavras'.
+    """
+    for definicao in TABELAS_RAG:
+        uid = f'rag_versao_{definicao.nome}'
+        post_save.connect(partial(dados_alterados, definicao.nome), sender=definicao.model,
+                          weak=False, dispatch_uid=uid)
+        post_delete.connect(partial(dados_alterados, definicao.nome), sender=definicao.model,
+                            weak=False, dispatch_uid=uid)
+
+        uid = f'rag_palavras_{definicao.nome}'
+        post_save.connect(partial(palavras_alteradas, definicao.nome), sender=definicao.model,
+                          weak=False, dispatch_uid=uid)
+        post_delete.connect(partial(palavras_alteradas, definicao.nome), sender=definicao.model,
+                            weak=False, dispatch_uid=uid)
+
+    if not getattr(settings, 'RAG_REINDEXACAO_AUTOMATICA', True):
+        return
+
+    for definicao in TABELAS_RAG:
+        uid = f'rag_reindexacao_{definicao.nome}'
+        post_save.connect(partial(registro_salvo, definicao.nome), sender=definicao.model,
+                          weak=False, dispatch_uid=uid)
+        post_delete.connect(partial(registro_excluido, definicao.nome), sender=definicao.model,
+                            weak=False, dispatch_uid=uid)
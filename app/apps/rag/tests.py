@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Testes do app RAG
+"""
+
+import os
+import subprocess
+import sys
+import textwrap
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from . import services
+
+
+class FilaReindexacaoTest(SimpleTestCase):
+    """Reindexação pendente ao encerrar o processo"""
+
+    def test_esvaziar_no_atexit_em_processo_novo(self):
+        # Processo que enfileira e encerra sem ter importado os serviços do RAG
+        script = textwrap.dedent("""
+            import atexit
+            import django
+            django.setup()
+            from apps.rag.reindexacao import FilaReindexacao
+
+            fila = FilaReindexacao(atraso=60)
+            processados = []
+
+            def processar(pendentes):
+                service = fila._get_service()
+                processados.append((type(service).__name__, sorted(pendentes['clientes'])))
+
+            fila._processar = processar
+            atexit.register(lambda: print(processados))
+            atexit.register(fila.esvaziar)
+            fila.enfileirar('clientes', [1, 2])
+        """)
+        resultado = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, env=os.environ.copy(),
+            capture_output=True, text=True, timeout=120,
+        )
+        self.assertNotIn("can't register atexit", resultado.stderr)
+        self.assertIn("[('RAGEmbeddingsService', [1, 2])]", resultado.stdout)
+
+
+def _busca_lenta(self, query, encontrados=None):
+    """Busca de clientes que leva segundos no banco (contagem recursiva)"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 10000000) "
+            "SELECT count(*) FROM c"
+        )
+        cursor.fetchall()
+    return []
+
+
+@override_settings(RAG_BUSCA_TIMEOUT=0.2)
+class BuscaTabelasTimeoutTest(SimpleTestCase):
+    """Buscas que passam do RAG_BUSCA_TIMEOUT não ocupam o pool de threads"""
+
+    databases = {'default'}
+
+    def test_busca_lenta_nao_bloqueia_proxima_requisicao(self):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest('limite de tempo no banco só no SQLite e no PostgreSQL')
+        service = services.RAGSimpleService()
+        with mock.patch.object(services.RAGSimpleService, '_buscar_clientes', _busca_lenta):
+            # Mais buscas lentas que threads no pool
+            for _ in range(services._executor_buscas._max_workers + 2):
+                inicio = time.monotonic()
+                self.assertEqual(service._buscar_tabelas('clientes', {}, ['clientes']), [])
+                self.assertLess(time.monotonic() - inicio, 2)
+
+        # A próxima requisição encontra threads livres
+        self.assertEqual(services._executor_buscas.submit(lambda: 'livre').result(timeout=2), 'livre')
+
+
+class MetricasEtapasViewTest(TestCase):
+    """Parâmetro horas de /rag/metricas/etapas/"""
+
+    def test_horas_invalidas(self):
+        for horas in ['abc', 'inf', '-inf', 'nan', '1e10', '0', '-5', '2161']:
+            with self.subTest(horas=horas):
+                resposta = self.client.get(reverse('rag:metricas_etapas'), {'horas': horas})
+                self.assertEqual(resposta.status_code, 400)
+                self.assertFalse(resposta.json()['success'])
+
+    def test_horas_validas(self):
+        for horas in ['0.5', '24', '2160']:
+            with self.subTest(horas=horas):
+                resposta = self.client.get(reverse('rag:metricas_etapas'), {'horas': horas})
+                self.assertEqual(resposta.status_code, 200)
+                self.assertEqual(resposta.json()['consultas'], 0)
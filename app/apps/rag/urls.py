@@ -11,6 +11,9 @@ app_name = 'rag'
 urlpatterns = [
     path('', views.RAGView.as_view(), name='index'),
     path('consultar/', views.ConsultarRAGView.as_view(), name='consultar'),
+    path('consultar/stream/', views.ConsultarRAGStreamView.as_view(), name='consultar_stream'),
     path('historico/', views.HistoricoRAGView.as_view(), name='historico'),
+    path('metricas/', views.MetricasRAGView.as_view(), name='metricas'),
+    path('metricas/etapas/', views.MetricasEtapasRAGView.as_view(), name='metricas_etapas'),
 ]
 
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Versões dos dados das tabelas RAG
+
+Cada gravação ou exclusão em uma das tabelas lidas pelo RAG incrementa o
+contador da tabela depois do commit (ver signals.py). Respostas em cache guardam o vetor de
+versões do momento em que foram geradas: qualquer alteração nos dados muda
+o vetor e, portanto, a chave do cache.
+"""
+
+import hashlib
+import json
+from typing import Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .documentos import TABELAS_RAG
+from .models import VersaoDadosRAG
+
+
+def incrementar_versao(tabela: str):
+    """Incrementa a versão da tabela (os signals chamam depois do commit da alteração)"""
+    atualizados = VersaoDadosRAG.objects.filter(tabela=tabela).update(
+        versao=F('versao') + 1, atualizado_em=timezone.now()
+    )
+    if atualizados:
+        return
+    try:
+        with transaction.atomic():
+            VersaoDadosRAG.objects.create(tabela=tabela, versao=1)
+    except IntegrityError:
+        # Criada por outro processo ao mesmo tempo
+        VersaoDadosRAG.objects.filter(tabela=tabela).update(
+            versao=F('versao') + 1, atualizado_em=timezone.now()
+        )
+
+
+def vetor_versoes() -> Tuple[Tuple[str, int], ...]:
+    """Versão atual de cada tabela RAG, em ordem fixa"""
+    versoes = dict(VersaoDadosRAG.objects.values_list('tabela', 'versao'))
+    return tuple((definicao.nome, versoes.get(definicao.nome, 0)) for definicao in TABELAS_RAG)
+
+
+def hash_versoes(versoes: Optional[Tuple[Tuple[str, int], ...]] = None) -> str:
+    """Identificador curto do vetor de versões (padrão: o atual)"""
+    if versoes is None:
+        versoes = vetor_versoes()
+    return hashlib.sha256(json.dumps(versoes).encode('utf-8')).hexdigest()[:32]
@@ -4,15 +4,96 @@ Views do app RAG
 """
 
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
 from django.views import View
+from django.utils import timezone
 import json
+import math
+import time
+from datetime import timedelta
+from typing import Optional
 
-from .services import RAGSimpleService, RAGEmbeddingsService
+from apps.core.cliente_http import cliente_http
+
+from .services import RAGSimpleService, RAGEmbeddingsService, RAGHibridoService, RAGSQLService
 from .models import ConsultaRAG
+from .cache import cache_embeddings_perguntas, cache_respostas
+from .agregados import motor_agregados
+from .cache_semantico import cache_semantico
+from .coalescencia import coalescencia
+from .contexto import estimar_tokens
+from .medicao import MedicaoEtapas, resumo_etapas
+from .modelo_embeddings import estatisticas_modelos
+from .estatisticas import estatisticas_rag
+from .versoes import hash_versoes
+
+
+def _criar_servico(tipo_rag: str):
+    """Serviço RAG do tipo escolhido na interface"""
+    if tipo_rag == 'EMBEDDINGS':
+        return RAGEmbeddingsService()
+    elif tipo_rag == 'HIBRIDO':
+        return RAGHibridoService()
+    elif tipo_rag == 'SQL':
+        return RAGSQLService()
+    return RAGSimpleService()
+
+
+def _resposta_pronta(pergunta: str, tipo_rag: str, versao_dados: str, chave_cache, inicio: float):
+    """
+    Resposta que não precisa do LLM: pergunta de agregação ("total a pagar em março"),
+    respondida com o valor exato do banco, ou a mesma pergunta (ou uma parecida),
+    sobre os mesmos dados, já respondida. None se for preciso processar a consulta
+    """
+    resultado = motor_agregados.responder(pergunta)
+    if resultado is not None:
+        resultado['tipo_rag'] = tipo_rag
+        return resultado
+    
+    if chave_cache:
+        resultado = cache_respostas.obter(chave_cache)
+        if resultado is not None:
+            return {**resultado, 'cache': 'exato', 'tempo_resposta': time.time() - inicio}
+    
+    resultado = cache_semantico.buscar(pergunta, tipo_rag, versao_dados)
+    if resultado is not None:
+        resultado['tempo_resposta'] = time.time() - inicio
+        if chave_cache:
+            cache_respostas.guardar(chave_cache, resultado)
+    return resultado
+
+
+def _salvar_consulta(pergunta: str, tipo_rag: str, resultado: dict, versao_dados: str,
+                     medicao: Optional[MedicaoEtapas] = None) -> ConsultaRAG:
+    """
+    Grava a consulta no histórico, com os tempos das etapas se ela passou pelo
+    serviço RAG (medicao), e, se a resposta veio do LLM, no cache semântico
+    """
+    inicio = time.perf_counter()
+    consulta = ConsultaRAG.objects.create(
+        pergunta=pergunta,
+        tipo_rag=tipo_rag,
+        contexto_retornado=resultado.get('contexto', '')[:5000],  # Limitar tamanho
+        resposta_llm=resultado.get('resposta', ''),
+        tempo_resposta=resultado.get('tempo_resposta', 0),
+        versao_dados=versao_dados,
+        **(medicao.campos() if medicao else {})
+    )
+    if not resultado.get('cache') and not resultado.get('agregado'):
+        cache_semantico.adicionar(consulta)
+    
+    # O tempo de gravação só é conhecido depois de gravar
+    consulta.tempo_gravacao = time.perf_counter() - inicio
+    ConsultaRAG.objects.filter(pk=consulta.pk).update(tempo_gravacao=consulta.tempo_gravacao)
+    return consulta
+
+
+def _evento(nome: str, dados: dict) -> str:
+    """Evento no formato Server-Sent Events"""
+    return f"event: {nome}\ndata: {json.dumps(dados)}\n\n"
 
 
 class RAGView(View):
@@ -44,23 +125,34 @@ class ConsultarRAGView(View):
                     'error': 'Pergunta não fornecida'
                 }, status=400)
             
-            # Processar consulta
-            if tipo_rag == 'EMBEDDINGS':
-                service = RAGEmbeddingsService()
-            else:
-                service = RAGSimpleService()
+            # Agregação ou pergunta já respondida: não chama o LLM
+            inicio = time.time()
+            versao_dados = hash_versoes()
+            chave = cache_respostas.chave(pergunta, tipo_rag, versao_dados)
+            chave_cache = chave if cache_respostas.ativo else None
+            resultado = _resposta_pronta(pergunta, tipo_rag, versao_dados, chave_cache, inicio)
             
-            resultado = service.processar_consulta(pergunta)
+            # A mesma pergunta já está sendo respondida em outra requisição: usa a resposta dela
+            medicao = None
+            if resultado is None:
+                em_andamento, resultado = coalescencia.entrar(chave)
+                if resultado is not None:
+                    resultado = {**resultado, 'cache': 'coalescida', 'tempo_resposta': time.time() - inicio}
+                else:
+                    try:
+                        # Processar consulta
+                        service = _criar_servico(tipo_rag)
+                        medicao = service.medicao
+                        resultado = service.processar_consulta(pergunta)
+                        
+                        if chave_cache and resultado.get('success'):
+                            cache_respostas.guardar(chave_cache, resultado)
+                    finally:
+                        coalescencia.concluir(em_andamento, resultado)
             
             # Salvar consulta no banco de dados
             if resultado.get('success'):
-                ConsultaRAG.objects.create(
-                    pergunta=pergunta,
-                    tipo_rag=tipo_rag,
-                    contexto_retornado=resultado.get('contexto', '')[:5000],  # Limitar tamanho
-                    resposta_llm=resultado.get('resposta', ''),
-                    tempo_resposta=resultado.get('tempo_resposta', 0)
-                )
+                _salvar_consulta(pergunta, tipo_rag, resultado, versao_dados, medicao)
             
             return JsonResponse(resultado)
             
@@ -76,6 +168,109 @@ class ConsultarRAGView(View):
             }, status=500)
 
 
+@method_decorator(csrf_exempt, name='dispatch')
+class ConsultarRAGStreamView(View):
+    """
+    View para processar consultas RAG com a resposta em streaming (Server-Sent Events)
+    
+    Eventos: "contexto" assim que a busca termina, "texto" a cada trecho gerado
+    pelo LLM, "fim" depois de gravar a consulta e "erro" se algo falhar
+    """
+    
+    def post(self, request):
+        """Processa uma consulta RAG, enviando a resposta à medida que é gerada"""
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse({
+                'success': False,
+                'error': 'JSON inválido'
+            }, status=400)
+        
+        pergunta = data.get('pergunta', '').strip()
+        tipo_rag = data.get('tipo_rag', 'SIMPLES')
+        if not pergunta:
+            return JsonResponse({
+                'success': False,
+                'error': 'Pergunta não fornecida'
+            }, status=400)
+        
+        response = StreamingHttpResponse(self._eventos(pergunta, tipo_rag), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # nginx: repassar cada evento sem bufferizar
+        return response
+    
+    def _eventos(self, pergunta: str, tipo_rag: str):
+        """Gera os eventos da consulta; a consulta é gravada quando a resposta termina"""
+        inicio = time.time()
+        try:
+            versao_dados = hash_versoes()
+            chave = cache_respostas.chave(pergunta, tipo_rag, versao_dados)
+            chave_cache = chave if cache_respostas.ativo else None
+            resultado = _resposta_pronta(pergunta, tipo_rag, versao_dados, chave_cache, inicio)
+            
+            # A mesma pergunta já está sendo respondida: espera a resposta completa dela
+            em_andamento = None
+            medicao = None
+            if resultado is None:
+                em_andamento, resultado = coalescencia.entrar(chave)
+                if resultado is not None:
+                    resultado = {**resultado, 'cache': 'coalescida', 'tempo_resposta': time.time() - inicio}
+            
+            if resultado is not None:
+                yield _evento('contexto', {'contexto': resultado.get('contexto', ''), 'tipo_rag': tipo_rag})
+                yield _evento('texto', {'texto': resultado.get('resposta', '')})
+            else:
+                try:
+                    # Busca completa antes do primeiro byte; depois, cada trecho do LLM segue direto ao navegador
+                    service = _criar_servico(tipo_rag)
+                    medicao = service.medicao
+                    contexto, prompt = service.montar_prompt(pergunta)
+                    yield _evento('contexto', {
+                        'contexto': contexto,
+                        'tipo_rag': tipo_rag,
+                        'tokens_prompt': estimar_tokens(prompt),
+                        'tempo_busca': time.time() - inicio,
+                    })
+                    
+                    trechos = []
+                    inicio_llm = time.perf_counter()
+                    for trecho in service.gemini_service.generate_response_stream(prompt):
+                        if not trechos:
+                            medicao.adicionar('primeiro_token', time.perf_counter() - inicio_llm)
+                        trechos.append(trecho)
+                        yield _evento('texto', {'texto': trecho})
+                    medicao.adicionar('llm', time.perf_counter() - inicio_llm)
+                    resposta = ''.join(trechos)
+                    medicao.contar_tokens(prompt, resposta)
+                    
+                    resultado = {
+                        'success': True,
+                        'resposta': resposta,
+                        'contexto': contexto,
+                        'tokens_prompt': estimar_tokens(prompt),
+                        'tempo_resposta': time.time() - inicio,
+                        'tipo_rag': tipo_rag
+                    }
+                    if chave_cache:
+                        cache_respostas.guardar(chave_cache, resultado)
+                finally:
+                    # Também se o navegador desconectar: quem espera faz a consulta por conta própria
+                    coalescencia.concluir(em_andamento, resultado)
+            
+            consulta = _salvar_consulta(pergunta, tipo_rag, resultado, versao_dados, medicao)
+            yield _evento('fim', {
+                'success': True,
+                'id': consulta.id,
+                'tempo_resposta': resultado.get('tempo_resposta', 0),
+                'cache': resultado.get('cache'),
+            })
+            
+        except Exception as e:
+            print(f"Erro na consulta RAG em streaming: {str(e)}")
+            yield _evento('erro', {'success': False, 'error': str(e)})
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class HistoricoRAGView(View):
     """
@@ -110,3 +305,63 @@ class HistoricoRAGView(View):
                 'error': str(e)
             }, status=500)
 
+
+class MetricasRAGView(View):
+    """
+    View com os contadores do RAG para monitoramento
+    """
+    
+    def get(self, request):
+        """Retorna as métricas dos caches do processo"""
+        return JsonResponse({
+            'success': True,
+            'caches': {
+                'embeddings_perguntas': cache_embeddings_perguntas.estatisticas(),
+                'respostas': cache_respostas.estatisticas(),
+                'respostas_semantico': cache_semantico.estatisticas(),
+                'estatisticas': estatisticas_rag.cache.estatisticas(),
+            },
+            'agregados': motor_agregados.estatisticas(),
+            'coalescencia': coalescencia.estatisticas(),
+            'http': cliente_http.estatisticas(),
+            'modelos_embeddings': estatisticas_modelos(),
+        })
+
+
+class MetricasEtapasRAGView(View):
+    """
+    View com p50/p95 do tempo de cada etapa das consultas RAG gravadas
+    """
+    
+    HORAS_MAXIMAS = 24 * 90
+    
+    def get(self, request):
+        """
+        Percentis das consultas das últimas `horas` (padrão 24, até 90 dias),
+        opcionalmente de um `tipo_rag`
+        """
+        try:
+            horas = float(request.GET.get('horas', 24))
+        except ValueError:
+            return JsonResponse({
+                'success': False,
+                'error': 'horas deve ser um número'
+            }, status=400)
+        if not math.isfinite(horas) or not 0 < horas <= self.HORAS_MAXIMAS:
+            return JsonResponse({
+                'success': False,
+                'error': f'horas deve ser maior que 0 e no máximo {self.HORAS_MAXIMAS}'
+            }, status=400)
+        
+        desde = timezone.now() - timedelta(hours=horas)
+        consultas = ConsultaRAG.objects.filter(criado_em__gte=desde)
+        tipo_rag = request.GET.get('tipo_rag')
+        if tipo_rag:
+            consultas = consultas.filter(tipo_rag=tipo_rag)
+        
+        return JsonResponse({
+            'success': True,
+            'desde': desde.isoformat(),
+            'tipo_rag': tipo_rag,
+            **resumo_etapas(consultas),
+        })
@@ -221,6 +221,54 @@ LOGGING = {
 # Google Gemini API
 GEMINI_API_KEY = config('GEMINI_API_KEY', default='')
 
+# Cliente HTTP compartilhado das APIs externas (apps.core.cliente_http)
+HTTP_CONEXOES_POR_HOST = config('HTTP_CONEXOES_POR_HOST', default=10, cast=int)  # conexões keep-alive guardadas por host, por processo (>= threads do processo)
+HTTP_TENTATIVAS = config('HTTP_TENTATIVAS', default=3, cast=int)  # tentativas em 429/5xx e falhas de conexão
+HTTP_BACKOFF = config('HTTP_BACKOFF', default=0.5, cast=float)  # segundos; espera até backoff * 2^tentativa (com jitter)
+HTTP_BACKOFF_MAXIMO = config('HTTP_BACKOFF_MAXIMO', default=8.0, cast=float)  # segundos
+HTTP_TIMEOUT_CONEXAO = config('HTTP_TIMEOUT_CONEXAO', default=5.0, cast=float)  # segundos para abrir a conexão
+HTTP_TIMEOUT_LEITURA = config('HTTP_TIMEOUT_LEITURA', default=60.0, cast=float)  # segundos de espera pela resposta (padrão)
+
+# RAG - Busca Inteligente
+RAG_INDICE_DIR = BASE_DIR / 'rag_indice'  # arquivos gerados pelo rag_build_index
+RAG_INDICE_QUANTIZACAO = config('RAG_INDICE_QUANTIZACAO', default='int8')  # float32, float16 ou int8
+RAG_IVF_MINIMO = config('RAG_IVF_MINIMO', default=50000, cast=int)  # vetores para usar busca aproximada (IVF)
+RAG_IVF_NPROBE = config('RAG_IVF_NPROBE', default=8, cast=int)  # listas IVF pontuadas por consulta
+RAG_INDICE_SINCRONIZACAO = config('RAG_INDICE_SINCRONIZACAO', default=1.0, cast=float)  # segundos entre leituras das alterações do índice
+RAG_INDICE_ESPERA_TRANSACAO = config('RAG_INDICE_ESPERA_TRANSACAO', default=300, cast=int)  # segundos acompanhando alterações de transações abertas
+RAG_INDICE_RETENCAO_DIAS = config('RAG_INDICE_RETENCAO_DIAS', default=7, cast=float)  # alterações guardadas; worker que não as leu antes da poda recarrega tudo
+RAG_CACHE_EMBEDDINGS_TAMANHO = config('RAG_CACHE_EMBEDDINGS_TAMANHO', default=1024, cast=int)  # perguntas em cache por processo
+RAG_CACHE_EMBEDDINGS_TTL = config('RAG_CACHE_EMBEDDINGS_TTL', default=3600, cast=int)  # segundos
+RAG_CACHE_RESPOSTAS_TTL = config('RAG_CACHE_RESPOSTAS_TTL', default=86400, cast=int)  # 0 desativa o cache de respostas
+RAG_CACHE_RESPOSTAS_ALIAS = config('RAG_CACHE_RESPOSTAS_ALIAS', default='default')  # alias em CACHES
+RAG_CACHE_SEMANTICO_LIMIAR = config('RAG_CACHE_SEMANTICO_LIMIAR', default=0.92, cast=float)  # similaridade mínima; 0 desativa
+RAG_CACHE_SEMANTICO_TAMANHO = config('RAG_CACHE_SEMANTICO_TAMANHO', default=1000, cast=int)  # perguntas por tipo de RAG
+RAG_CACHE_SEMANTICO_TIPOS = config('RAG_CACHE_SEMANTICO_TIPOS', default='EMBEDDINGS,HIBRIDO', cast=lambda v: [s.strip() for s in v.split(',') if s.strip()])  # tipos de RAG com cache semântico
+RAG_COALESCENCIA_ATIVA = config('RAG_COALESCENCIA_ATIVA', default=True, cast=bool)  # perguntas iguais simultâneas respondidas uma vez
+RAG_COALESCENCIA_ESPERA = config('RAG_COALESCENCIA_ESPERA', default=90.0, cast=float)  # segundos esperando a outra requisição
+RAG_COALESCENCIA_DISTRIBUIDA = config('RAG_COALESCENCIA_DISTRIBUIDA', default=False, cast=bool)  # também entre processos (CACHES compartilhado)
+RAG_CACHE_ESTATISTICAS_TTL = config('RAG_CACHE_ESTATISTICAS_TTL', default=300, cast=int)  # segundos; 0 = só pela versão dos dados
+RAG_PALAVRAS_MAX_OCORRENCIAS = config('RAG_PALAVRAS_MAX_OCORRENCIAS', default=500, cast=int)  # ocorrências lidas por termo frequente
+RAG_PALAVRAS_CONSTRUCAO_AUTOMATICA = config('RAG_PALAVRAS_CONSTRUCAO_AUTOMATICA', default=True, cast=bool)  # constrói tabelas não indexadas em segundo plano
+RAG_ROTEADOR_ATIVO = config('RAG_ROTEADOR_ATIVO', default=True, cast=bool)  # buscar só nas tabelas que a pergunta envolve
+RAG_AGREGADOS_ATIVO = config('RAG_AGREGADOS_ATIVO', default=True, cast=bool)  # responder perguntas de agregação direto no banco
+RAG_HIBRIDO_CANDIDATOS = config('RAG_HIBRIDO_CANDIDATOS', default=20, cast=int)  # registros de cada busca combinados no RAG Híbrido
+RAG_HIBRIDO_RRF_K = config('RAG_HIBRIDO_RRF_K', default=60, cast=int)  # constante k do reciprocal rank fusion
+RAG_BUSCA_THREADS = config('RAG_BUSCA_THREADS', default=8, cast=int)  # threads das buscas paralelas, por processo
+RAG_BUSCA_TIMEOUT = config('RAG_BUSCA_TIMEOUT', default=5.0, cast=float)  # segundos por tabela; 0 = sem limite
+RAG_SQL_LIMITE_LINHAS = config('RAG_SQL_LIMITE_LINHAS', default=50, cast=int)  # linhas do resultado enviadas ao LLM no RAG SQL
+RAG_SQL_TIMEOUT = config('RAG_SQL_TIMEOUT', default=2.0, cast=float)  # segundos por consulta gerada
+RAG_CONTEXTO_MAX_TOKENS = config('RAG_CONTEXTO_MAX_TOKENS', default=3000, cast=int)  # tokens (estimados) do contexto enviado ao LLM
+# Backend de embeddings: sentence_transformers, servidor, hashing (sem download) ou caminho de uma classe
+RAG_EMBEDDINGS_BACKEND = config('RAG_EMBEDDINGS_BACKEND', default='')
+RAG_EMBEDDINGS_HASHING_DIMENSAO = config('RAG_EMBEDDINGS_HASHING_DIMENSAO', default=256, cast=int)
+RAG_EMBEDDINGS_HASHING_IDF = config('RAG_EMBEDDINGS_HASHING_IDF', default=str(RAG_INDICE_DIR / 'hashing_idf.npy'))
+RAG_EMBEDDINGS_AQUECER = config('RAG_EMBEDDINGS_AQUECER', default=False, cast=bool)  # carregar o modelo ao iniciar
+RAG_EMBEDDINGS_SOCKET = config('RAG_EMBEDDINGS_SOCKET', default='')  # socket do manage.py rag_embedding_server
+RAG_REINDEXACAO_AUTOMATICA = config('RAG_REINDEXACAO_AUTOMATICA', default=True, cast=bool)
+RAG_REINDEXACAO_ATRASO = config('RAG_REINDEXACAO_ATRASO', default=2.0, cast=float)  # segundos
+RAG_REINDEXACAO_LOTE = config('RAG_REINDEXACAO_LOTE', default=1000, cast=int)
+
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB